@@ -16,6 +16,7 @@ from pathlib import Path
 import dj_database_url
 import environ
 from dbt_copilot_python.database import database_url_from_env
+from django.core.exceptions import ImproperlyConfigured
 from django_log_formatter_asim import ASIMFormatter
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -42,6 +43,7 @@ DJANGO_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
 ]
 
 THIRD_PARTY_APPS = [
@@ -157,7 +159,12 @@ REST_FRAMEWORK = {
     ],
     "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",  # /PS-IGNORE
     "DEFAULT_RENDERER_CLASSES": [
-        "rest_framework.renderers.JSONRenderer",
+        "help_desk_api.renderers.ORJSONRenderer",
+    ],
+    "DEFAULT_PARSER_CLASSES": [
+        "help_desk_api.parsers.ORJSONParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
     ],
 }
 
@@ -177,32 +184,201 @@ AUTH_USER_MODEL = "user.User"
 
 HALO_SUBDOMAIN = env("HALO_SUBDOMAIN")
 HALO_DEFAULT_TICKET_TYPE_ID = env.int("HALO_DEFAULT_TICKET_TYPE_ID", 43)
+# Halo custom field holding the Zendesk ID of a ticket created while dual-running
+HALO_ZENDESK_TICKET_ID_FIELD = env("HALO_ZENDESK_TICKET_ID_FIELD", default="CFZendeskTicketID")
+# Most records sent to or requested from Halo in one request by the bulk endpoints
+HALO_BULK_BATCH_SIZE = env.int("HALO_BULK_BATCH_SIZE", 50)
 
 USER_DATA_CACHE = "userdata"
 TICKET_DATA_CACHE = "ticketdata"
 UPLOAD_DATA_CACHE = "uploaddata"
+REFERENCE_DATA_CACHE = "referencedata"
+TICKET_RESPONSE_CACHE = "ticketresponses"
+COORDINATION_CACHE = "coordination"
+ATTACHMENT_CACHE = "attachments"
+
+# Most caches are two-tier: a small in-process LRU in front of Redis.
+# The database caches are kept as a fallback for when Redis is unavailable,
+# and so that entries written before Redis was used are still found.
+TWO_TIER_CACHE_BACKEND = "help_desk_api.cache.TwoTierCache"
+CACHE_LOCAL_MAX_ENTRIES = env.int("CACHE_LOCAL_MAX_ENTRIES", 1000)
+CACHE_LOCAL_TIMEOUT = env.int("CACHE_LOCAL_TIMEOUT", 10)  # seconds
+REDIS_CACHE_OPTIONS = {
+    "socket_connect_timeout": env.float("REDIS_CONNECT_TIMEOUT", 0.5),  # seconds
+    "socket_timeout": env.float("REDIS_TIMEOUT", 0.5),  # seconds
+}
 CACHES = {
     "default": {
+        "BACKEND": TWO_TIER_CACHE_BACKEND,
+        "LOCATION": REDIS_URL,
+        "KEY_PREFIX": "default",
+        "OPTIONS": {
+            "LOCAL_MAX_ENTRIES": CACHE_LOCAL_MAX_ENTRIES,
+            # The Halo token lives here and is good for 50 minutes
+            "LOCAL_TIMEOUT": 60,
+            "FALLBACK_CACHE": "default_db",
+            "REDIS_OPTIONS": REDIS_CACHE_OPTIONS,
+        },
+    },
+    "default_db": {
         "BACKEND": "django.core.cache.backends.db.DatabaseCache",
         "LOCATION": "django_cache_table",
     },
     USER_DATA_CACHE: {
+        "BACKEND": TWO_TIER_CACHE_BACKEND,
+        "LOCATION": REDIS_URL,
+        "KEY_PREFIX": USER_DATA_CACHE,
+        "TIMEOUT": 86_400,  # seconds; == 24 hours
+        "OPTIONS": {
+            "LOCAL_MAX_ENTRIES": CACHE_LOCAL_MAX_ENTRIES,
+            "LOCAL_TIMEOUT": CACHE_LOCAL_TIMEOUT,
+            "FALLBACK_CACHE": f"{USER_DATA_CACHE}_db",
+            "REDIS_OPTIONS": REDIS_CACHE_OPTIONS,
+        },
+    },
+    f"{USER_DATA_CACHE}_db": {
         "BACKEND": "django.core.cache.backends.db.DatabaseCache",
         "LOCATION": f"middleware_{USER_DATA_CACHE}_cache_table",
         "TIMEOUT": 86_400,  # seconds; == 24 hours
     },
     TICKET_DATA_CACHE: {
+        "BACKEND": TWO_TIER_CACHE_BACKEND,
+        "LOCATION": REDIS_URL,
+        "KEY_PREFIX": TICKET_DATA_CACHE,
+        "TIMEOUT": 432_000,  # seconds; == 5 days
+        "OPTIONS": {
+            "LOCAL_MAX_ENTRIES": CACHE_LOCAL_MAX_ENTRIES,
+            "LOCAL_TIMEOUT": CACHE_LOCAL_TIMEOUT,
+            "FALLBACK_CACHE": f"{TICKET_DATA_CACHE}_db",
+            "REDIS_OPTIONS": REDIS_CACHE_OPTIONS,
+        },
+    },
+    f"{TICKET_DATA_CACHE}_db": {
         "BACKEND": "django.core.cache.backends.db.DatabaseCache",
         "LOCATION": f"middleware_{TICKET_DATA_CACHE}_cache_table",
         "TIMEOUT": 432_000,  # seconds; == 5 days
     },
     UPLOAD_DATA_CACHE: {
+        "BACKEND": TWO_TIER_CACHE_BACKEND,
+        "LOCATION": REDIS_URL,
+        "KEY_PREFIX": UPLOAD_DATA_CACHE,
+        "TIMEOUT": 432_000,  # seconds; == 5 days
+        "OPTIONS": {
+            "LOCAL_MAX_ENTRIES": CACHE_LOCAL_MAX_ENTRIES,
+            "LOCAL_TIMEOUT": CACHE_LOCAL_TIMEOUT,
+            "FALLBACK_CACHE": f"{UPLOAD_DATA_CACHE}_db",
+            "REDIS_OPTIONS": REDIS_CACHE_OPTIONS,
+        },
+    },
+    f"{UPLOAD_DATA_CACHE}_db": {
         "BACKEND": "django.core.cache.backends.db.DatabaseCache",
         "LOCATION": f"middleware_{UPLOAD_DATA_CACHE}_cache_table",
         "TIMEOUT": 432_000,  # seconds; == 5 days
     },
+    # Custom field mappings; derived from the database so no fallback is needed
+    REFERENCE_DATA_CACHE: {
+        "BACKEND": TWO_TIER_CACHE_BACKEND,
+        "LOCATION": REDIS_URL,
+        "KEY_PREFIX": REFERENCE_DATA_CACHE,
+        "TIMEOUT": 3_600,  # seconds; == 1 hour
+        "OPTIONS": {
+            "LOCAL_MAX_ENTRIES": CACHE_LOCAL_MAX_ENTRIES,
+            "LOCAL_TIMEOUT": 60,
+            "REDIS_OPTIONS": REDIS_CACHE_OPTIONS,
+        },
+    },
+    # Halo tickets as read by the API; see help_desk_api.ticket_cache.
+    # Not held in process, so that invalidating an entry takes effect everywhere at once.
+    TICKET_RESPONSE_CACHE: {
+        "BACKEND": TWO_TIER_CACHE_BACKEND,
+        "LOCATION": REDIS_URL,
+        "KEY_PREFIX": TICKET_RESPONSE_CACHE,
+        "OPTIONS": {
+            "LOCAL_MAX_ENTRIES": 0,
+            "REDIS_OPTIONS": REDIS_CACHE_OPTIONS,
+        },
+    },
+    # AV verdicts and Halo attachment IDs by content hash; see halo.attachment_cache.
+    # Entries expire, and Redis evicts the least recently used if it runs short of memory.
+    ATTACHMENT_CACHE: {
+        "BACKEND": TWO_TIER_CACHE_BACKEND,
+        "LOCATION": REDIS_URL,
+        "KEY_PREFIX": ATTACHMENT_CACHE,
+        "TIMEOUT": env.int("ATTACHMENT_CACHE_TIMEOUT", 604_800),  # seconds; == 7 days
+        "OPTIONS": {
+            "LOCAL_MAX_ENTRIES": CACHE_LOCAL_MAX_ENTRIES,
+            "LOCAL_TIMEOUT": CACHE_LOCAL_TIMEOUT,
+            "REDIS_OPTIONS": REDIS_CACHE_OPTIONS,
+        },
+    },
+    # Counters and locks shared between processes, e.g. metrics; never held in process
+    COORDINATION_CACHE: {
+        "BACKEND": TWO_TIER_CACHE_BACKEND,
+        "LOCATION": REDIS_URL,
+        "KEY_PREFIX": COORDINATION_CACHE,
+        "OPTIONS": {
+            "LOCAL_MAX_ENTRIES": 0,
+            "REDIS_OPTIONS": REDIS_CACHE_OPTIONS,
+        },
+    },
 }
 
+# Seconds each process adds up metric counts before adding them to the coordination cache's
+METRICS_FLUSH_INTERVAL = env.int("METRICS_FLUSH_INTERVAL", 10)
+# Seconds a cached Halo ticket is served without asking Halo again
+TICKET_CACHE_TIMEOUT = env.int("TICKET_CACHE_TIMEOUT", 60)
+# Seconds after that a cached Halo ticket is still served while it's refreshed in the background
+TICKET_CACHE_MAX_STALENESS = env.int("TICKET_CACHE_MAX_STALENESS", 300)
+# Seconds a response is kept for replay to retries with the same Idempotency-Key
+IDEMPOTENCY_KEY_TIMEOUT = env.int("IDEMPOTENCY_KEY_TIMEOUT", 86_400)
+# Seconds a retry waits for the original request with its Idempotency-Key to finish
+IDEMPOTENCY_WAIT_TIMEOUT = env.int("IDEMPOTENCY_WAIT_TIMEOUT", 10)
+# Whether identical concurrent upstream GETs are coalesced across processes, not just threads
+SINGLE_FLIGHT_SHARED = env.bool("SINGLE_FLIGHT_SHARED", False)
+# Upstream requests per minute shared by all workers and commands; 0 for no limit.
+# Lowered automatically if the upstream advertises a lower limit.
+HALO_REQUESTS_PER_MINUTE = env.int("HALO_REQUESTS_PER_MINUTE", 700)
+ZENDESK_REQUESTS_PER_MINUTE = env.int("ZENDESK_REQUESTS_PER_MINUTE", 700)
+# Share of the upstream budget that background jobs, e.g. migration commands, may use
+OUTBOUND_BACKGROUND_SHARE = env.float("OUTBOUND_BACKGROUND_SHARE", 0.5)
+# Seconds an interactive request waits for the upstream budget before going anyway
+OUTBOUND_MAX_INTERACTIVE_WAIT = env.float("OUTBOUND_MAX_INTERACTIVE_WAIT", 2)
+# An upstream's circuit breaker opens when CIRCUIT_BREAKER_FAILURE_RATE of the calls
+# in a window of CIRCUIT_BREAKER_WINDOW seconds fail, once at least CIRCUIT_BREAKER_MIN_CALLS
+# have been made, and refuses calls for CIRCUIT_BREAKER_OPEN_SECONDS before probing again
+CIRCUIT_BREAKER_WINDOW = env.int("CIRCUIT_BREAKER_WINDOW", 60)
+CIRCUIT_BREAKER_MIN_CALLS = env.int("CIRCUIT_BREAKER_MIN_CALLS", 10)
+CIRCUIT_BREAKER_FAILURE_RATE = env.float("CIRCUIT_BREAKER_FAILURE_RATE", 0.5)
+CIRCUIT_BREAKER_OPEN_SECONDS = env.int("CIRCUIT_BREAKER_OPEN_SECONDS", 30)
+# Seconds a proxied request has to finish, across both legs; see help_desk_api.deadlines
+REQUEST_DEADLINE = env.float("REQUEST_DEADLINE", 25)
+# Deadlines for particular endpoints, by URL name, e.g. "tickets_create_many=60,ticket=10"
+REQUEST_DEADLINES = env.dict(
+    "REQUEST_DEADLINES",
+    cast={"value": float},
+    default={
+        "tickets_create_many": 60,
+        "tickets_update_many": 60,
+        "users_create_or_update_many": 60,
+        "incremental_tickets": 60,
+    },
+)
+# Share of the deadline the Zendesk leg has when dual-running; the Halo leg has the rest
+ZENDESK_DEADLINE_SHARE = env.float("ZENDESK_DEADLINE_SHARE", 0.5)
+# Most seconds any upstream call may take, including those made outside a request
+UPSTREAM_TIMEOUT = env.float("UPSTREAM_TIMEOUT", 30)
+# Most seconds a request for a Halo token may take
+HALO_TOKEN_TIMEOUT = env.float("HALO_TOKEN_TIMEOUT", 5)
+# Whether slow Halo GETs are sent again, using whichever response arrives first;
+# see help_desk_api.hedging
+HALO_HEDGE_REQUESTS = env.bool("HALO_HEDGE_REQUESTS", False)
+# Seconds before a Halo GET is hedged; 0 to use the 95th percentile of recent GETs
+HALO_HEDGE_DELAY = env.float("HALO_HEDGE_DELAY", 0)
+# Most Halo GETs that may be hedged, as a share of all of them
+HALO_HEDGE_BUDGET = env.float("HALO_HEDGE_BUDGET", 0.05)
+# Shared secret Halo sends in the X-Halo-Webhook-Secret header; webhooks are refused if unset
+HALO_WEBHOOK_SECRET = env("HALO_WEBHOOK_SECRET", default=None)
+
 REQUIRE_ZENDESK = env("REQUIRE_ZENDESK", default=False)
 
 '''
@@ -220,6 +396,31 @@ CLAM_AV_USERNAME = env("CLAM_AV_USERNAME", default="")
 CLAM_AV_PASSWORD = env("CLAM_AV_PASSWORD", default="")
 CLAM_AV_URL = env("CLAM_AV_URL", default="")
 CLAM_AV_HOST = env("CLAM_AV_HOST", default="")
+# clamd, scanned with INSTREAM, is used in preference to the REST endpoint if set
+CLAMD_HOST = env("CLAMD_HOST", default="")
+CLAMD_PORT = env.int("CLAMD_PORT", 3310)
+# Whether uploads are scanned for viruses before they're sent to Halo;
+# needs CLAMD_HOST or CLAM_AV_URL, else every upload would be refused
+AV_SCAN_UPLOADS = env.bool("AV_SCAN_UPLOADS", False)
+if AV_SCAN_UPLOADS and not (CLAMD_HOST or CLAM_AV_URL):
+    raise ImproperlyConfigured("AV_SCAN_UPLOADS is set, but neither CLAMD_HOST nor CLAM_AV_URL is")
+# Version of the AV signatures, which AV verdicts are cached under;
+# if unset, it's asked of clamd, or verdicts aren't cached
+AV_DEFINITIONS_VERSION = env("AV_DEFINITIONS_VERSION", default="")
+# Bytes of an upload's Halo payload held in memory before it's spooled to disk
+UPLOAD_SPOOL_MAX_MEMORY = env.int("UPLOAD_SPOOL_MAX_MEMORY", 1024 * 1024)
+# Whether uploads are accepted at once and scanned later by the scan_uploads command
+AV_SCAN_QUEUE = env.bool("AV_SCAN_QUEUE", False)
+# Largest upload, in bytes, accepted onto the scan queue, which holds it in the database
+AV_SCAN_QUEUE_MAX_UPLOAD = env.int("AV_SCAN_QUEUE_MAX_UPLOAD", 20 * 1024 * 1024)
+# Uploads each scan_uploads worker scans at the same time
+AV_SCAN_WORKERS = env.int("AV_SCAN_WORKERS", 4)
+# Seconds before an upload claimed by a worker that hasn't finished it is claimed again
+AV_SCAN_CLAIM_TIMEOUT = env.int("AV_SCAN_CLAIM_TIMEOUT", 300)
+# Seconds before an upload whose scan went wrong is tried again, doubling each time
+AV_SCAN_RETRY_DELAY = env.int("AV_SCAN_RETRY_DELAY", 30)
+# Tries at scanning an upload before giving up on it
+AV_SCAN_MAX_ATTEMPTS = env.int("AV_SCAN_MAX_ATTEMPTS", 5)
 
 # Enable HSTS
 # To disable in a local development environment,
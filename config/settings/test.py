@@ -1 +1,16 @@
 from config.settings.base import *  # type: ignore # noqa
+
+# Tests don't have an AV service; those that scan turn this on
+AV_SCAN_UPLOADS = False
+
+# Tests don't have Redis: the two-tier caches go straight to their database fallbacks
+for cache_config in CACHES.values():  # noqa F405
+    if cache_config["BACKEND"] == TWO_TIER_CACHE_BACKEND:  # noqa F405
+        cache_config["LOCATION"] = ""
+
+# Nor a database fallback for the caches that have none
+for cache_alias in (TICKET_RESPONSE_CACHE, COORDINATION_CACHE, ATTACHMENT_CACHE):  # noqa F405
+    CACHES[cache_alias] = {  # noqa F405
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": cache_alias,
+    }
@@ -1,5 +1,8 @@
+import functools
 import json
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from http import HTTPStatus
 from json import JSONDecodeError
@@ -21,6 +24,25 @@ aws_session_token = os.environ.get("AWS_SESSION_TOKEN")  # /PS-IGNORE
 
 USE_MICROSERVICE_DEFAULT = True
 
+# Records in a batch processed at the same time
+MAX_RECORD_WORKERS = int(os.environ.get("MAX_RECORD_WORKERS", 4))
+
+# SSM parameters, fetched together
+PARAMETER_NAMES = [
+    "ZENDESK_EMAIL",
+    "ZENDESK_TOKEN",
+    "HELP_DESK_API_URL",
+    "HALO_SUBDOMAIN",
+    "HALO_CLIENT_ID",
+    "HALO_CLIENT_SECRET",
+]
+# Seconds SSM parameters are kept for between warm invocations
+PARAMETERS_TTL = int(os.environ.get("PARAMETERS_TTL", 300))
+
+# Kept at module scope so warm invocations reuse them
+parameters_cache = {"parameters": None, "expires_at": 0.0}
+api_client_cache = {"key": None, "api_client": None}
+
 STATUS_OK = {
     "statusCode": HTTPStatus.OK,
 }
@@ -37,7 +59,7 @@ def lambda_handler(event: SQSEvent, context: LambdaContext):
 
     logger.info("Lambda invocation")
 
-    s3 = boto3.client("s3")
+    s3 = get_boto3_client("s3")
     record_type = get_raw_record_type(event)
     if record_type == "s3:TestEvent":  # /PS-IGNORE
         logger.warning("S3 TestEvent: discarding")
@@ -52,48 +74,83 @@ def lambda_handler(event: SQSEvent, context: LambdaContext):
     api_client = get_configured_api_client(parameters)
 
     emails = []
-    bucket_name = ""
-    record: SQSRecord
-    for record in event.records:
-        try:
-            s3_event: S3Event = record.decoded_nested_s3_event
-        except JSONDecodeError:
-            # This can happen with things like SQS test events sent at initialisation  /PS-IGNORE
-            logger.warning(
-                "S3Event JSONDecodeError",
-                extra={
-                    "raw_event": event.raw_event,
-                },
-            )
-            continue
-        logger.debug(
-            "Event decoded",
+    batch_item_failures = []
+    records = list(event.records)
+    # Each email is independent, so they're processed at the same time,
+    # and only those that fail are returned to the queue to be retried
+    with ThreadPoolExecutor(max_workers=MAX_RECORD_WORKERS) as executor:
+        futures = [
+            executor.submit(process_record, record, s3, api_client, event) for record in records
+        ]
+        for record, future in zip(records, futures):
+            try:
+                subject = future.result()
+            except Exception:
+                logger.exception(
+                    "Failed to process record", extra={"message_id": record.message_id}
+                )
+                batch_item_failures.append({"itemIdentifier": record.message_id})
+                continue
+            if subject is not None:
+                emails.append(subject)
+
+    status = dict(STATUS_OK, batchItemFailures=batch_item_failures)
+
+    logger.info("Processed event", extra=event)
+
+    # save_debug_data_to_s3(s3, bucket_name, emails, event, iso_utcnow, parameters, status)
+    return status
+
+
+def process_record(record: SQSRecord, s3, api_client, event: SQSEvent):
+    """
+    Create or update a ticket from the email an SQS record refers to.
+    Records that can't be processed, and won't be on retry, are logged and skipped.
+
+    :returns: The email's subject, or None if it was skipped
+    :raises: Anything that should see the record retried
+    """
+    try:
+        s3_event: S3Event = record.decoded_nested_s3_event
+    except JSONDecodeError:
+        # This can happen with things like SQS test events sent at initialisation  /PS-IGNORE
+        logger.warning(
+            "S3Event JSONDecodeError",
             extra={
                 "raw_event": event.raw_event,
             },
         )
-        bucket_name = s3_event.bucket_name
-        object_key = unquote_plus(s3_event.object_key)
-        try:
-            email_content = get_email_from_bucket(s3, bucket_name, object_key)
-        except ClientError:
-            # This happens if access is denied, e.g. if the object has been deleted
-            # If we ignore it, the queue message will then be discarded
-            logger.warning(
-                "ClientError retrieving S3 object",
-                extra={
-                    "bucket_name": bucket_name,
-                    "object_key": object_key,
-                },
-            )
-            continue
-        parsed_email = ParsedEmail(raw_bytes=email_content)
+        return None
+    logger.debug(
+        "Event decoded",
+        extra={
+            "raw_event": event.raw_event,
+        },
+    )
+    bucket_name = s3_event.bucket_name
+    object_key = unquote_plus(s3_event.object_key)
+    try:
+        email_content = get_email_from_bucket(s3, bucket_name, object_key)
+    except ClientError:
+        # This happens if access is denied, e.g. if the object has been deleted
+        # If we ignore it, the queue message will then be discarded
+        logger.warning(
+            "ClientError retrieving S3 object",
+            extra={
+                "bucket_name": bucket_name,
+                "object_key": object_key,
+            },
+        )
+        return None
+    # Attachments are spooled to /tmp as they're read, rather than held in memory
+    with ParsedEmail.from_stream(email_content) as parsed_email:
         try:
             logger.info("Creating or updating ticket")
             api_client.create_or_update_ticket_from_message(parsed_email)
         except HTTPError as e:
             logger.error(
-                "HTTPError in lambda_handler", extra={"response_content": e.response.content}
+                "HTTPError in lambda_handler",
+                extra={"response_content": getattr(e.response, "content", None)},
             )
             raise
         except AttributeError:
@@ -104,14 +161,7 @@ def lambda_handler(event: SQSEvent, context: LambdaContext):
                     "object_key": object_key,
                 },
             )
-        emails.append(parsed_email.subject)
-
-    status = STATUS_OK
-
-    logger.info("Processed event", extra=event)
-
-    # save_debug_data_to_s3(s3, bucket_name, emails, event, iso_utcnow, parameters, status)
-    return status
+        return parsed_email.subject
 
 
 def remove_email_from_bucket(s3, bucket_name, object_key, destination_bucket):
@@ -127,7 +177,23 @@ def get_raw_record_type(event):
 
 
 def get_configured_api_client(parameters):
+    """
+    The API client for the parameters, reused between warm invocations
+    unless the parameters have changed
+    """
     use_microservice = os.environ.get("USE_MICROSERVICE", USE_MICROSERVICE_DEFAULT)
+    if use_microservice:
+        key = (True, parameters["ZENDESK_EMAIL"], parameters["ZENDESK_TOKEN"])
+    else:
+        key = (
+            False,
+            parameters["HALO_SUBDOMAIN"],
+            parameters["HALO_CLIENT_ID"],
+            parameters["HALO_CLIENT_SECRET"],
+        )
+    if api_client_cache["key"] == key:
+        return api_client_cache["api_client"]
+
     if use_microservice:
         logger.info("Using Microservice API (Zendesk compatible)")
         api_client = MicroserviceAPIClient(
@@ -141,6 +207,7 @@ def get_configured_api_client(parameters):
             halo_client_id=parameters["HALO_CLIENT_ID"],
             halo_client_secret=parameters["HALO_CLIENT_SECRET"],
         )
+    api_client_cache.update(key=key, api_client=api_client)
     return api_client
 
 
@@ -178,18 +245,25 @@ def get_iso_utcnow():
     return datetime.utcnow().isoformat()
 
 
+@functools.cache
+def get_boto3_client(service_name):
+    # boto3 clients are thread-safe, so one of each is shared
+    return boto3.client(service_name)
+
+
 def get_parameters():
-    ssm_client = boto3.client("ssm")
-    parameters = {}
-    for name in [
-        "ZENDESK_EMAIL",
-        "ZENDESK_TOKEN",
-        "HELP_DESK_API_URL",
-        "HALO_SUBDOMAIN",
-        "HALO_CLIENT_ID",
-        "HALO_CLIENT_SECRET",
-    ]:
-        parameter = ssm_client.get_parameter(Name=name, WithDecryption=True)
-        parameters[name] = parameter["Parameter"]["Value"]  # /PS-IGNORE
+    """
+    SSM parameters, fetched in one request and kept for PARAMETERS_TTL seconds
+    """
+    if time.monotonic() < parameters_cache["expires_at"]:
+        return parameters_cache["parameters"]
+    response = get_boto3_client("ssm").get_parameters(Names=PARAMETER_NAMES, WithDecryption=True)
+    if invalid_parameters := response.get("InvalidParameters", []):
+        logger.error("SSM parameters not found", extra={"parameter_names": invalid_parameters})
+        raise KeyError(f"SSM parameters not found: {invalid_parameters}")
+    parameters = {
+        parameter["Name"]: parameter["Value"] for parameter in response["Parameters"]  # /PS-IGNORE
+    }
     logger.debug("get_parameters", extra={"parameters": parameters})
+    parameters_cache.update(parameters=parameters, expires_at=time.monotonic() + PARAMETERS_TTL)
     return parameters
@@ -1,14 +1,25 @@
 import base64
+import binascii
+import hashlib
+import io
 import json
+import math
 import mimetypes
 import os
 import re
+import tempfile
+import threading
+import time
 from abc import ABCMeta, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import FIRST_EXCEPTION, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
 from datetime import datetime
 from email import policy
 from email.message import EmailMessage
-from email.parser import BytesParser
+from email.parser import BytesHeaderParser, BytesParser
 from email.utils import parseaddr
+from functools import cached_property, lru_cache
 from http import HTTPStatus
 
 import requests
@@ -21,6 +32,175 @@ from zenpy.lib.api_objects import Comment, Ticket, User
 logger: Logger = Logger()
 logger.setLevel("DEBUG" if os.environ.get("DEBUG", False) else "INFO")
 
+# Bytes of a decoded attachment held in memory before it's spooled to disk
+ATTACHMENT_SPOOL_MAX_MEMORY = int(os.environ.get("ATTACHMENT_SPOOL_MAX_MEMORY", 1024 * 1024))
+# Lambda's only writable directory
+ATTACHMENT_SPOOL_DIR = os.environ.get("ATTACHMENT_SPOOL_DIR", "/tmp")
+# Emails are read, and attachments base64 encoded for upload, in chunks this big
+STREAM_CHUNK_SIZE = 48 * 1024  # bytes, a multiple of 3 so chunks encode separately
+# Added to the headers of attachment parts spooled by SpooledEmailParser
+SPOOLED_ATTACHMENT_HEADER = "X-Spooled-Attachment"
+
+# Plain text bodies rendered as HTML, kept for records delivered again
+MARKDOWN_CACHE_SIZE = int(os.environ.get("MARKDOWN_CACHE_SIZE", 32))
+
+render_markdown = lru_cache(maxsize=MARKDOWN_CACHE_SIZE)(markdown)
+
+# Attachments of an email uploaded at the same time
+MAX_UPLOAD_WORKERS = int(os.environ.get("MAX_UPLOAD_WORKERS", 4))
+
+
+def iter_lines(stream, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    The lines of a binary stream, with their line endings, read a chunk at a time
+    """
+    remainder = b""
+    while chunk := stream.read(chunk_size):
+        lines = (remainder + chunk).split(b"\n")
+        remainder = lines.pop()
+        for line in lines:
+            yield line + b"\n"
+    if remainder:
+        yield remainder
+
+
+def split_line_ending(line):
+    content = line.rstrip(b"\r\n")
+    return content, line[len(content) :]
+
+
+class PartDecoder:
+    """
+    Decodes a MIME part's body, fed in a line at a time, into a file.
+    The line ending before a boundary belongs to the boundary, so each one is
+    only written once the next line shows it's part of the body.
+    """
+
+    def __init__(self, transfer_encoding, spool):
+        self.transfer_encoding = transfer_encoding
+        self.spool = spool
+        self.remainder = b""
+        self.line_ending = b""
+
+    def feed(self, line):
+        if self.transfer_encoding == "base64":
+            data = self.remainder + b"".join(line.split())
+            whole = len(data) - len(data) % 4
+            self.spool.write(binascii.a2b_base64(data[:whole]))
+            self.remainder = data[whole:]
+            return
+        content, line_ending = split_line_ending(line)
+        # Line endings become "\n", as when the whole email is parsed
+        line_ending = b"\n" if line_ending else b""
+        self.spool.write(self.line_ending)
+        if self.transfer_encoding == "quoted-printable":
+            self.spool.write(binascii.a2b_qp(content))
+            # A soft line break isn't part of the content
+            line_ending = b"" if content.endswith(b"=") else line_ending
+        else:
+            self.spool.write(content)
+        self.line_ending = line_ending
+
+    def finish(self):
+        if self.remainder:
+            try:
+                self.spool.write(
+                    binascii.a2b_base64(self.remainder + b"=" * (-len(self.remainder) % 4))
+                )
+            except binascii.Error:
+                logger.warning("Discarding malformed base64 at the end of an attachment")
+        self.spool.seek(0)
+
+
+class SpooledEmailParser:
+    """
+    Parses an email read from a stream, a line at a time, without holding its attachments
+    in memory: each is decoded as it's read into a temporary file, which is kept in memory
+    up to ATTACHMENT_SPOOL_MAX_MEMORY bytes and in ATTACHMENT_SPOOL_DIR beyond that.
+
+    The rest of the email, its headers and text parts, is parsed as usual, with
+    the body of each spooled attachment left empty and the index of its spool file
+    in its SPOOLED_ATTACHMENT_HEADER.
+    """
+
+    def __init__(self):
+        self.skeleton = bytearray()
+        self.spools = []
+        # Boundaries of the multipart parts being read, outermost first
+        self.boundaries = []
+        self.headers = bytearray()
+        self.decoder = None
+        self.reading_headers = True
+
+    def parse(self, stream):
+        """
+        :returns: The email, and the spool files of its attachments
+        """
+        for line in iter_lines(stream):
+            if self.reading_headers:
+                self.read_header_line(line)
+            elif not self.read_boundary(line):
+                if self.decoder is None:
+                    self.skeleton += line
+                else:
+                    self.decoder.feed(line)
+        if self.reading_headers:
+            self.skeleton += self.headers
+        self.finish_part()
+        # Parsed as a file, as ParsedEmail does, for the same line endings
+        message = BytesParser(policy=policy.default).parse(io.BytesIO(self.skeleton))
+        return message, self.spools
+
+    def read_header_line(self, line):
+        if line.strip():
+            self.headers += line
+            return
+        part = BytesHeaderParser(policy=policy.default).parsebytes(bytes(self.headers))
+        self.skeleton += self.headers
+        self.headers = bytearray()
+        self.reading_headers = False
+        if part.get_content_maintype() == "multipart" and part.get_boundary():
+            self.boundaries.append(part.get_boundary().encode("ascii", "replace"))
+        elif self.boundaries and (
+            part.get_content_disposition() == "attachment" or part.get_content_maintype() != "text"
+        ):
+            spool = tempfile.SpooledTemporaryFile(
+                max_size=ATTACHMENT_SPOOL_MAX_MEMORY, dir=ATTACHMENT_SPOOL_DIR
+            )
+            transfer_encoding = str(part.get("Content-Transfer-Encoding", "7bit")).strip().lower()
+            self.decoder = PartDecoder(transfer_encoding, spool)
+            self.skeleton += f"{SPOOLED_ATTACHMENT_HEADER}: {len(self.spools)}\r\n".encode()
+            self.spools.append(spool)
+        self.skeleton += line
+
+    def read_boundary(self, line):
+        """
+        :returns: Whether the line was a boundary
+        """
+        if not line.startswith(b"--") or not self.boundaries:
+            return False
+        delimiter = line.rstrip()[2:]
+        for depth in range(len(self.boundaries) - 1, -1, -1):
+            boundary = self.boundaries[depth]
+            if delimiter == boundary:
+                # The next part of this multipart
+                del self.boundaries[depth + 1 :]
+                self.reading_headers = True
+            elif delimiter == boundary + b"--":
+                # The end of this multipart
+                del self.boundaries[depth:]
+            else:
+                continue
+            self.finish_part()
+            self.skeleton += line
+            return True
+        return False
+
+    def finish_part(self):
+        if self.decoder is not None:
+            self.decoder.finish()
+            self.decoder = None
+
 
 class ParsedEmail:
     # RFC 5322 section 3.4 specifies that the display name  /PS-IGNORE
@@ -29,19 +209,46 @@ class ParsedEmail:
     FALLBACK_DISPLAY_NAME = "unknown"
 
     message: EmailMessage
-    ticket_id_matcher: str = r"\[[[A-Z]{2}-0*(\d+)]"
-    supplier_id_matcher: str = r"\[QK:0*(\d+)]"
+    ticket_id_matcher: re.Pattern = re.compile(r"\[[\[A-Z]{2}-0*(\d+)]")
+    supplier_id_matcher: re.Pattern = re.compile(r"\[QK:0*(\d+)]")
 
-    def __init__(self, raw_bytes):
-        # Parse the email from raw bytes
-        self.message = BytesParser(policy=policy.default).parse(raw_bytes)
+    def __init__(self, raw_bytes=None, message=None, spooled_attachments=()):
+        """
+        :param raw_bytes: A binary file with the email, which is parsed in memory
+        :param message: Or the email already parsed
+        :param spooled_attachments: The spool files of attachments left out of the message
+        """
+        if message is None:
+            # Parse the email from raw bytes
+            message = BytesParser(policy=policy.default).parse(raw_bytes)
+        self.message = message
+        self.spooled_attachments = list(spooled_attachments)
+
+    @classmethod
+    def from_stream(cls, stream):
+        """
+        Parse an email without holding its attachments in memory;
+        close it afterwards to remove their spool files
+        """
+        message, spooled_attachments = SpooledEmailParser().parse(stream)
+        return cls(message=message, spooled_attachments=spooled_attachments)
 
-    @property
+    def close(self):
+        for spool in self.spooled_attachments:
+            spool.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @cached_property
     def sender(self):
         # Get the From header
         return self.message.get("From")
 
-    @property
+    @cached_property
     def mailbox_parts(self):
         return parseaddr(self.sender)
 
@@ -57,19 +264,19 @@ class ParsedEmail:
         # Get the user's email address from the From header
         return self.mailbox_parts[1]
 
-    @property
+    @cached_property
     def subject(self):
         return self.message.get("Subject")
 
-    @property
+    @cached_property
     def body(self) -> EmailMessage:
         return self.message.get_body(preferencelist=("html", "plain"))
 
-    @property
+    @cached_property
     def payload(self):
         payload = self.body.get_content()
         if self.body.get_content_type() == "text/plain":
-            payload = markdown(payload)
+            payload = render_markdown(payload)
         return payload
 
     @property
@@ -84,14 +291,21 @@ class ParsedEmail:
             if content_disposition is None:
                 # DRF insists on this for parsing a file upload…
                 content_disposition = "attachment"
+            spool_index = attachment.get(SPOOLED_ATTACHMENT_HEADER, None)
+            if spool_index is None:
+                payload = attachment.get_content()
+            else:
+                # A binary file, rather than bytes
+                payload = self.spooled_attachments[int(spool_index)]
+                payload.seek(0)
             yield {
                 "content_type": content_type,
                 "content_disposition": content_disposition,
                 "filename": filename,
-                "payload": attachment.get_content(),
+                "payload": payload,
             }
 
-    @property
+    @cached_property
     def recipient(self):
         """
         The email address to which the ticket was sent
@@ -102,54 +316,141 @@ class ParsedEmail:
         """
         return self.message.get("To")
 
-    @property
+    @cached_property
     def reply_to_ticket_id(self):
-        if search_result := re.search(self.ticket_id_matcher, self.subject):
+        if search_result := self.ticket_id_matcher.search(self.subject or ""):
             return search_result.group(1)
         return None
 
-    @property
+    @cached_property
     def supplier_id(self):
-        if search_result := re.search(self.supplier_id_matcher, self.subject):
+        if search_result := self.supplier_id_matcher.search(self.subject or ""):
             return search_result.group(1)
         return None
 
+    @cached_property
+    def digest(self) -> "EmailDigest":
+        """
+        :raises AttributeError: If the email has no body
+        """
+        return EmailDigest(
+            subject=self.subject,
+            sender_name=self.sender_name,
+            sender_email=self.sender_email,
+            recipient=self.recipient,
+            recipient_email=parseaddr(self.recipient)[1],
+            payload=self.payload,
+            reply_to_ticket_id=self.reply_to_ticket_id,
+            supplier_id=self.supplier_id,
+        )
+
+
+@dataclass(frozen=True, slots=True)
+class EmailDigest:
+    """
+    What the API clients need of an email, worked out once from its headers and body
+    """
+
+    subject: str
+    sender_name: str
+    sender_email: str
+    # The To header, and the address in it
+    recipient: str
+    recipient_email: str
+    # The body as HTML
+    payload: str
+    reply_to_ticket_id: str | None
+    supplier_id: str | None
+
+
+def attachment_content_hash(payload):
+    """
+    :param payload: An attachment's content, as bytes, text or a binary file
+    """
+    content_hash = hashlib.sha256()
+    if hasattr(payload, "read"):
+        payload.seek(0)
+        while chunk := payload.read(STREAM_CHUNK_SIZE):
+            content_hash.update(chunk)
+        payload.seek(0)
+    elif isinstance(payload, str):
+        content_hash.update(payload.encode())
+    else:
+        content_hash.update(payload)
+    return content_hash.hexdigest()
+
 
 class BaseAPIClient(metaclass=ABCMeta):
     def create_or_update_ticket_from_message(self, message: ParsedEmail):
-        ticket_id = message.reply_to_ticket_id
+        # Before any attachments are uploaded, so an email without a body uploads nothing
+        digest = message.digest
+        ticket_id = digest.reply_to_ticket_id
         upload_tokens = self.upload_attachments(message, ticket_id=ticket_id)
         if ticket_id:
             logger.info("Updating ticket", extra={"ticket_id": ticket_id})
             response = self.update_ticket(message, upload_tokens, ticket_id)
         else:
             logger.info(
-                f"Creating ticket {message.subject} ",
+                f"Creating ticket {digest.subject} ",
                 extra={
-                    "subject": message.subject,
-                    "from": message.sender_email,
-                    "to": message.recipient,
+                    "subject": digest.subject,
+                    "from": digest.sender_email,
+                    "to": digest.recipient,
                 },
             )
             response = self.create_ticket(message, upload_tokens=upload_tokens)
         return response
 
     def upload_attachments(self, message: ParsedEmail, ticket_id=None):
-        from_address = message.sender_email
-        upload_tokens = []
+        """
+        Upload the email's attachments, up to MAX_UPLOAD_WORKERS at a time;
+        if one fails, those not yet started aren't, and its error is raised
+
+        :returns: The upload tokens, in the order of the attachments
+        """
+        from_address = message.digest.sender_email
+        attachments = list(self.unique_attachments(message))
+        if not attachments:
+            return []
+        with ThreadPoolExecutor(
+            max_workers=min(MAX_UPLOAD_WORKERS, len(attachments)), thread_name_prefix="upload"
+        ) as executor:
+            futures = [
+                executor.submit(
+                    self.upload_attachment,
+                    payload=attachment["payload"],
+                    target_name=attachment["filename"],
+                    content_type=attachment["content_type"],
+                    ticket_id=ticket_id,
+                    from_address=from_address,
+                )
+                for attachment in attachments
+            ]
+            done, not_done = wait(futures, return_when=FIRST_EXCEPTION)
+            for future in not_done:
+                # Any already uploading carry on, and are waited for
+                future.cancel()
+            for future in futures:
+                if future in done:
+                    # Raises the first failure
+                    future.result()
+        return [future.result().token for future in futures]
+
+    def unique_attachments(self, message: ParsedEmail):
+        """
+        The email's attachments, leaving out any with the same content as an earlier one
+        """
+        content_hashes = set()
         for attachment in message.attachments:
-            payload = attachment["payload"]
-            filename = attachment["filename"]
-            content_type = attachment["content_type"]
-            upload = self.upload_attachment(
-                payload=payload,
-                target_name=filename,
-                content_type=content_type,
-                ticket_id=ticket_id,
-                from_address=from_address,
-            )
-            upload_tokens.append(upload.token)
-        return upload_tokens
+            content_hash = attachment_content_hash(attachment["payload"])
+            if content_hash in content_hashes:
+                logger.info(
+                    "Skipping duplicate attachment",
+                    extra={"attachment_filename": attachment["filename"]},
+                )
+                continue
+            content_hashes.add(content_hash)
+            yield attachment
 
     @abstractmethod
     def upload_attachment(self, payload, target_name, content_type, ticket_id=None, **kwargs):
@@ -194,17 +495,18 @@ class MicroserviceAPIClient(BaseAPIClient):
         return upload
 
     def create_ticket(self, message: ParsedEmail, upload_tokens=None):
-        subject = message.subject
-        description = message.payload
-        recipient = parseaddr(message.recipient)[1]
+        digest = message.digest
+        subject = digest.subject
+        description = digest.payload
+        recipient = digest.recipient_email
 
         debug_netloc = os.environ.get("ZENPY_FORCE_NETLOC", "netloc not found")
         subject = f"{subject} via {debug_netloc}"
         logger.info("Creating ticket", extra={"subject": subject})
 
         zenpy_user = User(
-            email=message.sender_email,
-            name=message.sender_name,
+            email=digest.sender_email,
+            name=digest.sender_name,
         )
         zenpy_comment = Comment(
             html_body=description,
@@ -223,12 +525,13 @@ class MicroserviceAPIClient(BaseAPIClient):
 
     def update_ticket(self, message: ParsedEmail, upload_tokens=None, ticket_id=None):
         logger.info("Updating ticket", extra={"ticket_id": ticket_id})
-        description = message.payload
-        recipient = parseaddr(message.recipient)[1]
+        digest = message.digest
+        description = digest.payload
+        recipient = digest.recipient_email
 
         zenpy_user = User(
-            email=message.sender_email,
-            name=message.sender_name,
+            email=digest.sender_email,
+            name=digest.sender_name,
         )
         zenpy_comment = Comment(
             html_body=description,
@@ -250,37 +553,159 @@ class HaloClientNotFoundException(Exception):
     pass
 
 
-class HaloAPIClient(BaseAPIClient):
-    halo_token = None
-    _halo_user: [dict, None] = None
+# Halo access tokens and when to stop using them, by subdomain and client ID,
+# kept at module scope so warm invocations reuse them
+halo_tokens = {}
+# Tokens are renewed this many seconds before Halo says they expire
+HALO_TOKEN_EXPIRY_MARGIN = 60
+
+# Senders whose Halo users are kept, and for how many seconds
+HALO_USER_CACHE_SIZE = int(os.environ.get("HALO_USER_CACHE_SIZE", 1024))
+HALO_USER_CACHE_TTL = int(os.environ.get("HALO_USER_CACHE_TTL", 300))
+
+
+class HaloUserCache:
+    """
+    Halo users by subdomain and sender email address, or None for senders
+    who aren't Halo users, the least recently used dropped first.
+
+    A sender being looked up by one thread is waited for by any others,
+    so each is searched for once.
+    """
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        # Futures of the users, and when to stop using them
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get_or_search(self, key, search):
+        """
+        :param search: Called to find the user if there's no entry for the key;
+            if it raises, nothing is kept, and the error is raised to all waiting
+        """
+        with self.lock:
+            future, expires_at = self.entries.get(key, (None, 0.0))
+            searching = time.monotonic() >= expires_at
+            if searching:
+                future = Future()
+                self.entries[key] = (future, time.monotonic() + self.ttl)
+                while len(self.entries) > self.max_size:
+                    self.entries.popitem(last=False)
+            self.entries.move_to_end(key)
+        if searching:
+            try:
+                future.set_result(search())
+            except Exception as exp:
+                with self.lock:
+                    if self.entries.get(key, (None,))[0] is future:
+                        del self.entries[key]
+                future.set_exception(exp)
+        return future.result()
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+# Kept at module scope so warm invocations reuse them
+halo_users = HaloUserCache(max_size=HALO_USER_CACHE_SIZE, ttl=HALO_USER_CACHE_TTL)
+
+
+class Base64AttachmentBody:
+    """
+    The body of a Halo Attachment request for a file, read from the file
+    and base64 encoded a chunk at a time as it's sent.
+    Its length is known up front, so it's sent with a Content-Length rather than chunked.
+    """
+
+    def __init__(self, attachment_fields, content_type, file):
+        # The file goes at the end of the data URL, the last field
+        fields = json.dumps(
+            [dict(attachment_fields, data_base64=f"data:{content_type};base64,")]  # noqa: E231
+        ).encode("utf-8")
+        self.prefix, self.suffix = fields[:-3], fields[-3:]
+        self.file = file
+        self.file.seek(0, os.SEEK_END)
+        self.file_size = self.file.tell()
+        self.file.seek(0)
+        self.chunks = self.iter_chunks()
+        self.buffer = b""
+
+    def __len__(self):
+        return len(self.prefix) + 4 * math.ceil(self.file_size / 3) + len(self.suffix)
+
+    def iter_chunks(self):
+        yield self.prefix
+        while chunk := self.file.read(STREAM_CHUNK_SIZE):
+            yield base64.b64encode(chunk)
+        yield self.suffix
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) < size:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                break
+            self.buffer += chunk
+        if size < 0:
+            size = len(self.buffer)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
 
+
+class HaloAPIClient(BaseAPIClient):
     def get_halo_user(self, search_term):
-        if self._halo_user is None:
-            self._halo_user = {}
-            path = "Users"
-            params = {"search": search_term}
-            logger.debug(f"Making Halo GET: {path}, params={params}")
-            response = requests.get(
-                f"https://{self.halo_subdomain}.haloitsm.com/api/{path}",
-                params=params,
-                headers={
-                    "Authorization": f"Bearer {self.halo_token}",
-                },
+        """
+        The Halo user with the email address, looked up once a HALO_USER_CACHE_TTL at most
+
+        :returns: The user, or an empty dict if there's none or Halo couldn't be searched
+        """
+        try:
+            halo_user = halo_users.get_or_search(
+                (self.halo_subdomain, search_term.lower()),
+                lambda: self.search_halo_user(search_term),
             )
-            if response.status_code == HTTPStatus.OK:
-                logger.debug(f"Completed Halo GET: {response.url}")
-                search_results = response.json()
-                record_count = search_results["record_count"]
-                logger.info(f"Halo user search result count: {record_count}")
-                if record_count > 0:
-                    self._halo_user = search_results["users"][0]
-                    logger.debug(
-                        f"Found Halo user {self._halo_user['id']} "  # /PS-IGNORE
-                        f"named {self._halo_user['name']}"
-                    )
-            else:
-                logger.warning(f"Get Halo User error: Response status {response.status_code}")
-        return self._halo_user
+        except HTTPError as exp:
+            logger.warning(f"Get Halo User error: {exp}")
+            return {}
+        return halo_user or {}
+
+    def search_halo_user(self, search_term):
+        """
+        :returns: The user, preferring one whose email address is the search term,
+            or None if there's none
+        :raises HTTPError: If Halo didn't answer the search
+        """
+        path = "Users"
+        params = {"search": search_term}
+        logger.debug(f"Making Halo GET: {path}, params={params}")
+        response = requests.get(
+            f"https://{self.halo_subdomain}.haloitsm.com/api/{path}",
+            params=params,
+            headers={
+                "Authorization": f"Bearer {self.halo_token}",
+            },
+        )
+        if response.status_code != HTTPStatus.OK:
+            raise HTTPError(f"Response status {response.status_code}")
+        logger.debug(f"Completed Halo GET: {response.url}")
+        search_results = response.json()
+        record_count = search_results["record_count"]
+        logger.info(f"Halo user search result count: {record_count}")
+        if record_count == 0:
+            return None
+        users = search_results["users"]
+        # The search matches more than email addresses, and on parts of them
+        halo_user = next(
+            (user for user in users if user.get("emailaddress", "").lower() == search_term.lower()),
+            users[0],
+        )
+        logger.debug(
+            f"Found Halo user {halo_user['id']} "  # /PS-IGNORE
+            f"named {halo_user['name']}"
+        )
+        return halo_user
 
     def __init__(self, halo_subdomain, halo_client_id, halo_client_secret) -> None:
         super().__init__()
@@ -293,13 +718,31 @@ class HaloAPIClient(BaseAPIClient):
             },
         )
         self.halo_subdomain = halo_subdomain
-        self.halo_token = self.__authenticate(
+        self.halo_client_id = halo_client_id
+        self.halo_client_secret = halo_client_secret
+        self._halo_token = self.__authenticate(
             halo_client_id=halo_client_id,
             halo_client_secret=halo_client_secret,
         )
-        self._halo_user = None
+
+    @property
+    def halo_token(self):
+        # Clients share tokens, which are renewed once they expire
+        token, expires_at = halo_tokens.get(
+            (self.halo_subdomain, self.halo_client_id), (self._halo_token, math.inf)
+        )
+        if time.monotonic() >= expires_at:
+            token = self.__authenticate(
+                halo_client_id=self.halo_client_id,
+                halo_client_secret=self.halo_client_secret,
+            )
+        return token
 
     def __authenticate(self, halo_client_id, halo_client_secret):
+        token_key = (self.halo_subdomain, halo_client_id)
+        token, expires_at = halo_tokens.get(token_key, (None, 0.0))
+        if time.monotonic() < expires_at:
+            return token
         data = {
             "grant_type": "client_credentials",
             "client_id": halo_client_id,
@@ -325,6 +768,11 @@ class HaloAPIClient(BaseAPIClient):
             raise HaloClientNotFoundException(error_message)
 
         response_data = response.json()
+        expires_in = response_data.get("expires_in", 0)
+        halo_tokens[token_key] = (
+            response_data["access_token"],
+            time.monotonic() + expires_in - HALO_TOKEN_EXPIRY_MARGIN,
+        )
         return response_data["access_token"]
 
     class Upload:
@@ -347,20 +795,24 @@ class HaloAPIClient(BaseAPIClient):
                 "ticket_id": ticket_id,
             },
         )
-        file_content_base64 = base64.b64encode(payload).decode("ascii")  # /PS-IGNORE
-        base64_payload = f"data:{content_type};base64,{file_content_base64}"  # noqa: E231,E702
-        halo_attachment_payload = [
-            {
-                "filename": target_name,
-                "isimage": content_type.startswith("image"),
-                "data_base64": base64_payload,  # /PS-IGNORE
-            }
-        ]
+        attachment_fields = {
+            "filename": target_name,
+            "isimage": content_type.startswith("image"),
+        }
         if ticket_id is not None:
-            halo_attachment_payload[0]["ticket_id"] = ticket_id
+            attachment_fields["ticket_id"] = ticket_id
+        if hasattr(payload, "read"):
+            # A spooled attachment, encoded as it's sent
+            request_body = Base64AttachmentBody(attachment_fields, content_type, payload)
+        else:
+            file_content_base64 = base64.b64encode(payload).decode("ascii")  # /PS-IGNORE
+            base64_payload = f"data:{content_type};base64,{file_content_base64}"  # noqa: E231,E702
+            request_body = json.dumps(
+                [dict(attachment_fields, data_base64=base64_payload)]  # /PS-IGNORE
+            )
         response: Response = requests.post(
             f"https://{self.halo_subdomain}.haloitsm.com/api/Attachment",
-            data=json.dumps(halo_attachment_payload),
+            data=request_body,
             headers={
                 "Authorization": f"Bearer {self.halo_token}",
                 "Content-Type": "application/json",
@@ -375,7 +827,7 @@ class HaloAPIClient(BaseAPIClient):
         return HaloAPIClient.Upload(token=response_content["id"])
 
     def create_ticket(self, message, upload_tokens):
-        logger.info("Creating ticket", extra={"subject": message.subject})
+        logger.info("Creating ticket", extra={"subject": message.digest.subject})
         request_data = self.halo_ticket_creation_data_from_message(
             message, upload_tokens=upload_tokens
         )
@@ -465,18 +917,19 @@ class HaloAPIClient(BaseAPIClient):
     def halo_ticket_creation_data_from_message(
         self, message: ParsedEmail, upload_tokens=None, ticket_id=None
     ):
+        digest = message.digest
         request_data = {
-            "summary": message.subject,
-            "details_html": message.payload,
-            "users_name": message.sender_name,
-            "reportedby": message.sender_email,
-            "user_email": message.sender_email,
+            "summary": digest.subject,
+            "details_html": digest.payload,
+            "users_name": digest.sender_name,
+            "reportedby": digest.sender_email,
+            "user_email": digest.sender_email,
             "outcome": "First User Email",
             "tickettype_id": 43,  # TODO: put this in config somewhere
             "dont_do_rules": False,
-            "customfields": [{"name": "CFEmailToAddress", "value": message.recipient}],
+            "customfields": [{"name": "CFEmailToAddress", "value": digest.recipient}],
         }
-        halo_user = self.get_halo_user(search_term=message.sender_email)
+        halo_user = self.get_halo_user(search_term=digest.sender_email)
         if halo_user:
             # add the relevant user details to the ticket
             request_data["users_name"] = halo_user["name"]
@@ -500,21 +953,22 @@ class HaloAPIClient(BaseAPIClient):
         ]
 
     def halo_ticket_action_data_from_message(self, message: ParsedEmail, ticket_id=None):
+        digest = message.digest
         request_data = {
             "ticket_id": ticket_id,
-            "note_html": message.payload,
-            "hiddenfromuser": True if message.supplier_id else False,
-            "outcome": "Supplier Update" if message.supplier_id else "Email Update",
-            "emailfrom": message.sender_email,
-            "who": message.sender_name,
+            "note_html": digest.payload,
+            "hiddenfromuser": True if digest.supplier_id else False,
+            "outcome": "Supplier Update" if digest.supplier_id else "Email Update",
+            "emailfrom": digest.sender_email,
+            "who": digest.sender_name,
             "customfields": [
                 {
                     "name": "CFEmailToAddress",
-                    "value": message.recipient,
+                    "value": digest.recipient,
                 }
             ],
         }
-        halo_user = self.get_halo_user(search_term=message.sender_email)
+        halo_user = self.get_halo_user(search_term=digest.sender_email)
         if halo_user:
             # add the relevant user details to the ticket
             request_data["who"] = halo_user["name"]
@@ -0,0 +1,52 @@
+import json
+import sys
+from io import BytesIO
+from unittest import mock
+
+import pytest
+from email_router.ses_email_receiving import email_utils
+
+# The Lambda runs with ses_email_receiving as its root, so app imports email_utils directly
+sys.modules.setdefault("email_utils", email_utils)
+
+from email_router.ses_email_receiving import app  # noqa: E402
+
+
+def sqs_record(message_id, object_key):
+    s3_event = {
+        "Records": [
+            {
+                "eventName": "ObjectCreated:Put",
+                "s3": {
+                    "bucket": {"name": "incoming-mail"},
+                    "object": {"key": object_key},
+                },
+            }
+        ]
+    }
+    return {"messageId": message_id, "body": json.dumps(s3_event)}
+
+
+@pytest.fixture()
+def sqs_event():
+    return {"Records": [sqs_record(f"message-{index}", f"email-{index}") for index in range(3)]}
+
+
+@pytest.fixture(autouse=True)
+def clear_warm_caches():
+    app.parameters_cache.update(parameters=None, expires_at=0.0)
+    app.api_client_cache.update(key=None, api_client=None)
+    app.get_boto3_client.cache_clear()
+
+
+@pytest.fixture()
+def lambda_app(email_bytes):
+    email_content = email_bytes.read()
+    with (
+        mock.patch.object(app, "get_parameters", return_value={}),
+        mock.patch.object(app, "boto3"),
+        mock.patch.object(
+            app, "get_email_from_bucket", side_effect=lambda *args: BytesIO(email_content)
+        ),
+    ):
+        yield app
@@ -0,0 +1,61 @@
+import threading
+from unittest import mock
+
+from requests import HTTPError
+
+
+def handle(lambda_app, sqs_event, create_or_update):
+    api_client = mock.Mock()
+    api_client.create_or_update_ticket_from_message.side_effect = create_or_update
+    with mock.patch.object(lambda_app, "get_configured_api_client", return_value=api_client):
+        return lambda_app.lambda_handler(sqs_event, None), api_client
+
+
+class TestLambdaHandler:
+    def test_all_records_processed(self, lambda_app, sqs_event):
+        status, api_client = handle(lambda_app, sqs_event, None)
+
+        assert status["batchItemFailures"] == []
+        assert api_client.create_or_update_ticket_from_message.call_count == 3
+
+    def test_only_failed_records_reported(self, lambda_app, sqs_event):
+        calls = []
+
+        def create_or_update(message):
+            calls.append(message)
+            if len(calls) == 2:
+                raise HTTPError("500 response for create ticket")
+
+        status, _ = handle(lambda_app, sqs_event, create_or_update)
+
+        assert len(calls) == 3
+        assert len(status["batchItemFailures"]) == 1
+        assert status["batchItemFailures"][0]["itemIdentifier"].startswith("message-")
+
+    def test_unexpected_errors_reported(self, lambda_app, sqs_event):
+        def create_or_update(message):
+            raise RuntimeError("Boom")
+
+        status, _ = handle(lambda_app, sqs_event, create_or_update)
+
+        assert status["batchItemFailures"] == [
+            {"itemIdentifier": "message-0"},
+            {"itemIdentifier": "message-1"},
+            {"itemIdentifier": "message-2"},
+        ]
+
+    def test_records_processed_concurrently(self, lambda_app, sqs_event):
+        # Each call waits for the others, so this only finishes if they overlap
+        barrier = threading.Barrier(3, timeout=5)
+
+        status, _ = handle(lambda_app, sqs_event, lambda message: barrier.wait())
+
+        assert status["batchItemFailures"] == []
+
+    def test_undecodable_record_skipped(self, lambda_app, sqs_event):
+        sqs_event["Records"][-1]["body"] = "Not JSON"
+
+        status, api_client = handle(lambda_app, sqs_event, None)
+
+        assert status["batchItemFailures"] == []
+        assert api_client.create_or_update_ticket_from_message.call_count == 2
@@ -0,0 +1,61 @@
+from unittest import mock
+
+import pytest
+from email_router.tests.unit.app.conftest import app
+
+
+@pytest.fixture()
+def ssm():
+    ssm = mock.Mock()
+    ssm.get_parameters.return_value = {
+        "Parameters": [{"Name": name, "Value": f"{name} value"} for name in app.PARAMETER_NAMES],
+        "InvalidParameters": [],
+    }
+    with mock.patch.object(app, "boto3") as mock_boto3:
+        mock_boto3.client.return_value = ssm
+        yield ssm
+
+
+class TestParameters:
+    def test_fetched_in_one_request(self, ssm):
+        parameters = app.get_parameters()
+
+        assert parameters["HALO_CLIENT_ID"] == "HALO_CLIENT_ID value"
+        ssm.get_parameters.assert_called_once_with(Names=app.PARAMETER_NAMES, WithDecryption=True)
+
+    def test_reused_until_expired(self, ssm):
+        app.get_parameters()
+        app.get_parameters()
+        assert ssm.get_parameters.call_count == 1
+
+        app.parameters_cache["expires_at"] = 0.0
+        app.get_parameters()
+        assert ssm.get_parameters.call_count == 2
+
+    def test_missing_parameters_raise(self, ssm):
+        ssm.get_parameters.return_value["InvalidParameters"] = ["ZENDESK_TOKEN"]
+
+        with pytest.raises(KeyError):
+            app.get_parameters()
+
+    def test_boto3_client_reused(self, ssm):
+        assert app.get_boto3_client("ssm") is app.get_boto3_client("ssm")
+        app.boto3.client.assert_called_once_with("ssm")
+
+
+@mock.patch.object(app, "MicroserviceAPIClient")
+class TestConfiguredAPIClient:
+    parameters = {"ZENDESK_EMAIL": "someone@example.com", "ZENDESK_TOKEN": "abc"}  # /PS-IGNORE
+
+    def test_reused(self, mock_client: mock.Mock):
+        first = app.get_configured_api_client(self.parameters)
+        second = app.get_configured_api_client(dict(self.parameters))
+
+        assert first is second
+        mock_client.assert_called_once()
+
+    def test_rebuilt_when_parameters_change(self, mock_client: mock.Mock):
+        app.get_configured_api_client(self.parameters)
+        app.get_configured_api_client(dict(self.parameters, ZENDESK_TOKEN="def"))
+
+        assert mock_client.call_count == 2
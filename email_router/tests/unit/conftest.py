@@ -4,10 +4,23 @@ from email.parser import BytesParser
 from pathlib import Path
 
 import pytest
+from email_router.ses_email_receiving import email_utils
 from email_router.ses_email_receiving.email_utils import ParsedEmail
 from requests import Response
 
 
+@pytest.fixture(autouse=True)
+def clear_halo_tokens():
+    # Kept between invocations, so between tests
+    email_utils.halo_tokens.clear()
+
+
+@pytest.fixture(autouse=True)
+def clear_halo_users():
+    # Kept between invocations, so between tests
+    email_utils.halo_users.clear()
+
+
 @pytest.fixture(scope="function")
 def email_bytes():
     fixture_path = Path(__file__).parent / "fixtures/emails/two-attachments-email.txt"
@@ -1,11 +1,18 @@
 import base64
 import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from http import HTTPStatus
 from unittest import mock
 from unittest.mock import MagicMock
 
+from email_router.ses_email_receiving import email_utils
 from email_router.ses_email_receiving.email_utils import HaloAPIClient, ParsedEmail
-from email_router.tests.unit.email_utils.conftest import raw_halo_user_search_response
+from email_router.tests.unit.email_utils.conftest import (
+    make_raw_halo_user_search_response,
+    raw_halo_user_search_response,
+)
 from requests import Response
 
 
@@ -585,3 +592,173 @@ class TestHaloAPIClientGetUser:
         request_params = mock_get.call_args.kwargs["params"]
         assert "search" in request_params
         assert request_params["search"] == expected_url_search_term
+
+    def test_sender_searched_for_once(
+        self,
+        mock_get: MagicMock,
+        halo_user_search_response: MagicMock,
+        halo_api_client: HaloAPIClient,
+    ):
+        mock_get.return_value = halo_user_search_response
+        with mock.patch.object(HaloAPIClient, "_HaloAPIClient__authenticate"):
+            # As on a warm invocation
+            other_api_client = HaloAPIClient(
+                halo_subdomain="foo", halo_client_id="abcdef", halo_client_secret="123456"
+            )
+
+        first = halo_api_client.get_halo_user("some.bodyfromapi@example.com")  # /PS-IGNORE
+        second = other_api_client.get_halo_user("Some.BodyFromAPI@example.com")  # /PS-IGNORE
+
+        assert first == second
+        assert first["id"] == 38
+        mock_get.assert_called_once()
+
+    def test_sender_searched_for_once_at_the_same_time(
+        self,
+        mock_get: MagicMock,
+        halo_user_search_response: MagicMock,
+        halo_api_client: HaloAPIClient,
+    ):
+        searching = threading.Event()
+
+        def search(url, params, headers):
+            searching.set()
+            time.sleep(0.05)
+            return halo_user_search_response
+
+        mock_get.side_effect = search
+        sender = "some.bodyfromapi@example.com"  # /PS-IGNORE
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            first = executor.submit(halo_api_client.get_halo_user, sender)
+            searching.wait(timeout=5)
+            second = executor.submit(halo_api_client.get_halo_user, sender)
+
+        assert first.result() == second.result()
+        mock_get.assert_called_once()
+
+    def test_each_sender_gets_their_own_user(
+        self,
+        mock_get: MagicMock,
+        halo_user_search_result,
+        halo_api_client: HaloAPIClient,
+    ):
+        def search(url, params, headers):
+            user = dict(halo_user_search_result["users"][0], emailaddress=params["search"])
+            return make_raw_halo_user_search_response({"record_count": 1, "users": [user]})
+
+        mock_get.side_effect = search
+        senders = ["first@example.com", "second@example.com"]  # /PS-IGNORE
+
+        halo_users = [halo_api_client.get_halo_user(sender) for sender in senders * 2]
+
+        assert [halo_user["emailaddress"] for halo_user in halo_users] == senders * 2
+        assert mock_get.call_count == 2
+
+    def test_exact_email_match_preferred(
+        self,
+        mock_get: MagicMock,
+        halo_user_search_result,
+        halo_api_client: HaloAPIClient,
+    ):
+        user = halo_user_search_result["users"][0]
+        users = [
+            dict(user, id=1, emailaddress="somebody@example.com.au"),  # /PS-IGNORE
+            dict(user, id=2, emailaddress="somebody@example.com"),  # /PS-IGNORE
+        ]
+        mock_get.return_value = make_raw_halo_user_search_response(
+            {"record_count": 2, "users": users}
+        )
+
+        halo_user = halo_api_client.get_halo_user("somebody@example.com")  # /PS-IGNORE
+
+        assert halo_user["id"] == 2
+
+    def test_sender_without_user_searched_for_once(
+        self, mock_get: MagicMock, halo_api_client: HaloAPIClient
+    ):
+        mock_get.return_value = make_raw_halo_user_search_response({"record_count": 0, "users": []})
+
+        assert halo_api_client.get_halo_user("nobody@example.com") == {}  # /PS-IGNORE
+        assert halo_api_client.get_halo_user("nobody@example.com") == {}  # /PS-IGNORE
+        mock_get.assert_called_once()
+
+    def test_sender_searched_for_again_once_expired(
+        self,
+        mock_get: MagicMock,
+        halo_user_search_response: MagicMock,
+        halo_api_client: HaloAPIClient,
+    ):
+        mock_get.return_value = halo_user_search_response
+
+        with mock.patch.object(email_utils.halo_users, "ttl", 0):
+            halo_api_client.get_halo_user("some.bodyfromapi@example.com")  # /PS-IGNORE
+            halo_api_client.get_halo_user("some.bodyfromapi@example.com")  # /PS-IGNORE
+
+        assert mock_get.call_count == 2
+
+    def test_failed_search_not_kept(
+        self,
+        mock_get: MagicMock,
+        halo_user_search_response: MagicMock,
+        halo_api_client: HaloAPIClient,
+    ):
+        failed_response = Response()
+        failed_response.status_code = HTTPStatus.INTERNAL_SERVER_ERROR
+        mock_get.side_effect = [failed_response, halo_user_search_response]
+
+        failed = halo_api_client.get_halo_user("some.bodyfromapi@example.com")  # /PS-IGNORE
+        found = halo_api_client.get_halo_user("some.bodyfromapi@example.com")  # /PS-IGNORE
+
+        assert failed == {}
+        assert found["id"] == 38
+
+    @mock.patch.object(email_utils, "halo_users", email_utils.HaloUserCache(max_size=1, ttl=300))
+    def test_least_recently_used_sender_dropped(
+        self,
+        mock_get: MagicMock,
+        halo_user_search_response: MagicMock,
+        halo_api_client: HaloAPIClient,
+    ):
+        mock_get.return_value = halo_user_search_response
+
+        for sender in ["first@example.com", "second@example.com", "first@example.com"]:
+            halo_api_client.get_halo_user(sender)  # /PS-IGNORE
+
+        assert mock_get.call_count == 3
+
+
+@mock.patch("email_router.ses_email_receiving.email_utils.requests.post")
+class TestHaloTokenReuse:
+    def auth_response(self, access_token, expires_in=3600):
+        response = Response()
+        response.status_code = HTTPStatus.OK
+        response._content = json.dumps(
+            {"token_type": "Bearer", "access_token": access_token, "expires_in": expires_in}
+        ).encode("utf-8")
+        return response
+
+    def api_client(self):
+        return HaloAPIClient(
+            halo_subdomain="foo", halo_client_id="abcdef", halo_client_secret="123456"
+        )
+
+    def test_token_shared_between_clients(self, mock_post: MagicMock):
+        mock_post.return_value = self.auth_response("ABC123")
+
+        first = self.api_client()
+        second = self.api_client()
+
+        assert first.halo_token == second.halo_token == "ABC123"
+        mock_post.assert_called_once()
+
+    def test_expired_token_renewed(self, mock_post: MagicMock):
+        mock_post.side_effect = [
+            self.auth_response("ABC123", expires_in=0),
+            self.auth_response("DEF456"),
+        ]
+
+        api_client = self.api_client()
+
+        assert api_client.halo_token == "DEF456"
+        assert mock_post.call_count == 2
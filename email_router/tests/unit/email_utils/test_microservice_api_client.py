@@ -176,7 +176,8 @@ class TestMicroserviceAPIClient:
         api_client.upload_attachments(parsed_two_attachments_email)
 
         assert mock_zenpy_client.attachments.upload.call_count == len(expected_calls)
-        mock_zenpy_client.attachments.upload.assert_has_calls(expected_calls)
+        # Uploaded at the same time, so in any order
+        mock_zenpy_client.attachments.upload.assert_has_calls(expected_calls, any_order=True)
 
     @mock.patch("email_router.ses_email_receiving.email_utils.Zenpy")
     def test_upload_attachments_returns_upload_tokens(
@@ -188,8 +189,14 @@ class TestMicroserviceAPIClient:
         zendesk_token = "test123"
         api_client = MicroserviceAPIClient(zendesk_email, zendesk_token)
         expected_upload_tokens = [123, 321]
-        upload_objects = [Upload(token=token) for token in expected_upload_tokens]
-        mock_zenpy_client.attachments.upload.side_effect = upload_objects
+        filenames = [upload["filename"] for upload in parsed_two_attachments_email.attachments]
+        upload_objects = {
+            filename: Upload(token=token)
+            for filename, token in zip(filenames, expected_upload_tokens)
+        }
+        mock_zenpy_client.attachments.upload.side_effect = (
+            lambda payload, target_name, content_type: upload_objects[target_name]
+        )
 
         upload_tokens = api_client.upload_attachments(parsed_two_attachments_email)
 
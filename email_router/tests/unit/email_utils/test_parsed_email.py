@@ -1,4 +1,5 @@
 import re
+from dataclasses import FrozenInstanceError
 from datetime import datetime
 from email.message import EmailMessage
 from unittest import mock
@@ -130,3 +131,42 @@ class TestSupplierEmailIdentification:
 
     def test_no_supplier_id_from_parsed_non_supplier_email(self, parsed_reply_to_ticket_email):
         assert parsed_reply_to_ticket_email.supplier_id is None
+
+
+class TestEmailDigest:
+    def test_digest_has_what_clients_need(self, parsed_reply_to_ticket_email: ParsedEmail):
+        digest = parsed_reply_to_ticket_email.digest
+
+        assert digest.subject == parsed_reply_to_ticket_email.subject
+        assert digest.sender_name == parsed_reply_to_ticket_email.sender_name
+        assert digest.sender_email == parsed_reply_to_ticket_email.sender_email
+        assert digest.recipient == parsed_reply_to_ticket_email.recipient
+        assert digest.recipient_email in digest.recipient
+        assert digest.payload == parsed_reply_to_ticket_email.payload
+        assert digest.reply_to_ticket_id == parsed_reply_to_ticket_email.reply_to_ticket_id
+        assert digest.supplier_id is None
+
+    def test_digest_is_immutable(self, parsed_email: ParsedEmail):
+        digest = parsed_email.digest
+
+        with pytest.raises(FrozenInstanceError):
+            digest.subject = "Changed"
+        assert not hasattr(digest, "__dict__")
+
+    def test_digest_built_once(self, parsed_email: ParsedEmail):
+        assert parsed_email.digest is parsed_email.digest
+
+    @mock.patch(
+        "email_router.ses_email_receiving.email_utils.render_markdown", return_value="<p>Hi</p>"
+    )
+    def test_plain_text_rendered_once(
+        self, mock_render_markdown: MagicMock, parsed_plain_text_email: ParsedEmail
+    ):
+        _payload = parsed_plain_text_email.payload  # noqa: F841
+        _digest = parsed_plain_text_email.digest  # noqa: F841
+
+        mock_render_markdown.assert_called_once()
+
+    def test_email_without_body_has_no_digest(self, google_email_without_body: ParsedEmail):
+        with pytest.raises(AttributeError):
+            _digest = google_email_without_body.digest  # noqa: F841
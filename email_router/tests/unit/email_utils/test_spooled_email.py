@@ -0,0 +1,117 @@
+import base64
+import json
+from email.message import EmailMessage
+from io import BytesIO
+from pathlib import Path
+from unittest import mock
+from unittest.mock import MagicMock
+
+import pytest
+from email_router.ses_email_receiving import email_utils
+from email_router.ses_email_receiving.email_utils import (
+    Base64AttachmentBody,
+    HaloAPIClient,
+    ParsedEmail,
+)
+
+FIXTURE_EMAILS = sorted((Path(__file__).parent.parent / "fixtures/emails").glob("*.txt"))
+
+
+def attachment_contents(parsed_email):
+    contents = []
+    for attachment in parsed_email.attachments:
+        payload = attachment["payload"]
+        if hasattr(payload, "read"):
+            payload = payload.read()
+        contents.append((attachment["filename"], attachment["content_type"], payload))
+    return contents
+
+
+def email_with_attachment(content, subtype, cte):
+    message = EmailMessage()
+    message["From"] = "Some Body <somebody@example.com>"  # /PS-IGNORE
+    message["Subject"] = "Attached"
+    message.set_content("See attached")
+    message.add_attachment(content, maintype="application", subtype=subtype, cte=cte)
+    return message.as_bytes()
+
+
+@pytest.mark.parametrize("fixture_path", FIXTURE_EMAILS, ids=lambda path: path.name)
+def test_same_as_parsing_in_memory(fixture_path):
+    in_memory = ParsedEmail(raw_bytes=fixture_path.open("rb"))
+
+    with ParsedEmail.from_stream(fixture_path.open("rb")) as streamed:
+        assert streamed.subject == in_memory.subject
+        assert streamed.sender_email == in_memory.sender_email
+        if in_memory.body is not None:
+            assert streamed.payload == in_memory.payload
+        assert attachment_contents(streamed) == attachment_contents(in_memory)
+
+
+class TestSpooledEmailParser:
+    def test_attachments_spooled(self, two_attachments_email_bytes):
+        with ParsedEmail.from_stream(two_attachments_email_bytes) as parsed_email:
+            assert len(parsed_email.spooled_attachments) == 2
+            # Only the headers of the attachments are left in the message
+            assert all(part.get_payload() == "" for part in parsed_email.message.iter_attachments())
+
+    def test_large_attachments_spooled_to_disk(self, two_attachments_email_bytes):
+        with mock.patch.object(email_utils, "ATTACHMENT_SPOOL_MAX_MEMORY", 1024):
+            parsed_email = ParsedEmail.from_stream(two_attachments_email_bytes)
+
+        assert all(spool._rolled for spool in parsed_email.spooled_attachments)
+        parsed_email.close()
+        assert all(spool.closed for spool in parsed_email.spooled_attachments)
+
+    @pytest.mark.parametrize("cte", ["base64", "quoted-printable", "7bit"])
+    def test_transfer_encodings_decoded(self, cte):
+        content = b"first line\nsecond line with = sign and a long tail" + b"." * 100
+        raw_bytes = email_with_attachment(content, "octet-stream", cte)
+
+        with ParsedEmail.from_stream(BytesIO(raw_bytes)) as parsed_email:
+            [(_, _, payload)] = attachment_contents(parsed_email)
+
+        assert payload == content
+
+    def test_read_in_chunks(self, two_attachments_email_bytes):
+        in_memory = attachment_contents(ParsedEmail(raw_bytes=two_attachments_email_bytes))
+        two_attachments_email_bytes.seek(0)
+
+        with mock.patch.object(email_utils, "STREAM_CHUNK_SIZE", 7):
+            with ParsedEmail.from_stream(two_attachments_email_bytes) as parsed_email:
+                assert attachment_contents(parsed_email) == in_memory
+
+
+class TestBase64AttachmentBody:
+    @pytest.mark.parametrize("content", [b"", b"a", b"ab", b"abc", bytes(range(256)) * 500])
+    def test_same_as_encoding_in_memory(self, content):
+        fields = {"filename": "file.bin", "isimage": False, "ticket_id": 123}
+        body = Base64AttachmentBody(fields, "application/octet-stream", BytesIO(content))
+
+        chunks = []
+        while chunk := body.read(1000):
+            chunks.append(chunk)
+
+        encoded = b"".join(chunks)
+        assert len(encoded) == len(body)
+        [payload] = json.loads(encoded)
+        assert payload == dict(
+            fields,
+            data_base64="data:application/octet-stream;base64,"
+            + base64.b64encode(content).decode("ascii"),  # /PS-IGNORE
+        )
+
+
+@mock.patch("email_router.ses_email_receiving.email_utils.requests.post")
+def test_halo_upload_streams_spooled_attachment(
+    mock_post: MagicMock, halo_upload_response, halo_api_client: HaloAPIClient
+):
+    mock_post.return_value = halo_upload_response
+
+    halo_api_client.upload_attachment(
+        payload=BytesIO(b"hello"), target_name="hello.txt", content_type="text/plain"
+    )
+
+    body = mock_post.call_args.kwargs["data"]
+    assert isinstance(body, Base64AttachmentBody)
+    assert json.loads(body.read())[0]["data_base64"] == "data:text/plain;base64,aGVsbG8="
@@ -0,0 +1,106 @@
+import threading
+from email.message import EmailMessage
+from unittest import mock
+
+import pytest
+from email_router.ses_email_receiving import email_utils
+from email_router.ses_email_receiving.email_utils import (
+    BaseAPIClient,
+    HaloAPIClient,
+    ParsedEmail,
+)
+
+
+class RecordingAPIClient(BaseAPIClient):
+    def __init__(self, upload=None) -> None:
+        super().__init__()
+        self.uploaded = []
+        self.upload = upload or (lambda target_name: None)
+
+    def upload_attachment(self, payload, target_name, content_type, ticket_id=None, **kwargs):
+        self.uploaded.append(target_name)
+        self.upload(target_name)
+        return HaloAPIClient.Upload(token=target_name)
+
+    def create_ticket(self, message, upload_tokens):
+        pass
+
+    def update_ticket(self, message, upload_tokens, ticket_id):
+        pass
+
+
+def email_with_attachments(*attachments):
+    message = EmailMessage()
+    message["From"] = "Some Body <somebody@example.com>"  # /PS-IGNORE
+    message["Subject"] = "Attached"
+    message.set_content("See attached")
+    for filename, content in attachments:
+        message.add_attachment(
+            content, maintype="application", subtype="octet-stream", filename=filename
+        )
+    return ParsedEmail(raw_bytes=None, message=message)
+
+
+def test_tokens_in_attachment_order():
+    second_uploaded = threading.Event()
+
+    def upload(target_name):
+        # The first attachment finishes uploading last
+        if target_name == "1.dat":
+            assert second_uploaded.wait(timeout=5)
+        else:
+            second_uploaded.set()
+
+    api_client = RecordingAPIClient(upload)
+
+    upload_tokens = api_client.upload_attachments(
+        email_with_attachments(("1.dat", b"one"), ("2.dat", b"two"))
+    )
+
+    assert upload_tokens == ["1.dat", "2.dat"]
+
+
+def test_duplicate_attachments_uploaded_once():
+    api_client = RecordingAPIClient()
+
+    upload_tokens = api_client.upload_attachments(
+        email_with_attachments(("1.dat", b"one"), ("2.dat", b"two"), ("copy.dat", b"one"))
+    )
+
+    assert upload_tokens == ["1.dat", "2.dat"]
+
+
+def test_spooled_duplicate_attachments_uploaded_once(two_attachments_email_bytes):
+    api_client = RecordingAPIClient()
+    with ParsedEmail.from_stream(two_attachments_email_bytes) as parsed_email:
+        attachment = next(parsed_email.attachments)
+        parsed_email.message.add_attachment(
+            attachment["payload"].read(),
+            maintype="image",
+            subtype="jpeg",
+            filename="copy.jpg",
+        )
+
+        upload_tokens = api_client.upload_attachments(parsed_email)
+
+    assert len(upload_tokens) == 2
+    assert "copy.jpg" not in upload_tokens
+
+
+@mock.patch.object(email_utils, "MAX_UPLOAD_WORKERS", 1)
+def test_failed_upload_cancels_the_rest():
+    def upload(target_name):
+        raise ConnectionError(f"{target_name} not uploaded")
+
+    api_client = RecordingAPIClient(upload)
+
+    with pytest.raises(ConnectionError, match="1.dat not uploaded"):
+        api_client.upload_attachments(
+            email_with_attachments(("1.dat", b"one"), ("2.dat", b"two"), ("3.dat", b"three"))
+        )
+
+    assert api_client.uploaded == ["1.dat"]
+
+
+def test_email_without_attachments_uploads_nothing():
+    assert RecordingAPIClient().upload_attachments(email_with_attachments()) == []
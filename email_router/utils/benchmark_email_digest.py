@@ -0,0 +1,48 @@
+"""
+Times parsing each of the fixture emails and working out what the API clients need of it.
+
+    python -m email_router.utils.benchmark_email_digest [--number N]
+"""
+
+import argparse
+import timeit
+from pathlib import Path
+
+from email_router.ses_email_receiving.email_utils import ParsedEmail
+
+FIXTURES_DIR = Path(__file__).parent.parent / "tests/unit/fixtures/emails"
+
+
+class DigestBenchmark:
+    def __init__(self, number) -> None:
+        super().__init__()
+        self.number = number
+
+    def time(self, statement):
+        # In microseconds per run
+        return timeit.timeit(statement, number=self.number) / self.number * 1_000_000
+
+    def parse(self, fixture_path: Path):
+        with open(fixture_path, "rb") as file:
+            return ParsedEmail.from_stream(file)
+
+    def digest(self, fixture_path: Path):
+        with self.parse(fixture_path) as parsed_email:
+            try:
+                return parsed_email.digest
+            except AttributeError:
+                # No body
+                return None
+
+    def run(self):
+        print(f"{'email':<40} {'parse µs':>10} {'digest µs':>10}")
+        for fixture_path in sorted(FIXTURES_DIR.glob("*.txt")):
+            parse = self.time(lambda: self.parse(fixture_path).close())
+            digest = self.time(lambda: self.digest(fixture_path)) - parse
+            print(f"{fixture_path.name:<40} {parse:>10.0f} {digest:>10.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--number", type=int, default=200, help="Runs for each email")
+    DigestBenchmark(parser.parse_args().number).run()
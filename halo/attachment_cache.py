@@ -0,0 +1,94 @@
+"""
+AV verdicts and Halo attachment IDs, by the SHA-256 of the file's content,
+so the same attachments, e.g. email signature logos, aren't scanned and uploaded
+over and over.
+
+Verdicts are kept under the version of the AV signatures they were made with,
+so files are scanned again once the signatures are updated; if the version isn't
+known, verdicts aren't cached at all. Entries expire after ATTACHMENT_CACHE_TIMEOUT.
+"""
+
+import hashlib
+import logging
+
+from django.conf import settings
+from django.core.cache import caches
+
+from help_desk_api.metrics import Counter, Ratio
+
+logger = logging.getLogger(__name__)
+
+verdict_hits = Counter("attachment_cache.verdict_hits")
+verdict_misses = Counter("attachment_cache.verdict_misses")
+upload_hits = Counter("attachment_cache.upload_hits")
+upload_misses = Counter("attachment_cache.upload_misses")
+upload_hit_ratio = Ratio(
+    "attachment_cache.upload_hit_ratio",
+    numerators=[upload_hits],
+    denominators=[upload_hits, upload_misses],
+)
+
+
+class ContentHasher:
+    """
+    Hashes a file as its chunks are fed in
+    """
+
+    def __init__(self):
+        self.sha256 = hashlib.sha256()
+
+    def feed(self, chunk):
+        self.sha256.update(chunk)
+
+    def hexdigest(self):
+        return self.sha256.hexdigest()
+
+
+def attachment_cache():
+    return caches[settings.ATTACHMENT_CACHE]
+
+
+def verdict_cache_key(digest, definitions_version):
+    return f"av_verdict:{definitions_version}:{digest}"
+
+
+def halo_attachment_cache_key(digest):
+    return f"halo_attachment:{digest}"
+
+
+def cached_verdict(digest, definitions_version):
+    """
+    :returns: Whether the file was found clean by those signatures, or None if unknown
+    """
+    if definitions_version is None:
+        return None
+    verdict = attachment_cache().get(verdict_cache_key(digest, definitions_version), None)
+    if verdict is None:
+        verdict_misses.increment()
+    else:
+        verdict_hits.increment()
+    return verdict
+
+
+def cache_verdict(digest, definitions_version, passed):
+    if definitions_version is not None:
+        attachment_cache().set(verdict_cache_key(digest, definitions_version), passed)
+
+
+def cached_halo_attachment(digest):
+    """
+    :returns: Halo's response to uploading the file before, or None
+    """
+    halo_attachment = attachment_cache().get(halo_attachment_cache_key(digest), None)
+    if halo_attachment is None:
+        upload_misses.increment()
+    else:
+        logger.info(f"Reusing Halo attachment {halo_attachment['id']}")
+        upload_hits.increment()
+    return halo_attachment
+
+
+def cache_halo_attachment(digest, halo_response):
+    # Only the ID is used, and the response may include the whole file
+    if isinstance(halo_response, dict) and "id" in halo_response:
+        attachment_cache().set(halo_attachment_cache_key(digest), {"id": halo_response["id"]})
@@ -1,9 +1,21 @@
+import contextvars
 import logging
 import pathlib
+import queue
+import socket
+import struct
+import threading
+import time
+import uuid
 from base64 import b64encode
+from contextlib import contextmanager
 
 import requests
 from django.conf import settings
+from halo.attachment_cache import ContentHasher, cache_verdict, cached_verdict
+
+from help_desk_api.circuit_breaker import clam_av_breaker
+from help_desk_api.deadlines import upstream_timeout
 
 logger = logging.getLogger(__name__)
 
@@ -15,6 +27,17 @@ CLAM_AV_HOST = settings.CLAM_AV_HOST
 
 CLAM_AV_PATH = "/"
 
+# Files are read and scanned in chunks this big
+SCAN_CHUNK_SIZE = 64 * 1024  # bytes
+# Chunks waiting to be sent to the REST endpoint; bounds the memory used by a scan
+REST_SCAN_QUEUE_CHUNKS = 16
+REST_SCAN_QUEUE_POLL = 1  # seconds
+# How long the signature version asked of clamd is remembered
+AV_DEFINITIONS_VERSION_TIMEOUT = 5 * 60  # seconds
+
+# Connections to the REST endpoint are kept for reuse
+session = requests.Session()
+
 # Add/remove file extensions for files that you do not want to scan
 CLAM_AV_IGNORE_EXTENSIONS = [".png", ".pdf"]
 
@@ -40,49 +63,271 @@ def skip_file_extension(file_name):
 # Prior to accessing clam_av service check that service is reachable
 # Makes a GET request to the av host endpoint
 def check_av_service(CLAM_AV_HOST, CLAM_AV_PATH):
-    response = requests.get(f"http://{CLAM_AV_HOST}/{CLAM_AV_PATH}")
+    response = clam_av_breaker.call(
+        lambda: requests.get(
+            f"http://{CLAM_AV_HOST}/{CLAM_AV_PATH}",
+            timeout=upstream_timeout(),
+        ),
+    )
     if response.status_code == 200:
         return "OK"
     else:
         return "NOT OK"
 
 
-def av_scan_file(file_name):
+def av_result(av_results, file_name):
     """
-    Function that POSTs a file to av service for scanning
+    :returns: Whether the REST endpoint found the file clean
     """
-    credentials = b64encode(
-        bytes(
-            f"{CLAM_AV_USERNAME}:{CLAM_AV_PASSWORD}",
-            encoding="utf8",
-        )
-    ).decode("ascii")
-
-    response = requests.post(
-        CLAM_AV_URL,
-        headers={
-            "Authorization": f"Basic {credentials}",
-        },
-        files={"file": open(file_name, "rb")},
-    )
-
-    av_results = response.json()
-
     if "malware" not in av_results:
         msg = "Malformed response from AV server"
         logger.warning(msg)
-        av_passed = False
 
         raise MalformedAntiVirusResponseException()
 
     if av_results["malware"]:
-        av_passed = False
-        # av_reason = av_results["reason"]
         msg = f"Malware found in user uploaded file {file_name}, \
         exiting upload process"
         logger.warning(msg)
-        av_passed = False
-    else:
-        av_passed = True
+        return False
+    return True
+
+
+@contextmanager
+def av_service_errors(action):
+    """
+    Raise errors talking to the AV service, e.g. a refused connection or a timeout,
+    as AntiVirusServiceErrorException
+    """
+    try:
+        yield
+    except (OSError, requests.RequestException) as exp:
+        raise AntiVirusServiceErrorException(f"{action} failed: {exp}") from exp
+
+
+class ClamdScanner:
+    """
+    Scans a file with clamd's INSTREAM command, as its chunks are fed in
+    """
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        with av_service_errors("Connecting to clamd"):
+            self.socket = socket.create_connection(
+                (settings.CLAMD_HOST, settings.CLAMD_PORT), timeout=upstream_timeout()
+            )
+            self.socket.sendall(b"zINSTREAM\0")
+
+    def feed(self, chunk):
+        with av_service_errors("Sending to clamd"):
+            self.socket.sendall(struct.pack("!L", len(chunk)))
+            self.socket.sendall(chunk)
+
+    def verdict(self):
+        with av_service_errors("Reading clamd's verdict"):
+            self.socket.sendall(struct.pack("!L", 0))
+            reply = b""
+            while not reply.endswith(b"\0"):
+                received = self.socket.recv(1024)
+                if not received:
+                    break
+                reply += received
+        # e.g. "stream: OK", "stream: Win.Test.EICAR_HDB-1 FOUND"
+        reply = reply.rstrip(b"\0").decode("utf-8", errors="replace")
+        if reply.endswith(" OK"):
+            return True
+        if reply.endswith(" FOUND"):
+            logger.warning(f"Malware found in user uploaded file {self.file_name}: {reply}")
+            return False
+        raise AntiVirusServiceErrorException(f"clamd error: {reply}")
+
+    def close(self):
+        self.socket.close()
+
+
+class RestScanner:
+    """
+    Scans a file with the AV REST endpoint, as its chunks are fed in.
+    The multipart body is streamed to the endpoint over a pooled connection
+    from another thread, which takes the chunks from a bounded queue.
+    """
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self.boundary = uuid.uuid4().hex
+        self.chunks = queue.Queue(maxsize=REST_SCAN_QUEUE_CHUNKS)
+        self.abandoned = threading.Event()
+        self.response = None
+        self.error = None
+        self.thread = threading.Thread(
+            target=contextvars.copy_context().run, args=(self.post,), daemon=True
+        )
+        self.thread.start()
+
+    def body(self):
+        name = pathlib.Path(str(self.file_name)).name.replace('"', "")
+        yield (
+            f"--{self.boundary}\r\n"
+            f'Content-Disposition: form-data; name="file"; filename="{name}"\r\n'
+            "Content-Type: application/octet-stream\r\n\r\n"
+        ).encode("utf-8")
+        while (chunk := self.next_chunk()) is not None:
+            yield chunk
+        yield f"\r\n--{self.boundary}--\r\n".encode("utf-8")
+
+    def next_chunk(self):
+        while True:
+            try:
+                return self.chunks.get(timeout=REST_SCAN_QUEUE_POLL)
+            except queue.Empty:
+                if self.abandoned.is_set():
+                    # Ends the request without the endpoint getting a whole file to scan
+                    raise AntiVirusServiceErrorException("AV scan abandoned")
 
-    return av_passed
+    def post(self):
+        credentials = b64encode(
+            bytes(
+                f"{CLAM_AV_USERNAME}:{CLAM_AV_PASSWORD}",
+                encoding="utf8",
+            )
+        ).decode("ascii")
+        try:
+            self.response = session.post(
+                CLAM_AV_URL,
+                headers={
+                    "Authorization": f"Basic {credentials}",
+                    "Content-Type": f"multipart/form-data; boundary={self.boundary}",
+                },
+                data=self.body(),
+                timeout=upstream_timeout(),
+            )
+        except Exception as exp:
+            self.error = exp
+
+    def feed(self, chunk):
+        while True:
+            try:
+                self.chunks.put(chunk, timeout=REST_SCAN_QUEUE_POLL)
+                return
+            except queue.Full:
+                # Don't wait for ever on a request that's given up
+                if not self.thread.is_alive():
+                    self.raise_error()
+                    raise AntiVirusServiceErrorException("AV request ended early")
+
+    def verdict(self):
+        self.feed(None)
+        self.thread.join()
+        self.raise_error()
+        return av_result(self.response.json(), self.file_name)
+
+    def raise_error(self):
+        if self.error is not None:
+            with av_service_errors("AV request"):
+                raise self.error
+
+    def close(self):
+        if self.thread.is_alive():
+            # Abandon the request, so the thread isn't left waiting for chunks
+            self.abandoned.set()
+            while True:
+                try:
+                    self.chunks.get_nowait()
+                except queue.Empty:
+                    break
+
+
+_definitions_version = (0.0, None)
+_definitions_version_lock = threading.Lock()
+
+
+def av_definitions_version():
+    """
+    :returns: The version of the AV signatures, e.g. clamd's daily database number,
+        or None if it isn't known
+    """
+    global _definitions_version
+    if settings.AV_DEFINITIONS_VERSION:
+        return settings.AV_DEFINITIONS_VERSION
+    if not settings.CLAMD_HOST:
+        return None
+    with _definitions_version_lock:
+        expires_at, version = _definitions_version
+        if expires_at > time.monotonic():
+            return version
+        try:
+            version = clamd_version()
+        except (OSError, ValueError, IndexError) as exp:
+            logger.warning(f"Couldn't get clamd version: {exp}")
+            version = None
+        _definitions_version = (time.monotonic() + AV_DEFINITIONS_VERSION_TIMEOUT, version)
+        return version
+
+
+def clamd_version():
+    with socket.create_connection(
+        (settings.CLAMD_HOST, settings.CLAMD_PORT), timeout=upstream_timeout()
+    ) as connection:
+        connection.sendall(b"zVERSION\0")
+        reply = b""
+        while not reply.endswith(b"\0"):
+            received = connection.recv(1024)
+            if not received:
+                break
+            reply += received
+    # e.g. "ClamAV 1.0.5/27431/Tue Oct 15 08:36:01 2024"
+    return reply.rstrip(b"\0").decode("utf-8").split("/")[1]
+
+
+def new_scanner(file_name):
+    if settings.CLAMD_HOST:
+        return ClamdScanner(file_name)
+    if CLAM_AV_URL:
+        return RestScanner(file_name)
+    raise AntiVirusServiceErrorException("No AV service configured")
+
+
+def scan_stream(stream, file_name):
+    """
+    Scan a file-like object, reading it once, in chunks
+
+    :returns: Whether the file is clean
+    """
+
+    def scan():
+        scanner = new_scanner(file_name)
+        try:
+            while chunk := stream.read(SCAN_CHUNK_SIZE):
+                scanner.feed(chunk)
+            return scanner.verdict()
+        finally:
+            scanner.close()
+
+    return clam_av_breaker.call(scan)
+
+
+def scan_stream_cached(stream, file_name, digest):
+    """
+    scan_stream, but a file that's been scanned with the current signatures before
+    isn't read, or sent to the AV service, again
+
+    :param digest: The file's ContentHasher hexdigest
+    """
+    definitions_version = av_definitions_version()
+    if (passed := cached_verdict(digest, definitions_version)) is not None:
+        return passed
+    passed = scan_stream(stream, file_name)
+    cache_verdict(digest, definitions_version, passed)
+    return passed
+
+
+def av_scan_file(file_name):
+    """
+    Function that scans a file with the av service
+    """
+    with open(file_name, "rb") as file:
+        hasher = ContentHasher()
+        while chunk := file.read(SCAN_CHUNK_SIZE):
+            hasher.feed(chunk)
+        file.seek(0)
+        return scan_stream_cached(file, file_name, hasher.hexdigest())
@@ -7,6 +7,12 @@ import sentry_sdk
 from django.conf import settings
 from django.core.cache import cache
 
+from help_desk_api.circuit_breaker import halo_breaker
+from help_desk_api.deadlines import upstream_timeout
+from help_desk_api.hedging import Hedged
+from help_desk_api.outbound_budget import halo_budget
+from help_desk_api.single_flight import SingleFlight
+
 
 class HaloRecordNotFoundException(Exception):
     pass
@@ -22,18 +28,24 @@ class HaloClientBadRequestException(Exception):
 
 logger = logging.getLogger(__name__)
 
+# Identical concurrent GETs share one Halo request
+halo_reads = SingleFlight("halo_get")
+# Slow GETs are sent again, and the first response used
+halo_hedging = Hedged("halo_get", "HALO_HEDGE_REQUESTS", "HALO_HEDGE_DELAY", "HALO_HEDGE_BUDGET")
+
 
 class HaloAPIClient:
     def __init__(self, client_id, client_secret) -> None:
+        self.client_id = client_id
         self.access_token = self.__authenticate(client_id, client_secret)
 
     def __authenticate(self, client_id, client_secret):
         # print("client_id=", client_id)
         # print("client_secret=", client_secret)
 
-        if cache.get("access_token", None):
+        if cached_token := cache.get("access_token", None):
             logger.error("Using cached Halo token")
-            return cache.get("access_token")
+            return cached_token
 
         data = {
             "grant_type": "client_credentials",
@@ -42,15 +54,11 @@ class HaloAPIClient:
             "scope": "all",
         }
         logger.error("Requesting Halo token")
-        response = requests.post(
-            f"https://{settings.HALO_SUBDOMAIN}.haloitsm.com/auth/token",
-            data=data,
-            headers={
-                "Content-Type": "application/x-www-form-urlencoded",
-                "Accept": "application/json",
-            },
+        response = halo_breaker.call(
+            lambda: self.__request_token(data),
         )
         logger.error("Completed request for Halo token")
+        halo_budget.observe(response)
         if response.status_code != 200:
             message = f"{response.status_code} response from auth endpoint"
             sentry_sdk.capture_message(message)
@@ -62,36 +70,75 @@ class HaloAPIClient:
         cache.set("access_token", response_data["access_token"], 3000)
         return response_data["access_token"]
 
+    def __request_token(self, data):
+        halo_budget.acquire()
+        return requests.post(
+            f"https://{settings.HALO_SUBDOMAIN}.haloitsm.com/auth/token",
+            data=data,
+            headers={
+                "Content-Type": "application/x-www-form-urlencoded",
+                "Accept": "application/json",
+            },
+            timeout=upstream_timeout(settings.HALO_TOKEN_TIMEOUT),
+        )
+
     def get(self, path, params=None):
         if params is None:
             params = {}
+        key = (self.client_id, "GET", path, tuple(sorted((k, str(v)) for k, v in params.items())))
+        return halo_reads.do(key, lambda: halo_hedging.do(lambda: self._get(path, params)))
+
+    def _get(self, path, params):
         logger.info(f"Making Halo GET: {path}, params={params}")
-        response = requests.get(
-            f"https://{settings.HALO_SUBDOMAIN}.haloitsm.com/api/{path}",
-            params=params,
-            headers={
-                "Authorization": f"Bearer {self.access_token}",
-            },
+        response = halo_breaker.call(
+            lambda: self.__request(
+                requests.get,
+                path,
+                params=params,
+                headers={
+                    "Authorization": f"Bearer {self.access_token}",
+                },
+            )
         )
         logger.info(f"Completed Halo GET: {response.url}")
+        halo_budget.observe(response)
         # TODO error handling
         if response.status_code != 200:
             logger.error(f"{response.status_code} response from get endpoint")
             raise HaloClientNotFoundException()
         return response.json()
 
+    def __request(self, method, path, **kwargs):
+        # Only once the breaker lets the request through does it take from the budget
+        halo_budget.acquire()
+        return method(
+            f"https://{settings.HALO_SUBDOMAIN}.haloitsm.com/api/{path}",
+            timeout=upstream_timeout(),
+            **kwargs,
+        )
+
     def post(self, path, payload):
         logger.warning(f"Halo POST: https://{settings.HALO_SUBDOMAIN}.haloitsm.com/api/{path}")
         logger.warning(json.dumps(payload))
-        response = requests.post(
-            f"https://{settings.HALO_SUBDOMAIN}.haloitsm.com/api/{path}",
-            data=json.dumps(payload),
-            headers={
-                "Authorization": f"Bearer {self.access_token}",
-                "Content-Type": "application/json",
-            },
+        return self.post_body(path, json.dumps(payload))
+
+    def post_body(self, path, body):
+        """
+        :param body: The JSON payload, serialised, or a file containing it, which is streamed
+        """
+        response = halo_breaker.call(
+            lambda: self.__request(
+                requests.post,
+                path,
+                data=body,
+                headers={
+                    "Authorization": f"Bearer {self.access_token}",
+                    "Content-Type": "application/json",
+                },
+            )
         )
         logger.error("Completed Halo POST")
+        halo_budget.observe(response)
         logger.error(response)
         if response.status_code != HTTPStatus.CREATED:
             logger.error(f"{response.status_code} response from POST endpoint")
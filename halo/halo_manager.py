@@ -1,11 +1,25 @@
 import base64
+import hashlib
 import logging
+from datetime import datetime, timezone
 
 from django.conf import settings
+from django.core.cache import caches
+from halo.attachment_cache import cache_halo_attachment, cached_halo_attachment
 from halo.data_class import ZendeskTicketNotFoundException
-from halo.halo_api_client import HaloAPIClient, HaloRecordNotFoundException
+from halo.halo_api_client import (
+    HaloAPIClient,
+    HaloClientBadRequestException,
+    HaloClientNotFoundException,
+    HaloRecordNotFoundException,
+)
+from halo.upload_pipeline import spooled_upload
 
+from help_desk_api import ticket_cache
+from help_desk_api.deadlines import DeadlineExceeded
+from help_desk_api.scan_queue import attach_when_scanned, resolve_upload_tokens
 from help_desk_api.serializers import (
+    ZendeskFieldsNotSupportedException,
     ZendeskToHaloCreateAgentSerializer,
     ZendeskToHaloCreateCommentSerializer,
     ZendeskToHaloCreateTeamSerializer,
@@ -39,6 +53,39 @@ PRIORITY_MAPPING = {
 logger = logging.getLogger(__name__)
 
 
+def parse_halo_datetime(value: str) -> datetime:
+    """
+    Halo sends timestamps like 2023-11-09T15:48:39.5816272Z,
+    which have more fractional digits than `datetime.fromisoformat` accepts
+    """
+    value = value.rstrip("Z")
+    if "." in value:
+        whole, fraction = value.split(".", 1)
+        value = f"{whole}.{fraction[:6]}"
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+def halo_user_cache_key(email: str) -> str:
+    return f"halo_user:{email.lower()}"
+
+
+def users_by_email(zendesk_users: list[dict]) -> list[tuple]:
+    """
+    :returns: For each user, its lower case email or None, the indexes of its records,
+        and their fields together, the last winning; users without an email are each on their own
+    """
+    users = {}
+    for index, user_data in enumerate(zendesk_users):
+        email = (user_data.get("email", None) or "").lower() or None
+        _, indexes, merged = users.setdefault(email or index, (email, [], {}))
+        indexes.append(index)
+        merged.update(user_data)
+    return list(users.values())
+
+
 class HaloManager:
     def __init__(self, client_id, client_secret):
         """Create a new Halo client - pass credentials to.
@@ -116,6 +163,97 @@ class HaloManager:
             existing_user = search_results["users"][0]
         return existing_user
 
+    def create_or_update_users(self, zendesk_users: list[dict]) -> tuple[list, list]:
+        """
+        As `create_user` does for one user, find the existing Halo user for each Zendesk user,
+        then update those found and create the rest with batched Halo requests.
+        Existing users are found by email with one lookup in the user data cache;
+        only those not found there are searched for in Halo.
+        Records with the same email are one user: the first says whether it's created,
+        the rest are updates of it, and their fields are sent together, the last winning.
+        :returns: For each Zendesk user, in order, an action, "create" or "update",
+            and either the Halo user or the exception that stopped it being saved.
+        """
+        users = users_by_email(zendesk_users)
+        known_users = caches[settings.USER_DATA_CACHE].get_many(
+            [halo_user_cache_key(email) for email, _, _ in users if email]
+        )
+        actions = ["update"] * len(zendesk_users)
+        outcomes = [None] * len(zendesk_users)
+        merged_users = list(zendesk_users)
+        payloads = {}
+        for email, indexes, user_data in users:
+            for index in indexes:
+                merged_users[index] = user_data
+            try:
+                existing_user = self.find_existing_user(email, user_data, known_users)
+                halo_user = ZendeskToHaloCreateUserSerializer(user_data).data
+            except Exception as exp:
+                # Only this user's outcome
+                logger.warning(f"Couldn't save Halo user {email or indexes[0]}: {exp}")
+                for index in indexes:
+                    outcomes[index] = exp
+                continue
+            if existing_user is None:
+                actions[indexes[0]] = "create"
+            else:
+                # Not moved from whichever site it's on
+                halo_user.pop("site_id", None)
+                halo_user["id"] = existing_user["id"]
+            payloads[tuple(indexes)] = halo_user
+        halo_users = self.post_in_batches("Users", list(payloads.values()))
+        for indexes, halo_user in zip(payloads.keys(), halo_users):
+            for index in indexes:
+                outcomes[index] = halo_user
+        self.save_user_mappings(merged_users, outcomes)
+        return actions, outcomes
+
+    def find_existing_user(self, email, user_data: dict, known_users: dict):
+        """
+        :param email: Lower case, or None
+        :param known_users: Halo users from the user data cache, by `halo_user_cache_key`
+        :returns: The Halo user, or None
+        """
+        if not email:
+            return None
+        if (existing_user := known_users.get(halo_user_cache_key(email), None)) is not None:
+            return existing_user
+        if user_data.get("id", None) is None:
+            return self.search_for_existing_user(search_term=email)
+        return None
+
+    def save_user_mappings(self, zendesk_users: list[dict], outcomes: list):
+        """
+        Remember each Halo user by email, for `create_or_update_users`,
+        and, as the proxy middleware does for a single user,
+        the Zendesk user data by Halo user ID for `fix_user_fields`.
+        """
+        mappings = {}
+        for user_data, halo_user in zip(zendesk_users, outcomes):
+            if isinstance(halo_user, Exception):
+                continue
+            if email := user_data.get("email", None):
+                mappings[halo_user_cache_key(email)] = {
+                    key: halo_user.get(key, None) for key in ("id", "name", "emailaddress")
+                }
+            mappings[halo_user["id"]] = {"user": user_data}
+        if mappings:
+            caches[settings.USER_DATA_CACHE].set_many(mappings)
+
+    def get_users_by_id(self, user_ids: list) -> list[dict]:
+        """
+        Halo's Users endpoint can't be filtered by a list of IDs,
+        so each distinct user is read once.
+        Users that can't be found are left out, as Zendesk does.
+        """
+        users = []
+        for user_id in dict.fromkeys(user_ids):
+            try:
+                users.append(self.get_user(user_id))
+            except HaloClientNotFoundException:
+                logger.warning(f"Halo user {user_id} not found")
+        return users
+
     def create_agent(self, zendesk_request: dict = None) -> dict:
         """
         Receive Zendesk agent and create agent in Halo, give back Zendesk agent.
@@ -139,12 +277,18 @@ class HaloManager:
         return halo_user
 
     def get_ticket(self, ticket_id: int = None) -> dict:
-        """Recover the ticket by Halo ID.
+        """Recover the ticket by Halo ID, from the ticket cache if possible.
         :param ticket_id: The Halo ID of the Ticket.
         :returns: A HelpDeskTicket instance.
         :raises:
             HelpDeskTicketNotFoundException: If no ticket is found.
         """
+        return ticket_cache.get_ticket(self.client.client_id, ticket_id, self.fetch_ticket)
+
+    def fetch_ticket(self, ticket_id: int = None) -> dict:
+        """
+        Read the ticket, with its attachments, from Halo
+        """
         logger.debug(f"Look for Ticket by is Halo ID: <{ticket_id}>")  # /PS-IGNORE
         try:
             # 3. Manager calls Halo API and
@@ -166,10 +310,42 @@ class HaloManager:
         if zendesk_request is None:
             zendesk_request = {}
         ticket_data = zendesk_request.get("ticket", {})
+        if zendesk_request.get("zendesk_ticket_id", None) is not None:
+            ticket_data = dict(ticket_data, zendesk_ticket_id=zendesk_request["zendesk_ticket_id"])
+        ticket_data, waiting_uploads = self.without_pending_uploads(ticket_data)
         halo_payload = ZendeskToHaloCreateTicketSerializer(ticket_data)
         halo_response = self.client.post(path="Tickets", payload=[halo_payload.data])
+        self.attach_when_scanned(waiting_uploads, halo_response)
         return halo_response
 
+    def without_pending_uploads(self, ticket_data: dict):
+        """
+        Take uploads that are still being scanned for viruses out of a Zendesk ticket,
+        and swap those that have passed for their Halo attachment IDs
+        :returns: The ticket, and the tokens of the uploads taken out
+        """
+        comment = ticket_data.get("comment", None)
+        if not isinstance(comment, dict) or not comment.get("uploads", None):
+            return ticket_data, []
+        uploads, waiting_uploads = resolve_upload_tokens(comment["uploads"])
+        return dict(ticket_data, comment=dict(comment, uploads=uploads)), waiting_uploads
+
+    def attach_when_scanned(self, upload_tokens: list, halo_ticket: dict):
+        if not upload_tokens or not isinstance(halo_ticket, dict):
+            return
+        try:
+            attach_when_scanned(upload_tokens, halo_ticket["id"], self.attach_to_ticket)
+        except Exception as exp:
+            # The ticket's been created, so this doesn't fail the request
+            logger.exception(f"Couldn't attach uploads {upload_tokens}: {exp}")
+
+    def attach_to_ticket(self, ticket_id: int, attachment_ids: list):
+        self.client.post(
+            path="Tickets",
+            payload=[{"id": ticket_id, "attachments": [{"id": id} for id in attachment_ids]}],
+        )
+        ticket_cache.invalidate_tickets([ticket_id])
+
     def update_ticket(self, zendesk_request: dict = None) -> dict:
         """Update an existing ticket.
         :param zendesk_request: HelpDeskTicket ticket.
@@ -188,6 +364,8 @@ class HaloManager:
             logger.error(message)
             raise ZendeskTicketNotFoundException(message)
 
+        ticket_cache.invalidate_tickets([updated_ticket["id"]])
+
         if "ticket" in zendesk_request and "comment" in zendesk_request["ticket"]:
             if "id" in zendesk_request["ticket"]["comment"]:
                 zendesk_request["ticket_id"] = updated_ticket["id"]
@@ -204,6 +382,121 @@ class HaloManager:
 
         return updated_ticket
 
+    def create_tickets(self, zendesk_tickets: list[dict]) -> list:
+        """
+        Create tickets in batches rather than one Halo request per ticket.
+        :returns: For each Zendesk ticket, in order,
+            either the created Halo ticket or the exception that stopped it being created.
+        """
+        outcomes = [None] * len(zendesk_tickets)
+        payloads = {}
+        waiting_uploads = {}
+        for index, ticket_data in enumerate(zendesk_tickets):
+            try:
+                ticket_data, waiting_uploads[index] = self.without_pending_uploads(ticket_data)
+                payloads[index] = ZendeskToHaloCreateTicketSerializer(ticket_data).data
+            except ZendeskFieldsNotSupportedException as exp:
+                outcomes[index] = exp
+        halo_tickets = self.post_in_batches("Tickets", list(payloads.values()))
+        for index, halo_ticket in zip(payloads.keys(), halo_tickets):
+            outcomes[index] = halo_ticket
+            self.attach_when_scanned(waiting_uploads[index], halo_ticket)
+        return outcomes
+
+    def update_tickets(self, zendesk_tickets: list[dict]) -> list:
+        """
+        Update tickets, and add any comments to them, in batches.
+        Each Zendesk ticket needs its "id", which may be a Zendesk ID if dual-running.
+        :returns: For each Zendesk ticket, in order,
+            either {"id": <Halo ticket ID>} or the exception that stopped it being updated.
+        """
+        halo_ticket_ids = self.get_halo_ticket_ids([ticket["id"] for ticket in zendesk_tickets])
+        outcomes = [{"id": halo_ticket_ids[ticket["id"]]} for ticket in zendesk_tickets]
+        ticket_payloads = {}
+        comment_payloads = {}
+        for index, ticket_data in enumerate(zendesk_tickets):
+            ticket_fields = {
+                key: value for key, value in ticket_data.items() if key not in ("id", "comment")
+            }
+            try:
+                if ticket_fields:
+                    ticket_payloads[index] = ZendeskToHaloUpdateTicketSerializer(
+                        {"ticket_id": outcomes[index]["id"], "ticket": ticket_fields}
+                    ).data
+                if "comment" in ticket_data:
+                    # The serializer pops "recipient", so give it a copy
+                    comment_payloads[index] = (
+                        ZendeskToHaloCreateCommentSerializer().to_representation(dict(ticket_data))
+                    )
+            except ZendeskFieldsNotSupportedException as exp:
+                outcomes[index] = exp
+                ticket_payloads.pop(index, None)
+        for path, payloads in (("Tickets", ticket_payloads), ("Actions", comment_payloads)):
+            results = self.post_in_batches(path, list(payloads.values()))
+            for index, result in zip(payloads.keys(), results):
+                if isinstance(result, Exception) and not isinstance(outcomes[index], Exception):
+                    outcomes[index] = result
+        # Even those that failed, as a batch may have been partly applied
+        ticket_cache.invalidate_tickets(halo_ticket_ids.values())
+        return outcomes
+
+    def get_tickets_by_id(self, ticket_ids: list) -> list[dict]:
+        """
+        Read several tickets, `HALO_BULK_BATCH_SIZE` at a time.
+        The IDs may be Zendesk IDs if dual-running.
+        """
+        halo_ticket_ids = list(self.get_halo_ticket_ids(ticket_ids).values())
+        tickets = []
+        batch_size = settings.HALO_BULK_BATCH_SIZE
+        for start in range(0, len(halo_ticket_ids), batch_size):
+            batch = halo_ticket_ids[start : start + batch_size]
+            halo_response = self.client.get(
+                path="Tickets", params={"ticketids": ",".join(str(id) for id in batch)}
+            )
+            tickets.extend(halo_response.get("tickets", []))
+        return tickets
+
+    def get_halo_ticket_ids(self, ticket_ids: list) -> dict:
+        """
+        As `HaloTicketIDFromZendeskField` does for one ticket,
+        map any Zendesk ticket IDs to their Halo equivalents, but with one cache lookup.
+        IDs that aren't mapped are assumed to be Halo IDs already.
+        """
+        mapped_ids = caches[settings.TICKET_DATA_CACHE].get_many(ticket_ids)
+        return {ticket_id: mapped_ids.get(ticket_id, ticket_id) for ticket_id in ticket_ids}
+
+    def post_in_batches(self, path: str, payloads: list[dict]) -> list:
+        """
+        POST `HALO_BULK_BATCH_SIZE` records at a time.
+        A failed batch doesn't stop the rest being sent,
+        though once the request's deadline has passed none of the rest are.
+        :returns: For each payload, in order, either the Halo record or the exception.
+        """
+        results = []
+        batch_size = settings.HALO_BULK_BATCH_SIZE
+        for start in range(0, len(payloads), batch_size):
+            batch = payloads[start : start + batch_size]
+            try:
+                halo_response = self.client.post(path=path, payload=batch)
+            except DeadlineExceeded as exp:
+                logger.warning(f"Deadline passed posting {path}, {len(payloads) - start} not sent")
+                results.extend([exp] * (len(payloads) - start))
+                break
+            except Exception as exp:
+                # Whatever went wrong, those already sent need their outcomes reporting
+                logger.exception(f"Batch of {len(batch)} failed posting {path}")
+                results.extend([exp] * len(batch))
+                continue
+            # Halo gives back the record itself when only one was sent
+            records = halo_response if isinstance(halo_response, list) else [halo_response]
+            if len(records) != len(batch):
+                exp = HaloClientBadRequestException(
+                    f"Halo returned {len(records)} records for {len(batch)} sent to {path}"
+                )
+                records = [exp] * len(batch)
+            results.extend(records)
+        return results
+
     def add_comment(self, zendesk_request: dict = None):
         logger.warning(f"HaloManager.add_comment zendesk_request: {zendesk_request}")
         if zendesk_request is None:
@@ -215,6 +508,7 @@ class HaloManager:
         logger.warning(f"HaloManager.add_comment halo_equivalent: {halo_equivalent}")
 
         halo_response = self.client.post("Actions", payload=[halo_equivalent])
+        ticket_cache.invalidate_tickets([halo_equivalent.get("ticket_id", None)])
         return halo_response
 
     def get_comments(self, ticket_id: int) -> list[dict]:
@@ -250,7 +544,57 @@ class HaloManager:
 
         return halo_response
 
+    def iter_tickets(self, changed_since: datetime = None, page_size: int = 100):
+        """
+        Page through Halo tickets in order of last action, oldest first,
+        optionally only those with an action since `changed_since`.
+        Tickets are yielded one at a time so that callers never hold
+        the whole tenant in memory.
+
+        Each page asks for tickets from the last action on the page before,
+        rather than for the next page number, as tickets given an action while
+        they're being read would move between pages and others be skipped;
+        the tickets already read with that last action are skipped instead.
+        """
+        params = {
+            "pageinate": "true",
+            "page_size": page_size,
+            "page_no": 1,
+            "order": "lastactiondate",
+            "orderdesc": "false",
+        }
+        enddate = datetime.now(timezone.utc).isoformat()
+        since = changed_since
+        seen_ids = set()
+        while True:
+            if since is not None:
+                params["datesearch"] = "lastactiondate"
+                params["startdate"] = since.isoformat()
+                params["enddate"] = enddate
+            halo_response = self.client.get(path="Tickets", params=params)
+            tickets = halo_response.get("tickets", [])
+            yield from (ticket for ticket in tickets if ticket["id"] not in seen_ids)
+            if len(tickets) < page_size:
+                return
+            last_action = parse_halo_datetime(tickets[-1]["lastactiondate"])
+            tied_ids = {
+                ticket["id"]
+                for ticket in tickets
+                if parse_halo_datetime(ticket["lastactiondate"]) == last_action
+            }
+            if last_action == since:
+                # A whole page with the same last action, so the next page of them
+                seen_ids |= tied_ids
+                params["page_no"] += 1
+            else:
+                since = last_action
+                seen_ids = tied_ids
+                params["page_no"] = 1
+
     def upload_file(self, filename: str, data: bytes, content_type: str = "text/plain"):
+        digest = hashlib.sha256(data).hexdigest()
+        if (halo_attachment := cached_halo_attachment(digest)) is not None:
+            return halo_attachment
         file_content_base64 = base64.b64encode(data).decode("ascii")  # /PS-IGNORE
         payload = f"data:{content_type};base64,{file_content_base64}"  # noqa: E231,E702
         params = {
@@ -258,5 +602,23 @@ class HaloManager:
             "isimage": content_type.startswith("image"),
             "data_base64": payload,  # /PS-IGNORE
         }
-        halo_response = self.client.post(path="Attachment", payload=[params])
-        return halo_response
+        # Not cached, as it hasn't been scanned; upload_stream only reuses scanned files
+        return self.client.post(path="Attachment", payload=[params])
+
+    def upload_stream(self, filename: str, stream, content_type: str = "text/plain"):
+        """
+        Upload a file-like object, scanning it for viruses unless it's been found clean
+        by the current signatures before, in bounded memory
+
+        :raises InfectedFileException: Before anything is sent to Halo
+        """
+        with spooled_upload(stream, filename, content_type) as upload:
+            # Before the attachment's reused, so that's only once the file's clean
+            # by the current signatures
+            upload.scan()
+            # The same file is only uploaded once
+            if (halo_attachment := cached_halo_attachment(upload.digest)) is not None:
+                return halo_attachment
+            halo_response = self.client.post_body(path="Attachment", body=upload.payload)
+            cache_halo_attachment(upload.digest, halo_response)
+            return halo_response
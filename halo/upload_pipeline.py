@@ -0,0 +1,112 @@
+"""
+Uploads to Halo, read once from the request in chunks, which are hashed and encoded
+into Halo's Attachment payload, so memory use is bounded however big the file is.
+
+The payload, the file base64 encoded in a data URL within JSON, is spooled to
+a temporary file, in memory up to UPLOAD_SPOOL_MAX_MEMORY bytes and on disk beyond that.
+If uploads are scanned, so is the file itself, which is replayed through the AV scanner
+once its hash has been looked up, so a file that's been scanned or uploaded before
+isn't sent to the AV service again, and an infected file is refused before Halo sees any of it.
+"""
+
+import base64
+import logging
+import tempfile
+from contextlib import contextmanager
+
+import orjson
+from django.conf import settings
+from halo.attachment_cache import ContentHasher
+from halo.clam_av import SCAN_CHUNK_SIZE, scan_stream_cached
+
+logger = logging.getLogger(__name__)
+
+
+class InfectedFileException(Exception):
+    pass
+
+
+class AttachmentPayloadEncoder:
+    """
+    Writes Halo's Attachment payload for a file as the file's chunks are fed in
+    """
+
+    def __init__(self, filename, content_type):
+        self.payload = tempfile.SpooledTemporaryFile(max_size=settings.UPLOAD_SPOOL_MAX_MEMORY)
+        # Base64 encodes 3 bytes at a time, so any left over wait for the next chunk
+        self.remainder = b""
+        fields = orjson.dumps({"filename": filename, "isimage": content_type.startswith("image")})
+        # The data URL is left open for the encoded file
+        data_url = orjson.dumps(f"data:{content_type};base64,")[:-1]
+        self.payload.write(b"[" + fields[:-1] + b',"data_base64":' + data_url)
+
+    def feed(self, chunk):
+        data = self.remainder + chunk
+        whole = len(data) - len(data) % 3
+        self.payload.write(base64.b64encode(data[:whole]))
+        self.remainder = data[whole:]
+
+    def finish(self):
+        self.payload.write(base64.b64encode(self.remainder) + b'"}]')
+        self.payload.seek(0)
+        return self.payload
+
+
+class SpooledUpload:
+    """
+    An upload, hashed and spooled as Halo's Attachment payload and,
+    if it's to be scanned, as the file itself, as its chunks are fed in
+    """
+
+    def __init__(self, filename, content_type):
+        self.filename = filename
+        self.hasher = ContentHasher()
+        self.encoder = AttachmentPayloadEncoder(filename, content_type)
+        self.file = None
+        if settings.AV_SCAN_UPLOADS:
+            self.file = tempfile.SpooledTemporaryFile(max_size=settings.UPLOAD_SPOOL_MAX_MEMORY)
+        self.payload = None
+
+    @property
+    def digest(self):
+        return self.hasher.hexdigest()
+
+    def feed(self, chunk):
+        self.hasher.feed(chunk)
+        self.encoder.feed(chunk)
+        if self.file is not None:
+            self.file.write(chunk)
+
+    def finish(self):
+        self.payload = self.encoder.finish()
+
+    def scan(self):
+        """
+        :raises InfectedFileException: If uploads are scanned and this one didn't pass
+        """
+        if self.file is None:
+            return
+        self.file.seek(0)
+        if not scan_stream_cached(self.file, self.filename, self.digest):
+            raise InfectedFileException(f"{self.filename} failed the virus scan")
+
+    def close(self):
+        self.encoder.payload.close()
+        if self.file is not None:
+            self.file.close()
+
+
+@contextmanager
+def spooled_upload(stream, filename, content_type):
+    """
+    :param stream: File-like object with the upload
+    :returns: A SpooledUpload of the whole stream, deleted afterwards
+    """
+    upload = SpooledUpload(filename, content_type)
+    try:
+        while chunk := stream.read(SCAN_CHUNK_SIZE):
+            upload.feed(chunk)
+        upload.finish()
+        yield upload
+    finally:
+        upload.close()
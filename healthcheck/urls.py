@@ -2,12 +2,13 @@ from django.urls import path
 from django.utils.decorators import decorator_from_middleware
 
 from .middleware import StatsMiddleware
-from .views import HealthCheckView
+from .views import HealthCheckView, MetricsView
 
 urlpatterns = [
     path(
         "healthcheck/",
         decorator_from_middleware(StatsMiddleware)(HealthCheckView.as_view()),
         name="healthcheck",
-    )
+    ),
+    path("metrics/", MetricsView.as_view(), name="metrics"),
 ]
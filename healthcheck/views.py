@@ -1,7 +1,10 @@
 from http import HTTPStatus
 
+from django.http import JsonResponse
+from django.views import View
 from django.views.generic import TemplateView
 
+from help_desk_api import metrics
 from help_desk_api.models import HelpDeskCreds
 
 
@@ -24,3 +27,14 @@ class HealthCheckView(TemplateView):
         except Exception:
             return HTTPStatus.SERVICE_UNAVAILABLE
         return HTTPStatus.OK
+
+
+class MetricsView(View):
+    """
+    Counters shared by all processes, e.g. ticket cache hit ratio
+    """
+
+    http_method_names = ["get"]
+
+    def get(self, request, *args, **kwargs):
+        return JsonResponse(metrics.snapshot())
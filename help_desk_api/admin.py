@@ -1,6 +1,12 @@
 from django.contrib import admin
 
-from help_desk_api.models import CustomField, HelpDeskCreds, Value
+from help_desk_api.models import (
+    CustomField,
+    HaloTicket,
+    HelpDeskCreds,
+    PendingUpload,
+    Value,
+)
 
 from .forms import HelpDeskCredsChangeForm, HelpDeskCredsCreationForm
 
@@ -14,6 +20,8 @@ class HelpDeskCredsAdmin(admin.ModelAdmin):
         "zendesk_email",
         "zendesk_subdomain",
         "help_desk",
+        "rate_limit",
+        "max_concurrent_requests",
     ]
 
     def get_form(self, request, obj=None, **kwargs):
@@ -103,3 +111,30 @@ class ValueAdmin(admin.ModelAdmin):
         "field__zendesk_name",
         "zendesk_value",
     ]
+
+
+@admin.register(HaloTicket)
+class HaloTicketAdmin(admin.ModelAdmin):
+    list_display = [
+        "halo_id",
+        "halo_client_id",
+        "zendesk_id",
+        "summary",
+        "requester_email",
+        "status",
+        "last_action",
+    ]
+    list_filter = ["halo_client_id"]
+    search_fields = ["summary", "requester_email"]
+    ordering = ("-last_action",)
+    readonly_fields = [field.name for field in HaloTicket._meta.fields]
+
+
+@admin.register(PendingUpload)
+class PendingUploadAdmin(admin.ModelAdmin):
+    list_display = ["token", "filename", "status", "attempts", "created_at", "scanned_at"]
+    list_filter = ["status"]
+    search_fields = ["token", "filename"]
+    ordering = ("-created_at",)
+    exclude = ["data"]
+    readonly_fields = [field.name for field in PendingUpload._meta.fields if field.name != "data"]
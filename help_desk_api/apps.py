@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class HelpDeskApiConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "help_desk_api"
+
+    def ready(self):
+        from help_desk_api import signals  # noqa F401
@@ -0,0 +1,271 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.cache.backends.redis import RedisCache
+from redis.exceptions import RedisError
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class LocalLRU:
+    """
+    A small, thread-safe, bounded LRU map with a per-entry expiry time.
+    It sits in front of the shared cache so that hot keys
+    (e.g. the Halo token) don't need a network round trip at all.
+    """
+
+    def __init__(self, max_entries=1000, timeout=10):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0 and self.timeout > 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key, None)
+            if entry is None:
+                return default
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout=None):
+        if not self.enabled:
+            return
+        local_timeout = self.timeout if timeout is None else min(timeout, self.timeout)
+        if local_timeout <= 0:
+            self.delete(key)
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + local_timeout, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            return self._entries.pop(key, None) is not None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class TwoTierCache(BaseCache):
+    """
+    Cache backend with a bounded in-process LRU (short TTL) in front of Redis.
+
+    If Redis can't be reached, reads and writes go to the database cache
+    named by the FALLBACK_CACHE option instead, and Redis is left alone
+    for REMOTE_RETRY_INTERVAL seconds so that requests don't all pay for
+    a connection timeout while it's down.
+    A Redis miss also falls through to the database cache, so entries written
+    while Redis was unavailable (or before Redis was introduced) are still found.
+
+    OPTIONS:
+        LOCAL_MAX_ENTRIES: size of the in-process LRU (0 disables it)
+        LOCAL_TIMEOUT: seconds an entry may live in the in-process LRU
+        FALLBACK_CACHE: alias of a cache in CACHES to use when Redis is down
+        REMOTE_RETRY_INTERVAL: seconds to wait before trying Redis again after an error
+        REDIS_OPTIONS: passed through to Django's RedisCache
+
+    An empty LOCATION disables the Redis tier, e.g. for tests.
+    """
+
+    def __init__(self, server, params):
+        super().__init__(params)
+        options = params.get("OPTIONS", {})
+        self.local = LocalLRU(
+            max_entries=options.get("LOCAL_MAX_ENTRIES", 1000),
+            timeout=options.get("LOCAL_TIMEOUT", 10),
+        )
+        self.fallback_alias = options.get("FALLBACK_CACHE", None)
+        self.remote_retry_interval = options.get("REMOTE_RETRY_INTERVAL", 30)
+        self._remote_unavailable_until = 0
+        self.remote = None
+        if server:
+            self.remote = RedisCache(
+                server,
+                {
+                    "TIMEOUT": params.get("TIMEOUT", DEFAULT_TIMEOUT),
+                    "KEY_PREFIX": self.key_prefix,
+                    "VERSION": self.version,
+                    "KEY_FUNCTION": params.get("KEY_FUNCTION", None),
+                    "OPTIONS": options.get("REDIS_OPTIONS", {}),
+                },
+            )
+
+    @property
+    def fallback(self):
+        if self.fallback_alias is None:
+            return None
+        return caches[self.fallback_alias]
+
+    @property
+    def remote_available(self):
+        return self.remote is not None and time.monotonic() >= self._remote_unavailable_until
+
+    @property
+    def available(self):
+        """
+        Whether operations have anywhere to go, Redis or the fallback
+        """
+        return self.remote_available or self.fallback_alias is not None
+
+    def _remote_failed(self, operation, error):
+        logger.warning(f"Redis cache {operation} failed, using fallback: {error}")
+        self._remote_unavailable_until = time.monotonic() + self.remote_retry_interval
+
+    def _call(self, operation, *args, **kwargs):
+        """
+        Run a cache operation against Redis, or against the fallback
+        if Redis is unavailable or errors.
+        Returns a (handled, result) pair; handled is False
+        if there was nowhere to send the operation.
+        """
+        if self.remote_available:
+            try:
+                return True, getattr(self.remote, operation)(*args, **kwargs)
+            except RedisError as error:
+                self._remote_failed(operation, error)
+        fallback = self.fallback
+        if fallback is None:
+            return False, None
+        return True, getattr(fallback, operation)(*args, **kwargs)
+
+    def _local_timeout(self, timeout):
+        timeout = self.get_backend_timeout(timeout)
+        if timeout is None:
+            return None
+        return max(timeout - time.time(), 0)
+
+    def get(self, key, default=None, version=None):
+        local_key = self.make_and_validate_key(key, version=version)
+        value = self.local.get(local_key, _MISSING)
+        if value is not _MISSING:
+            return value
+        value = _MISSING
+        if self.remote_available:
+            try:
+                value = self.remote.get(key, _MISSING, version=version)
+            except RedisError as error:
+                self._remote_failed("get", error)
+        if value is _MISSING and self.fallback is not None:
+            value = self.fallback.get(key, _MISSING, version=version)
+            if value is not _MISSING and self.remote_available:
+                # Promote to Redis so the next miss doesn't reach the database
+                try:
+                    self.remote.set(key, value, version=version)
+                except RedisError as error:
+                    self._remote_failed("set", error)
+        if value is _MISSING:
+            return default
+        self.local.set(local_key, value)
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        local_key = self.make_and_validate_key(key, version=version)
+        self._call("set", key, value, timeout=timeout, version=version)
+        self.local.set(local_key, value, self._local_timeout(timeout))
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        # Not served from the local tier: callers use add() as a lock
+        local_key = self.make_and_validate_key(key, version=version)
+        self.local.delete(local_key)
+        handled, added = self._call("add", key, value, timeout=timeout, version=version)
+        return added if handled else False
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        local_key = self.make_and_validate_key(key, version=version)
+        self.local.delete(local_key)
+        handled, touched = self._call("touch", key, timeout=timeout, version=version)
+        return touched if handled else False
+
+    def delete(self, key, version=None):
+        local_key = self.make_and_validate_key(key, version=version)
+        deleted = self.local.delete(local_key)
+        handled, remote_deleted = self._call("delete", key, version=version)
+        if self.fallback is not None and self.remote_available:
+            # Otherwise a later Redis miss would resurrect the old value
+            deleted = self.fallback.delete(key, version=version) or deleted
+        return bool(deleted or remote_deleted)
+
+    def get_many(self, keys, version=None):
+        """
+        One Redis round trip for everything not held locally,
+        then one fallback lookup for anything Redis didn't have
+        """
+        found = {}
+        local_keys = {key: self.make_and_validate_key(key, version=version) for key in keys}
+        for key, local_key in local_keys.items():
+            value = self.local.get(local_key, _MISSING)
+            if value is not _MISSING:
+                found[key] = value
+        missing = [key for key in keys if key not in found]
+        if missing and self.remote_available:
+            try:
+                remote_found = self.remote.get_many(missing, version=version)
+                found.update(remote_found)
+            except RedisError as error:
+                self._remote_failed("get_many", error)
+            missing = [key for key in missing if key not in found]
+        if missing and self.fallback is not None:
+            found.update(self.fallback.get_many(missing, version=version))
+        for key in keys:
+            if key in found:
+                self.local.set(local_keys[key], found[key])
+        return found
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        handled, failed_keys = self._call("set_many", data, timeout=timeout, version=version)
+        local_timeout = self._local_timeout(timeout)
+        for key, value in data.items():
+            self.local.set(self.make_and_validate_key(key, version=version), value, local_timeout)
+        return failed_keys if handled else list(data)
+
+    def incr(self, key, delta=1, version=None):
+        # Counters are shared between processes, so never served locally
+        local_key = self.make_and_validate_key(key, version=version)
+        self.local.delete(local_key)
+        handled, value = self._call("incr", key, delta, version=version)
+        if not handled:
+            raise ValueError(f"Key '{key}' not found")
+        return value
+
+    def clear(self):
+        """
+        Clear only this cache's keys from Redis,
+        as several aliases share the same Redis database.
+        """
+        self.local.clear()
+        if self.remote_available:
+            try:
+                client = self.remote._cache.get_client(write=True)
+                pattern = f"{self.key_prefix}:*" if self.key_prefix else "*"
+                keys = list(client.scan_iter(match=pattern))
+                if keys:
+                    client.delete(*keys)
+            except RedisError as error:
+                self._remote_failed("clear", error)
+        if self.fallback is not None:
+            self.fallback.clear()
+
+    def close(self, **kwargs):
+        if self.remote is not None:
+            self.remote.close(**kwargs)
@@ -0,0 +1,149 @@
+"""
+Circuit breakers for the upstreams (Halo, Zendesk, ClamAV), shared by the web workers
+and the management commands through the coordination cache,
+so that once an upstream is failing we stop waiting on it.
+
+Calls and failures are counted in windows of CIRCUIT_BREAKER_WINDOW seconds.
+Once at least CIRCUIT_BREAKER_MIN_CALLS calls in a window have been made
+and CIRCUIT_BREAKER_FAILURE_RATE of them have failed, the breaker opens
+and calls are refused with CircuitOpenException for CIRCUIT_BREAKER_OPEN_SECONDS.
+After that it's half-open: one call at a time is let through as a probe,
+which closes the breaker if it succeeds or opens it again if it fails.
+
+A call has failed if it raised, e.g. couldn't connect, or the upstream responded 5xx;
+4xx responses are the caller's problem, not the upstream's.
+"""
+
+import logging
+import math
+import time
+from http import HTTPStatus
+
+from django.conf import settings
+from django.core.cache import caches
+
+from help_desk_api.deadlines import DeadlineExceeded
+from help_desk_api.metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenException(Exception):
+    pass
+
+
+def is_server_error(response):
+    status_code = getattr(response, "status_code", None)
+    return isinstance(status_code, int) and status_code >= HTTPStatus.INTERNAL_SERVER_ERROR
+
+
+class CircuitBreaker:
+    def __init__(self, name, is_failure=is_server_error):
+        """
+        :param is_failure: Whether a call's result, e.g. a response, counts as a failure
+        """
+        self.name = name
+        self.is_failure = is_failure
+        self.opened = Counter(f"circuit_breaker.{name}.opened")
+        self.rejected = Counter(f"circuit_breaker.{name}.rejected")
+        self.probes = Counter(f"circuit_breaker.{name}.probes")
+
+    @property
+    def cache(self):
+        return caches[settings.COORDINATION_CACHE]
+
+    def cache_key(self, part):
+        return f"circuit_breaker:{self.name}:{part}"
+
+    def window_key(self, part, now):
+        return self.cache_key(f"{part}:{math.floor(now / settings.CIRCUIT_BREAKER_WINDOW)}")
+
+    def call(self, fn):
+        """
+        :returns: fn's result
+        :raises CircuitOpenException: Without calling fn, if the breaker is open
+        """
+        probing = self.allow()
+        try:
+            result = fn()
+        except DeadlineExceeded:
+            # Our caller ran out of time, which says nothing about the upstream
+            if probing:
+                self.cache.delete(self.cache_key("probe"))
+            raise
+        except Exception:
+            self.record(False, probing)
+            raise
+        self.record(not self.is_failure(result), probing)
+        return result
+
+    def is_open(self):
+        """
+        :returns: Whether calls are being refused; a half-open breaker isn't open
+        """
+        opened_at = self.cache.get(self.cache_key("opened_at"), None)
+        return (
+            opened_at is not None
+            and time.time() < opened_at + settings.CIRCUIT_BREAKER_OPEN_SECONDS
+        )
+
+    def allow(self):
+        """
+        :returns: Whether the call is a probe of a half-open breaker
+        :raises CircuitOpenException: If the call mustn't be made
+        """
+        opened_at = self.cache.get(self.cache_key("opened_at"), None)
+        if opened_at is None:
+            return False
+        open_seconds = settings.CIRCUIT_BREAKER_OPEN_SECONDS
+        if time.time() >= opened_at + open_seconds and self.cache.add(
+            self.cache_key("probe"), True, timeout=open_seconds
+        ):
+            logger.info(f"Probing {self.name} circuit breaker")
+            self.probes.increment()
+            return True
+        self.rejected.increment()
+        raise CircuitOpenException(f"{self.name} is unavailable")
+
+    def record(self, succeeded, probing=False):
+        now = time.time()
+        if probing:
+            if succeeded:
+                logger.warning(f"Closing {self.name} circuit breaker")
+                self.cache.delete_many(
+                    [
+                        self.cache_key("opened_at"),
+                        self.window_key("calls", now),
+                        self.window_key("failures", now),
+                    ]
+                )
+            else:
+                self.cache.set(self.cache_key("opened_at"), now, timeout=None)
+            self.cache.delete(self.cache_key("probe"))
+            return
+        timeout = settings.CIRCUIT_BREAKER_WINDOW * 2
+        calls_key = self.window_key("calls", now)
+        failures_key = self.window_key("failures", now)
+        try:
+            self.cache.add(calls_key, 0, timeout=timeout)
+            calls = self.cache.incr(calls_key, 1)
+            if succeeded:
+                return
+            self.cache.add(failures_key, 0, timeout=timeout)
+            failures = self.cache.incr(failures_key, 1)
+        except ValueError as exp:
+            # Better to keep calling the upstream than to refuse every call
+            logger.warning(f"Couldn't record {self.name} call: {exp}")
+            return
+        if (
+            calls >= settings.CIRCUIT_BREAKER_MIN_CALLS
+            and failures / calls >= settings.CIRCUIT_BREAKER_FAILURE_RATE
+            and self.cache.add(self.cache_key("opened_at"), now, timeout=None)
+        ):
+            logger.error(f"Opening {self.name} circuit breaker: {failures} of {calls} calls failed")
+            self.opened.increment()
+
+
+halo_breaker = CircuitBreaker("halo")
+zendesk_breaker = CircuitBreaker("zendesk")
+clam_av_breaker = CircuitBreaker("clam_av")
@@ -0,0 +1,92 @@
+"""
+A deadline for each proxied request, so one hung upstream can't hold a worker for ever.
+
+The middleware sets a deadline of REQUEST_DEADLINE seconds, or REQUEST_DEADLINES'
+entry for the endpoint's URL name, when a request arrives. Each leg narrows it to
+its share: when dual-running, the Zendesk leg has ZENDESK_DEADLINE_SHARE of it,
+and the Halo leg, including any token refresh, has whatever's left.
+Every upstream call made within it is given the time remaining as its timeout,
+and once it has passed, calls raise DeadlineExceeded instead of being made.
+
+Calls made outside a request, e.g. by management commands, have no deadline,
+but still time out after UPSTREAM_TIMEOUT seconds.
+Cache I/O is bounded separately, by the Redis socket timeouts.
+"""
+
+import contextvars
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from help_desk_api.metrics import Counter
+
+# time.monotonic() by which the current request must be finished, if any
+request_deadline = contextvars.ContextVar("request_deadline", default=None)
+
+deadlines_exceeded = Counter("deadlines.exceeded")
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+def deadline_for(url_name):
+    return settings.REQUEST_DEADLINES.get(url_name, settings.REQUEST_DEADLINE)
+
+
+@contextmanager
+def deadline(seconds):
+    """
+    Set a deadline of `seconds` from now, or keep the current one if that's sooner
+    """
+    new_deadline = time.monotonic() + seconds
+    current = request_deadline.get()
+    if current is not None:
+        new_deadline = min(new_deadline, current)
+    token = request_deadline.set(new_deadline)
+    try:
+        yield
+    finally:
+        request_deadline.reset(token)
+
+
+@contextmanager
+def deadline_share(share):
+    """
+    Narrow the current deadline to `share` of the time remaining, e.g. for one leg of a request
+    """
+    seconds = remaining()
+    if seconds is None:
+        yield
+        return
+    with deadline(seconds * share):
+        yield
+
+
+def remaining():
+    """
+    :returns: Seconds until the deadline, or None if there isn't one
+    """
+    current = request_deadline.get()
+    if current is None:
+        return None
+    return current - time.monotonic()
+
+
+def upstream_timeout(limit=None):
+    """
+    :param limit: Most seconds the call should take, whatever the deadline
+    :returns: The timeout for an upstream call
+    :raises DeadlineExceeded: If there's no time left to make it
+    """
+    timeout = settings.UPSTREAM_TIMEOUT
+    if limit is not None:
+        timeout = min(timeout, limit)
+    seconds = remaining()
+    if seconds is None:
+        return timeout
+    if seconds <= 0:
+        deadlines_exceeded.increment()
+        raise DeadlineExceeded("Deadline exceeded before the upstream request could be made")
+    return min(timeout, seconds)
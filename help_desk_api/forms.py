@@ -22,6 +22,9 @@ class HelpDeskCredsChangeForm(forms.ModelForm):
             "halo_client_secret",
             "help_desk",
             "note",
+            "rate_limit",
+            "rate_limit_burst",
+            "max_concurrent_requests",
         )
 
     def __init__(self, *args, **kwargs):
@@ -42,6 +45,9 @@ class HelpDeskCredsCreationForm(forms.ModelForm):
             "halo_client_secret",
             "help_desk",
             "note",
+            "rate_limit",
+            "rate_limit_burst",
+            "max_concurrent_requests",
         )
 
     def save(self, commit=True):
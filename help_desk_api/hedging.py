@@ -0,0 +1,145 @@
+"""
+Hedged requests, to cut the tail latency of idempotent upstream reads.
+
+If a call hasn't finished after the hedge delay, the same call is made again
+and whichever finishes first, successfully, is used. The other is cancelled if it
+hasn't started, and otherwise left to finish in the background with its result dropped,
+as `requests` calls can't be interrupted.
+
+The delay is the configured one or, if that's 0, the 95th percentile of the latencies
+this process has seen, so only the slowest calls are hedged. Hedges are limited to a share
+of all calls, across all processes, so a slow upstream isn't sent twice the load.
+"""
+
+import contextvars
+import logging
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.core.cache import caches
+
+from help_desk_api.metrics import Counter, Ratio
+
+logger = logging.getLogger(__name__)
+
+# Hedges are limited to a share of the calls made in windows this long
+HEDGE_WINDOW = 60  # seconds
+# Latencies kept for working out the hedge delay, and how many are needed before hedging
+LATENCY_SAMPLES = 200
+MIN_LATENCY_SAMPLES = 20
+HEDGE_PERCENTILE = 0.95
+HEDGE_THREADS = 16
+
+hedge_executor = ThreadPoolExecutor(max_workers=HEDGE_THREADS, thread_name_prefix="hedge")
+
+
+class Hedged:
+    def __init__(self, name, enabled_setting, delay_setting, budget_setting):
+        """
+        :param enabled_setting: Name of the setting for whether calls are hedged
+        :param delay_setting: Name of the setting with the hedge delay in seconds,
+            or 0 to use the observed 95th percentile
+        :param budget_setting: Name of the setting with the share of calls that may be hedged
+        """
+        self.name = name
+        self.enabled_setting = enabled_setting
+        self.delay_setting = delay_setting
+        self.budget_setting = budget_setting
+        self._latencies = deque(maxlen=LATENCY_SAMPLES)
+        self._lock = threading.Lock()
+        self.calls = Counter(f"hedging.{name}.calls")
+        self.hedges = Counter(f"hedging.{name}.hedges")
+        self.hedge_wins = Counter(f"hedging.{name}.hedge_wins")
+        self.over_budget = Counter(f"hedging.{name}.over_budget")
+        self.hedge_rate = Ratio(
+            f"hedging.{name}.hedge_rate", numerators=[self.hedges], denominators=[self.calls]
+        )
+
+    @property
+    def cache(self):
+        return caches[settings.COORDINATION_CACHE]
+
+    def window_key(self, part, now):
+        return f"hedging:{self.name}:{part}:{math.floor(now / HEDGE_WINDOW)}"
+
+    def observe(self, latency):
+        with self._lock:
+            self._latencies.append(latency)
+
+    def delay(self):
+        """
+        :returns: Seconds to wait before hedging, or None if there's no basis for hedging yet
+        """
+        if configured := getattr(settings, self.delay_setting):
+            return configured
+        with self._lock:
+            if len(self._latencies) < MIN_LATENCY_SAMPLES:
+                return None
+            latencies = sorted(self._latencies)
+        return latencies[math.ceil(len(latencies) * HEDGE_PERCENTILE) - 1]
+
+    def count_call(self):
+        self.calls.increment()
+        key = self.window_key("calls", time.time())
+        try:
+            self.cache.add(key, 0, timeout=HEDGE_WINDOW * 2)
+            self.cache.incr(key, 1)
+        except ValueError as exp:
+            logger.warning(f"Couldn't count {self.name} call: {exp}")
+
+    def take_hedge(self):
+        """
+        :returns: Whether a hedge may be made within the budget
+        """
+        now = time.time()
+        hedges_key = self.window_key("hedges", now)
+        try:
+            calls = self.cache.get(self.window_key("calls", now), 0)
+            self.cache.add(hedges_key, 0, timeout=HEDGE_WINDOW * 2)
+            hedges = self.cache.incr(hedges_key, 1)
+        except ValueError as exp:
+            # Without a budget, don't hedge
+            logger.warning(f"Couldn't check {self.name} hedge budget: {exp}")
+            return False
+        if hedges > max(calls * getattr(settings, self.budget_setting), 1):
+            self.cache.incr(hedges_key, -1)
+            self.over_budget.increment()
+            return False
+        return True
+
+    def submit(self, fn):
+        # Run it with the caller's deadline and priority
+        return hedge_executor.submit(contextvars.copy_context().run, fn)
+
+    def do(self, fn):
+        if not getattr(settings, self.enabled_setting):
+            return fn()
+        self.count_call()
+        started = time.monotonic()
+        primary = self.submit(fn)
+        done, _ = wait([primary], timeout=self.delay())
+        if done or not self.take_hedge():
+            result = primary.result()
+            self.observe(time.monotonic() - started)
+            return result
+
+        logger.info(f"Hedging {self.name} call")
+        self.hedges.increment()
+        hedge = self.submit(fn)
+        pending = {primary, hedge}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    for other in pending:
+                        other.cancel()
+                    if future is hedge:
+                        self.hedge_wins.increment()
+                    self.observe(time.monotonic() - started)
+                    return future.result()
+        # Both failed
+        return primary.result()
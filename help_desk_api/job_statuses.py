@@ -0,0 +1,73 @@
+"""
+Zendesk runs its bulk endpoints as background jobs, returning a job status
+for the caller to poll at /api/v2/job_statuses/{id}.json.
+We do the work before responding, so the job status we return is already complete,
+but it's kept for a while so that polling it works as Zenpy expects.
+"""
+
+import uuid
+
+from django.core.cache import cache
+from django.urls import reverse
+from django.utils import timezone
+
+# Zendesk keeps job statuses for about an hour
+JOB_STATUS_TIMEOUT = 60 * 60  # seconds
+
+# Zendesk's limit on the number of records in one bulk request
+MAX_BULK_RECORDS = 100
+
+ACTION_STATUSES = {
+    "create": "Created",
+    "update": "Updated",
+}
+
+
+def job_status_cache_key(help_desk_creds, job_id):
+    return f"job_status:{help_desk_creds.pk}:{job_id}"
+
+
+def job_status_result(index, action, outcome):
+    if isinstance(outcome, Exception):
+        return {
+            "index": index,
+            "success": False,
+            "error": type(outcome).__name__,
+            "details": str(outcome),
+        }
+    return {
+        "index": index,
+        "id": outcome["id"],
+        "success": True,
+        "action": action,
+        "status": ACTION_STATUSES[action],
+    }
+
+
+def create_job_status(request, action, outcomes):
+    """
+    :param action: "create" or "update", or a list of them with one for each record.
+    :param outcomes: For each record, either the Halo record or the exception raised for it,
+        as returned by the bulk `HaloManager` methods.
+    """
+    job_id = uuid.uuid4().hex
+    actions = action if isinstance(action, list) else [action] * len(outcomes)
+    results = [
+        job_status_result(index, action, outcome)
+        for index, (action, outcome) in enumerate(zip(actions, outcomes))
+    ]
+    job_status = {
+        "id": job_id,
+        "url": request.build_absolute_uri(reverse("api:job_status", kwargs={"id": job_id})),
+        "total": len(results),
+        "progress": len(results),
+        "status": "completed",
+        "message": f"Completed at {timezone.now().isoformat()}",
+        "results": results,
+    }
+    cache.set(job_status_cache_key(request.help_desk_creds, job_id), job_status, JOB_STATUS_TIMEOUT)
+    return job_status
+
+
+def get_job_status(request, job_id):
+    return cache.get(job_status_cache_key(request.help_desk_creds, job_id), None)
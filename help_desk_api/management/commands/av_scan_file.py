@@ -29,5 +29,5 @@ class Command(BaseCommand):
         path = settings.BASE_DIR / f"tests/help_desk_api/{filename}"
         if not skip_file_extension(path):
             if check_av_service(CLAM_AV_HOST, CLAM_AV_PATH) == "OK":
-                if av_scan_file(path) == "OK":
+                if av_scan_file(path):
                     print("proceed to Uploading the file")
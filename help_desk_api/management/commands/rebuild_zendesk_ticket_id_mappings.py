@@ -0,0 +1,96 @@
+from datetime import datetime
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management import BaseCommand
+from halo.halo_manager import HaloManager, parse_halo_datetime
+
+from help_desk_api.models import HelpDeskCreds
+from help_desk_api.serializers import zendesk_ticket_id_from_halo_ticket
+
+CHECKPOINT_CACHE_KEY = "zendesk_ticket_id_mappings:lastactiondate"
+
+
+class Command(BaseCommand):
+    help = "Rebuild Zendesk to Halo ticket ID mappings from the Zendesk IDs stored in Halo"
+
+    def __init__(self, stdout=None, stderr=None, **kwargs):
+        super().__init__(stdout, stderr, **kwargs)
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "-c",
+            "--credentials",
+            type=str,
+            help="Email address linked to Halo credentials",
+            required=True,
+        )
+        parser.add_argument(
+            "--full",
+            action="store_true",
+            help="Ignore the last run and read every Halo ticket",
+        )
+        parser.add_argument(
+            "--since",
+            type=parse_halo_datetime,
+            help="Only read Halo tickets with an action since this ISO 8601 date/time",
+        )
+        parser.add_argument(
+            "-p", "--page-size", type=int, default=100, help="Halo tickets per request"
+        )
+
+    def handle(self, *args, **options):
+        credentials = HelpDeskCreds.objects.get(zendesk_email=options["credentials"])
+        halo_manager = HaloManager(
+            client_id=credentials.halo_client_id, client_secret=credentials.halo_client_secret
+        )
+
+        changed_since = self.get_changed_since(options)
+        if changed_since is None:
+            self.stdout.write("Reading all Halo tickets")
+        else:
+            self.stdout.write(f"Reading Halo tickets with an action since {changed_since}")
+
+        ticket_count = 0
+        mapping_count = 0
+        latest_action_date = changed_since
+        mappings = {}
+        for halo_ticket in halo_manager.iter_tickets(
+            changed_since=changed_since, page_size=options["page_size"]
+        ):
+            ticket_count += 1
+            if last_action := halo_ticket.get("lastactiondate", None):
+                action_date = parse_halo_datetime(last_action)
+                if latest_action_date is None or action_date > latest_action_date:
+                    latest_action_date = action_date
+            zendesk_ticket_id = zendesk_ticket_id_from_halo_ticket(halo_ticket)
+            if zendesk_ticket_id is not None:
+                mappings[zendesk_ticket_id] = halo_ticket["id"]
+            if len(mappings) >= options["page_size"]:
+                mapping_count += self.save_mappings(mappings)
+                mappings = {}
+        mapping_count += self.save_mappings(mappings)
+
+        if latest_action_date is not None:
+            caches[settings.TICKET_DATA_CACHE].set(
+                CHECKPOINT_CACHE_KEY, latest_action_date.isoformat(), timeout=None
+            )
+        self.stdout.write(f"Read {ticket_count} Halo tickets; saved {mapping_count} mappings")
+
+    def get_changed_since(self, options):
+        if options["since"] is not None:
+            return options["since"]
+        if options["full"]:
+            return None
+        # Kept with the mappings, so if they're flushed this goes too and everything is rebuilt
+        checkpoint = caches[settings.TICKET_DATA_CACHE].get(CHECKPOINT_CACHE_KEY, None)
+        return datetime.fromisoformat(checkpoint) if checkpoint else None
+
+    def save_mappings(self, mappings):
+        """
+        Written without an expiry, unlike the mappings cached as tickets are created,
+        so they can't age out before the requester comes back to the ticket
+        """
+        if mappings:
+            caches[settings.TICKET_DATA_CACHE].set_many(mappings, timeout=None)
+        return len(mappings)
@@ -0,0 +1,95 @@
+import io
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.core.management import BaseCommand
+from django.db import close_old_connections, connection
+from halo.halo_manager import HaloManager
+from halo.upload_pipeline import InfectedFileException
+
+from help_desk_api import scan_queue
+from help_desk_api.models import PendingUpload
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Scan queued uploads for viruses, sending those that pass to Halo"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "-w",
+            "--workers",
+            type=int,
+            default=settings.AV_SCAN_WORKERS,
+            help="Uploads scanned at the same time",
+        )
+        parser.add_argument(
+            "--poll",
+            type=float,
+            default=5,
+            help="Seconds to wait before looking again when the queue is empty",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Stop once there's nothing left to scan rather than waiting for more",
+        )
+
+    def handle(self, *args, **options):
+        workers = options["workers"]
+        self.stdout.write(f"Scanning uploads, {workers} at a time")
+        scanned = 0
+        in_flight = set()
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="scan") as executor:
+            while True:
+                close_old_connections()
+                scan_queue.update_queue_depth()
+                # Claim only as many as there are free workers, so other workers get a share
+                uploads = scan_queue.claim(workers - len(in_flight))
+                in_flight.update(executor.submit(self.scan_in_thread, upload) for upload in uploads)
+                scanned += len(uploads)
+                if not in_flight:
+                    if options["once"]:
+                        break
+                    time.sleep(options["poll"])
+                    continue
+                # Claim more as soon as any scan finishes rather than once they all have,
+                # and look again for new uploads meanwhile if there are workers free
+                timeout = None if len(in_flight) == workers else options["poll"]
+                _done, in_flight = wait(in_flight, timeout=timeout, return_when=FIRST_COMPLETED)
+        self.stdout.write(f"Scanned {scanned} uploads")
+
+    def scan_in_thread(self, upload: PendingUpload):
+        try:
+            self.scan(upload)
+        finally:
+            # Each thread has its own database connection, which nothing else closes
+            connection.close()
+
+    def scan(self, upload: PendingUpload):
+        started = time.monotonic()
+        try:
+            halo_manager = HaloManager(
+                client_id=upload.credentials.halo_client_id,
+                client_secret=upload.credentials.halo_client_secret,
+            )
+            halo_response = halo_manager.upload_stream(
+                filename=upload.filename,
+                stream=io.BytesIO(upload.data),
+                content_type=upload.content_type,
+            )
+            scan_queue.finish(
+                upload,
+                PendingUpload.Status.CLEAN,
+                halo_attachment_id=halo_response["id"],
+                attach=halo_manager.attach_to_ticket,
+            )
+        except InfectedFileException:
+            scan_queue.finish(upload, PendingUpload.Status.INFECTED)
+        except Exception as exp:
+            scan_queue.retry(upload, exp)
+        finally:
+            scan_queue.scan_seconds.observe(time.monotonic() - started)
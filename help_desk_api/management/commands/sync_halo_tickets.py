@@ -0,0 +1,67 @@
+from django.core.management import BaseCommand
+from django.db.models import Max
+from halo.halo_manager import HaloManager, parse_halo_datetime
+
+from help_desk_api.models import HaloTicket, HelpDeskCreds
+from help_desk_api.search import save_halo_tickets
+
+
+class Command(BaseCommand):
+    help = "Bring the local read model of Halo tickets, used for search, up to date"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "-c",
+            "--credentials",
+            type=str,
+            help="Email address linked to Halo credentials",
+            required=True,
+        )
+        parser.add_argument(
+            "--full",
+            action="store_true",
+            help="Read every Halo ticket rather than those changed since the last sync",
+        )
+        parser.add_argument(
+            "--since",
+            type=parse_halo_datetime,
+            help="Only read Halo tickets with an action since this ISO 8601 date/time",
+        )
+        parser.add_argument(
+            "-p", "--page-size", type=int, default=100, help="Halo tickets per request"
+        )
+
+    def handle(self, *args, **options):
+        credentials = HelpDeskCreds.objects.get(zendesk_email=options["credentials"])
+        halo_manager = HaloManager(
+            client_id=credentials.halo_client_id, client_secret=credentials.halo_client_secret
+        )
+
+        changed_since = self.get_changed_since(credentials.halo_client_id, options)
+        if changed_since is None:
+            self.stdout.write("Reading all Halo tickets")
+        else:
+            self.stdout.write(f"Reading Halo tickets with an action since {changed_since}")
+
+        ticket_count = 0
+        halo_tickets = []
+        for halo_ticket in halo_manager.iter_tickets(
+            changed_since=changed_since, page_size=options["page_size"]
+        ):
+            halo_tickets.append(halo_ticket)
+            if len(halo_tickets) >= options["page_size"]:
+                ticket_count += save_halo_tickets(credentials.halo_client_id, halo_tickets)
+                halo_tickets = []
+        ticket_count += save_halo_tickets(credentials.halo_client_id, halo_tickets)
+
+        self.stdout.write(f"Saved {ticket_count} Halo tickets")
+
+    def get_changed_since(self, halo_client_id, options):
+        if options["since"] is not None:
+            return options["since"]
+        if options["full"]:
+            return None
+        # The read model is its own checkpoint, for each Halo client
+        return HaloTicket.objects.filter(halo_client_id=halo_client_id).aggregate(
+            Max("last_action")
+        )["last_action__max"]
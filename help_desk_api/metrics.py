@@ -0,0 +1,215 @@
+"""
+Counters shared by every process, kept in the coordination cache
+and reported by the /metrics/ endpoint.
+
+Metrics are declared once, at module level, where they're used, e.g.
+
+    hits = Counter("ticket_cache.hits")
+    hits.increment()
+
+Counts are added up in each process and added to the cache's once every
+METRICS_FLUSH_INTERVAL seconds, when they're next incremented, so counting costs
+a round trip to the cache per interval, not per increment; maxima are kept the
+same way. They're also added before a snapshot is taken and when the process exits.
+
+Recording a metric never raises: if the cache can't be reached it's logged and dropped.
+"""
+
+import atexit
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+# Distributions record values to this many decimal places, as cache counters are integers
+DISTRIBUTION_PRECISION = 3
+
+REGISTRY = {}
+
+
+def metrics_cache():
+    return caches[settings.COORDINATION_CACHE]
+
+
+def metric_cache_key(name):
+    return f"metrics:{name}"
+
+
+def add_to_counter(key, amount):
+    cache = metrics_cache()
+    try:
+        try:
+            return cache.incr(key, amount)
+        except ValueError:
+            # Not counted before
+            cache.add(key, 0, timeout=None)
+            return cache.incr(key, amount)
+    except ValueError as exp:
+        logger.warning(f"Couldn't record metric {key}: {exp}")
+        return None
+
+
+def raise_maximum(key, value):
+    """
+    Read then written, so may miss a larger value written concurrently by another process
+    """
+    cache = metrics_cache()
+    if value > cache.get(key, 0):
+        cache.set(key, value, timeout=None)
+
+
+class PendingCounts:
+    """
+    Counts and maxima seen in this process that haven't been added to the cache's yet
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = defaultdict(int)
+        self.maxima = {}
+        self.flushed_at = time.monotonic()
+
+    def add(self, key, amount):
+        with self.lock:
+            self.counts[key] += amount
+            due = self.due()
+        if due:
+            self.flush()
+
+    def observe_max(self, key, value):
+        with self.lock:
+            if key not in self.maxima or value > self.maxima[key]:
+                self.maxima[key] = value
+            due = self.due()
+        if due:
+            self.flush()
+
+    def due(self):
+        return time.monotonic() - self.flushed_at >= settings.METRICS_FLUSH_INTERVAL
+
+    def flush(self):
+        with self.lock:
+            counts, self.counts = self.counts, defaultdict(int)
+            maxima, self.maxima = self.maxima, {}
+            self.flushed_at = time.monotonic()
+        for key, amount in counts.items():
+            add_to_counter(key, amount)
+        for key, value in maxima.items():
+            raise_maximum(key, value)
+
+    def clear(self):
+        with self.lock:
+            self.counts.clear()
+            self.maxima.clear()
+
+
+pending_counts = PendingCounts()
+atexit.register(pending_counts.flush)
+
+
+class Metric:
+    def __init__(self, name):
+        if name in REGISTRY:
+            raise ValueError(f"Metric {name} is already registered")
+        self.name = name
+        REGISTRY[name] = self
+
+    @property
+    def cache_keys(self):
+        return [metric_cache_key(self.name)]
+
+    def report(self, values):
+        """
+        :param values: The cached values of every metric, by cache key
+        """
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    def increment(self, amount=1):
+        pending_counts.add(metric_cache_key(self.name), amount)
+
+    def report(self, values):
+        return {self.name: values.get(metric_cache_key(self.name), 0)}
+
+
+class Distribution(Metric):
+    """
+    Count, total and maximum of observed values, e.g. durations
+    """
+
+    scale = 10**DISTRIBUTION_PRECISION
+
+    @property
+    def cache_keys(self):
+        return [metric_cache_key(f"{self.name}.{part}") for part in ("count", "total", "max")]
+
+    def observe(self, value):
+        count_key, total_key, max_key = self.cache_keys
+        scaled = round(value * self.scale)
+        pending_counts.observe_max(max_key, scaled)
+        pending_counts.add(count_key, 1)
+        pending_counts.add(total_key, scaled)
+
+    def report(self, values):
+        count, total, maximum = [values.get(key, 0) for key in self.cache_keys]
+        return {
+            f"{self.name}.count": count,
+            f"{self.name}.mean": (
+                round(total / count / self.scale, DISTRIBUTION_PRECISION) if count else None
+            ),
+            f"{self.name}.max": maximum / self.scale if count else None,
+        }
+
+
+class Gauge(Metric):
+    """
+    The latest value set, e.g. the length of a queue
+    """
+
+    def set(self, value):
+        metrics_cache().set(metric_cache_key(self.name), value, timeout=None)
+
+    def report(self, values):
+        return {self.name: values.get(metric_cache_key(self.name), None)}
+
+
+class Ratio(Metric):
+    """
+    Derived from counters: the share of the denominators' total that's in the numerators
+    """
+
+    def __init__(self, name, numerators, denominators):
+        super().__init__(name)
+        self.numerators = numerators
+        self.denominators = denominators
+
+    @property
+    def cache_keys(self):
+        return []
+
+    def report(self, values):
+        def total(counters):
+            return sum(values.get(metric_cache_key(counter.name), 0) for counter in counters)
+
+        denominator = total(self.denominators)
+        return {self.name: round(total(self.numerators) / denominator, 4) if denominator else None}
+
+
+def snapshot():
+    """
+    Every registered metric, read from the cache in one request,
+    once this process's counts have been added
+    """
+    pending_counts.flush()
+    keys = [key for metric in REGISTRY.values() for key in metric.cache_keys]
+    values = metrics_cache().get_many(keys)
+    report = {}
+    for metric in REGISTRY.values():
+        report.update(metric.report(values))
+    return report
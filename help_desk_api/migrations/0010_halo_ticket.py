@@ -0,0 +1,60 @@
+# Generated by Django 4.2.15 on 2026-10-19 12:51
+
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("help_desk_api", "0009_load_initial_custom_field_data"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="HaloTicket",
+            fields=[
+                (
+                    "halo_id",
+                    models.BigIntegerField(
+                        primary_key=True, serialize=False, verbose_name="Halo ID"
+                    ),
+                ),
+                (
+                    "zendesk_id",
+                    models.BigIntegerField(blank=True, null=True, verbose_name="Zendesk ID"),
+                ),
+                ("summary", models.TextField(blank=True, default="")),
+                ("requester_name", models.CharField(blank=True, default="")),
+                ("requester_email", models.CharField(blank=True, default="")),
+                ("status", models.CharField(blank=True, default="")),
+                (
+                    "tags",
+                    django.contrib.postgres.fields.ArrayField(
+                        base_field=models.CharField(), blank=True, default=list, size=None
+                    ),
+                ),
+                ("custom_fields", models.JSONField(blank=True, default=dict)),
+                ("last_action", models.DateTimeField(blank=True, null=True)),
+                (
+                    "search_vector",
+                    django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+                ),
+            ],
+            options={
+                "indexes": [
+                    django.contrib.postgres.indexes.GinIndex(
+                        fields=["search_vector"], name="halo_ticket_search_vector"
+                    ),
+                    django.contrib.postgres.indexes.GinIndex(
+                        fields=["tags"], name="halo_ticket_tags"
+                    ),
+                    models.Index(fields=["zendesk_id"], name="halo_ticket_zendesk_id"),
+                    models.Index(fields=["requester_email"], name="halo_ticket_requester_email"),
+                    models.Index(fields=["last_action"], name="halo_ticket_last_action"),
+                ],
+            },
+        ),
+    ]
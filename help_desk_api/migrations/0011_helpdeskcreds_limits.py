@@ -0,0 +1,43 @@
+# Generated by Django 4.2.15 on 2026-10-19 13:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("help_desk_api", "0010_halo_ticket"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="helpdeskcreds",
+            name="max_concurrent_requests",
+            field=models.PositiveIntegerField(
+                blank=True,
+                help_text="Requests allowed in progress at the same time",
+                null=True,
+                verbose_name="Maximum concurrent requests",
+            ),
+        ),
+        migrations.AddField(
+            model_name="helpdeskcreds",
+            name="rate_limit",
+            field=models.PositiveIntegerField(
+                blank=True,
+                help_text="Requests allowed per minute",
+                null=True,
+                verbose_name="Rate limit",
+            ),
+        ),
+        migrations.AddField(
+            model_name="helpdeskcreds",
+            name="rate_limit_burst",
+            field=models.PositiveIntegerField(
+                blank=True,
+                help_text="Requests allowed at once after a quiet spell; defaults to the rate limit",
+                null=True,
+                verbose_name="Rate limit burst",
+            ),
+        ),
+    ]
@@ -0,0 +1,78 @@
+# Generated by Django 4.2.15 on 2026-10-19 13:34
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+import help_desk_api.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("help_desk_api", "0011_helpdeskcreds_limits"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PendingUpload",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True, primary_key=True, serialize=False, verbose_name="ID"
+                    ),
+                ),
+                (
+                    "token",
+                    models.CharField(
+                        default=help_desk_api.models.new_pending_upload_token,
+                        max_length=64,
+                        unique=True,
+                    ),
+                ),
+                ("filename", models.CharField(blank=True, default="")),
+                ("content_type", models.CharField(default="text/plain")),
+                ("data", models.BinaryField(null=True)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "Pending scan"),
+                            ("scanning", "Scanning"),
+                            ("clean", "Clean"),
+                            ("infected", "Infected"),
+                            ("failed", "Failed"),
+                        ],
+                        default="pending",
+                    ),
+                ),
+                ("attempts", models.PositiveIntegerField(default=0)),
+                ("available_at", models.DateTimeField(default=django.utils.timezone.now)),
+                (
+                    "halo_attachment_id",
+                    models.BigIntegerField(
+                        blank=True, null=True, verbose_name="Halo attachment ID"
+                    ),
+                ),
+                (
+                    "halo_ticket_id",
+                    models.BigIntegerField(blank=True, null=True, verbose_name="Halo ticket ID"),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("scanned_at", models.DateTimeField(blank=True, null=True)),
+                (
+                    "credentials",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="help_desk_api.helpdeskcreds",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(fields=["status", "available_at"], name="pending_upload_queue")
+                ],
+            },
+        ),
+    ]
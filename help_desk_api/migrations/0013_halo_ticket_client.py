@@ -0,0 +1,80 @@
+# Generated by Django 4.2.15 on 2026-10-19 14:45
+
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """
+    HaloTicket is a read model, so rather than guess whose its tickets are,
+    it's recreated empty, to be filled again by sync_halo_tickets for each client
+    """
+
+    dependencies = [
+        ("help_desk_api", "0012_pending_upload"),
+    ]
+
+    operations = [
+        migrations.DeleteModel(
+            name="HaloTicket",
+        ),
+        migrations.CreateModel(
+            name="HaloTicket",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True, primary_key=True, serialize=False, verbose_name="ID"
+                    ),
+                ),
+                (
+                    "halo_client_id",
+                    models.CharField(max_length=255, verbose_name="Halo client ID"),
+                ),
+                ("halo_id", models.BigIntegerField(verbose_name="Halo ID")),
+                (
+                    "zendesk_id",
+                    models.BigIntegerField(blank=True, null=True, verbose_name="Zendesk ID"),
+                ),
+                ("summary", models.TextField(blank=True, default="")),
+                ("requester_name", models.CharField(blank=True, default="")),
+                ("requester_email", models.CharField(blank=True, default="")),
+                ("status", models.CharField(blank=True, default="")),
+                (
+                    "tags",
+                    django.contrib.postgres.fields.ArrayField(
+                        base_field=models.CharField(), blank=True, default=list, size=None
+                    ),
+                ),
+                ("custom_fields", models.JSONField(blank=True, default=dict)),
+                ("last_action", models.DateTimeField(blank=True, null=True)),
+                (
+                    "search_vector",
+                    django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+                ),
+            ],
+            options={
+                "indexes": [
+                    django.contrib.postgres.indexes.GinIndex(
+                        fields=["search_vector"], name="halo_ticket_search_vector"
+                    ),
+                    django.contrib.postgres.indexes.GinIndex(
+                        fields=["tags"], name="halo_ticket_tags"
+                    ),
+                    models.Index(fields=["zendesk_id"], name="halo_ticket_zendesk_id"),
+                    models.Index(fields=["requester_email"], name="halo_ticket_requester_email"),
+                    models.Index(
+                        fields=["halo_client_id", "last_action"], name="halo_ticket_last_action"
+                    ),
+                ],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="haloticket",
+            constraint=models.UniqueConstraint(
+                fields=("halo_client_id", "halo_id"), name="halo_ticket_client_halo_id"
+            ),
+        ),
+    ]
@@ -1,7 +1,13 @@
+import uuid
+
 from django.conf import settings
 from django.contrib.auth.hashers import make_password
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.core.exceptions import ValidationError
 from django.db import models
+from django.utils import timezone
 from multiselectfield import MultiSelectField
 
 
@@ -78,6 +84,26 @@ class HelpDeskCreds(models.Model):
         blank=True,
     )
 
+    # Limits on requests made with these credentials; empty means no limit
+    rate_limit = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        verbose_name="Rate limit",
+        help_text="Requests allowed per minute",
+    )
+    rate_limit_burst = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        verbose_name="Rate limit burst",
+        help_text="Requests allowed at once after a quiet spell; defaults to the rate limit",
+    )
+    max_concurrent_requests = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        verbose_name="Maximum concurrent requests",
+        help_text="Requests allowed in progress at the same time",
+    )
+
     last_modified = models.DateTimeField(auto_now=True)
 
     def clean_fields(self, exclude=None):
@@ -132,3 +158,86 @@ class CustomField(models.Model):
 
     def __str__(self):
         return f"{self.zendesk_name} -> {self.halo_name}"
+
+
+class HaloTicket(models.Model):
+    """
+    Local read model of Halo tickets, kept current by the sync_halo_tickets command,
+    so that searching them doesn't need a full scan of Halo.
+    Each is held for the Halo client that read it, and only searched by that client.
+    """
+
+    halo_client_id = models.CharField(max_length=255, verbose_name="Halo client ID")
+    halo_id = models.BigIntegerField(verbose_name="Halo ID")
+    zendesk_id = models.BigIntegerField(null=True, blank=True, verbose_name="Zendesk ID")
+    summary = models.TextField(default="", blank=True)
+    requester_name = models.CharField(default="", blank=True)
+    requester_email = models.CharField(default="", blank=True)
+    # Zendesk's name for the status, as that's what searches use
+    status = models.CharField(default="", blank=True)
+    tags = ArrayField(models.CharField(), default=list, blank=True)
+    custom_fields = models.JSONField(default=dict, blank=True)
+    last_action = models.DateTimeField(null=True, blank=True)
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["halo_client_id", "halo_id"], name="halo_ticket_client_halo_id"
+            ),
+        ]
+        indexes = [
+            GinIndex(fields=["search_vector"], name="halo_ticket_search_vector"),
+            GinIndex(fields=["tags"], name="halo_ticket_tags"),
+            models.Index(fields=["zendesk_id"], name="halo_ticket_zendesk_id"),
+            models.Index(fields=["requester_email"], name="halo_ticket_requester_email"),
+            models.Index(fields=["halo_client_id", "last_action"], name="halo_ticket_last_action"),
+        ]
+
+    def __str__(self):
+        return f"{self.halo_id}: {self.summary}"
+
+
+def new_pending_upload_token():
+    return f"pending-{uuid.uuid4().hex}"
+
+
+class PendingUpload(models.Model):
+    """
+    An upload accepted before it's been scanned for viruses, queued for
+    the scan_uploads command, which sends it to Halo if it passes
+    """
+
+    class Status(models.TextChoices):
+        PENDING = "pending", "Pending scan"
+        SCANNING = "scanning", "Scanning"
+        CLEAN = "clean", "Clean"
+        INFECTED = "infected", "Infected"
+        FAILED = "failed", "Failed"
+
+    # Given to the client in place of a Halo attachment ID
+    token = models.CharField(max_length=64, unique=True, default=new_pending_upload_token)
+    credentials = models.ForeignKey(HelpDeskCreds, on_delete=models.CASCADE)
+    filename = models.CharField(default="", blank=True)
+    content_type = models.CharField(default="text/plain")
+    # Cleared once the upload's been scanned
+    data = models.BinaryField(null=True)
+    status = models.CharField(choices=Status.choices, default=Status.PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    # When the upload may next be claimed, to scan it or retry a scan
+    available_at = models.DateTimeField(default=timezone.now)
+    halo_attachment_id = models.BigIntegerField(
+        null=True, blank=True, verbose_name="Halo attachment ID"
+    )
+    # The ticket it's attached to once it passes, if created while it was being scanned
+    halo_ticket_id = models.BigIntegerField(null=True, blank=True, verbose_name="Halo ticket ID")
+    created_at = models.DateTimeField(auto_now_add=True)
+    scanned_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "available_at"], name="pending_upload_queue"),
+        ]
+
+    def __str__(self):
+        return f"{self.token}: {self.filename} ({self.status})"
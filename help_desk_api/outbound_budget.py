@@ -0,0 +1,165 @@
+"""
+A request budget for each upstream (Halo, Zendesk), shared by the web workers
+and the management commands through the coordination cache,
+so that together they stay inside the upstream's rate limit.
+
+Requests are interactive, made while handling an API request, or background,
+e.g. migration commands and cache refreshes. Background requests may only use
+OUTBOUND_BACKGROUND_SHARE of the budget, and wait if the upstream says it has less
+than the rest left, so they can't starve interactive traffic. Interactive requests
+wait at most OUTBOUND_MAX_INTERACTIVE_WAIT seconds for the budget before going anyway.
+
+The budget follows the upstream's rate limit headers: a lower advertised limit
+replaces the configured one, and a 429's Retry-After pauses everyone.
+"""
+
+import contextvars
+import logging
+import math
+import time
+from contextlib import contextmanager
+from http import HTTPStatus
+
+from django.conf import settings
+from django.core.cache import caches
+
+from help_desk_api.deadlines import remaining
+from help_desk_api.metrics import Counter, Distribution
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+
+# Anything not made while handling an API request is background
+request_priority = contextvars.ContextVar("request_priority", default=BACKGROUND)
+
+# The per-minute limit is spread over windows this long, to smooth out bursts
+WINDOW = 10  # seconds
+# How long an advertised limit is remembered
+ADVERTISED_LIMIT_TIMEOUT = 60 * 60  # seconds
+# How long a count of remaining requests is trusted; upstream limits are per minute
+REMAINING_TIMEOUT = 60  # seconds
+
+LIMIT_HEADERS = ("X-Rate-Limit", "X-RateLimit-Limit", "RateLimit-Limit")
+REMAINING_HEADERS = ("X-Rate-Limit-Remaining", "X-RateLimit-Remaining", "RateLimit-Remaining")
+
+
+@contextmanager
+def outbound_priority(priority):
+    token = request_priority.set(priority)
+    try:
+        yield
+    finally:
+        request_priority.reset(token)
+
+
+def header_int(headers, names):
+    for name in names:
+        value = headers.get(name, None)
+        if isinstance(value, str) and value.strip().isdigit():
+            return int(value)
+    return None
+
+
+class OutboundBudget:
+    def __init__(self, name, setting):
+        """
+        :param setting: Name of the setting with the upstream's requests per minute
+        """
+        self.name = name
+        self.setting = setting
+        self.waits = Counter(f"outbound.{name}.waits")
+        self.wait_time = Distribution(f"outbound.{name}.wait_seconds")
+        self.throttled = Counter(f"outbound.{name}.throttled")
+
+    @property
+    def cache(self):
+        return caches[settings.COORDINATION_CACHE]
+
+    def cache_key(self, part):
+        return f"outbound:{self.name}:{part}"
+
+    def requests_per_minute(self):
+        configured = getattr(settings, self.setting)
+        advertised = self.cache.get(self.cache_key("advertised_limit"), None)
+        if advertised and (not configured or advertised < configured):
+            return advertised
+        return configured
+
+    def acquire(self):
+        """
+        Wait until a request may be made within the budget
+        """
+        priority = request_priority.get()
+        started = None
+        while (wait := self.time_to_wait(priority)) > 0:
+            if started is None:
+                started = time.monotonic()
+            waited = time.monotonic() - started
+            if priority == INTERACTIVE:
+                max_wait = settings.OUTBOUND_MAX_INTERACTIVE_WAIT
+                if (time_left := remaining()) is not None:
+                    # Leave the request its time for the upstream call itself
+                    max_wait = min(max_wait, time_left / 2)
+                if waited >= max_wait:
+                    logger.warning(f"Outbound {self.name} budget exceeded by interactive request")
+                    break
+                wait = min(wait, max_wait - waited)
+            time.sleep(wait)
+        if started is not None:
+            self.waits.increment()
+            self.wait_time.observe(time.monotonic() - started)
+
+    def time_to_wait(self, priority):
+        """
+        :returns: 0 if a request may go now, which takes it from the budget,
+            otherwise the seconds to wait before asking again
+        """
+        now = time.time()
+        paused_until = self.cache.get(self.cache_key("paused_until"), None)
+        if paused_until and paused_until > now:
+            return paused_until - now
+        requests_per_minute = self.requests_per_minute()
+        if not requests_per_minute:
+            return 0
+        to_next_window = WINDOW - now % WINDOW
+        window_limit = max(requests_per_minute * WINDOW / 60, 1)
+        if priority == BACKGROUND:
+            window_limit = max(window_limit * settings.OUTBOUND_BACKGROUND_SHARE, 1)
+            remaining_requests = self.cache.get(self.cache_key("remaining"), None)
+            reserved = requests_per_minute * (1 - settings.OUTBOUND_BACKGROUND_SHARE)
+            if remaining_requests is not None and remaining_requests < reserved:
+                return to_next_window
+        window_key = self.cache_key(f"window:{math.floor(now / WINDOW)}")
+        try:
+            self.cache.add(window_key, 0, timeout=WINDOW * 2)
+            used = self.cache.incr(window_key, 1)
+        except ValueError:
+            # The cache can't be reached, so go ahead rather than wait for ever
+            return 0
+        if used > window_limit:
+            # Give it back, so waiting doesn't use up the budget
+            self.cache.incr(window_key, -1)
+            return to_next_window
+        return 0
+
+    def observe(self, response):
+        """
+        Take note of the upstream's rate limit headers
+        """
+        headers = response.headers
+        if limit := header_int(headers, LIMIT_HEADERS):
+            self.cache.set(self.cache_key("advertised_limit"), limit, ADVERTISED_LIMIT_TIMEOUT)
+        remaining_requests = header_int(headers, REMAINING_HEADERS)
+        if remaining_requests is not None:
+            self.cache.set(self.cache_key("remaining"), remaining_requests, REMAINING_TIMEOUT)
+        if response.status_code == HTTPStatus.TOO_MANY_REQUESTS:
+            self.throttled.increment()
+            retry_after = header_int(headers, ("Retry-After",)) or 1
+            logger.warning(f"{self.name} rate limit hit; pausing for {retry_after} seconds")
+            self.cache.set(self.cache_key("paused_until"), time.time() + retry_after, retry_after)
+
+
+halo_budget = OutboundBudget("halo", "HALO_REQUESTS_PER_MINUTE")
+zendesk_budget = OutboundBudget("zendesk", "ZENDESK_REQUESTS_PER_MINUTE")
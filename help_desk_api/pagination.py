@@ -1,3 +1,6 @@
+import base64
+import json
+from datetime import datetime
 from typing import OrderedDict
 
 from rest_framework.pagination import PageNumberPagination
@@ -23,3 +26,56 @@ class CustomPagination(PageNumberPagination):
                 ]
             )
         )
+
+
+class SearchPagination(PageNumberPagination):
+    """
+    Pages of search results in the shape Zendesk's search.json returns them
+    """
+
+    page_size = 100
+    page_size_query_param = "per_page"
+    max_page_size = 100
+
+    def get_paginated_response(self, data):
+        return Response(
+            OrderedDict(
+                [
+                    ("results", data),
+                    ("facets", None),
+                    ("next_page", self.get_next_link()),
+                    ("previous_page", self.get_previous_link()),
+                    ("count", self.page.paginator.count),
+                ]
+            )
+        )
+
+
+class TicketCursor:
+    """
+    Position in Halo's tickets, ordered by last action then ID,
+    encoded as an opaque string like Zendesk's incremental export cursors
+    """
+
+    def __init__(self, last_action: datetime, ticket_id: int = 0):
+        self.last_action = last_action
+        self.ticket_id = ticket_id
+
+    @property
+    def position(self):
+        return self.last_action, self.ticket_id
+
+    def encode(self) -> str:
+        value = json.dumps({"last_action": self.last_action.isoformat(), "id": self.ticket_id})
+        return base64.urlsafe_b64encode(value.encode("utf-8")).decode("ascii")
+
+    @classmethod
+    def decode(cls, cursor: str) -> "TicketCursor":
+        """
+        :raises ValueError: If the cursor isn't one of ours
+        """
+        try:
+            value = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+            return cls(datetime.fromisoformat(value["last_action"]), int(value["id"]))
+        except (KeyError, TypeError, UnicodeError, json.JSONDecodeError) as exp:
+            raise ValueError(f"Invalid cursor: {cursor}") from exp
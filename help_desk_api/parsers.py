@@ -0,0 +1,30 @@
+import copy
+
+import orjson
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+
+from help_desk_api.renderers import ORJSONRenderer
+
+
+class ORJSONParser(JSONParser):
+    """
+    JSONParser using orjson.
+    If the proxy middleware has already parsed the request body,
+    that is used rather than parsing it again.
+    """
+
+    renderer_class = ORJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        request = parser_context.get("request", None)
+        payloads = getattr(getattr(request, "_request", None), "payloads", None)
+
+        try:
+            if payloads is not None:
+                # Views add keys to request.data, which mustn't leak into the shared copy
+                return copy.copy(payloads.request_json)
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError(f"JSON parse error - {exc}")
@@ -0,0 +1,27 @@
+import orjson
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+ORJSON_OPTIONS = (
+    orjson.OPT_NON_STR_KEYS
+    # Let DRF's encoder format dates and times so the output doesn't change
+    | orjson.OPT_PASSTHROUGH_DATETIME
+)
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer using orjson for the compact output the API returns,
+    leaving indented output (e.g. for the browsable API) to the standard library
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        ret = orjson.dumps(data, default=JSONEncoder().default, option=ORJSON_OPTIONS)
+        # As JSONRenderer does, keep the output a strict javascript subset
+        return ret.replace("\u2028".encode(), b"\\u2028").replace("\u2029".encode(), b"\\u2029")
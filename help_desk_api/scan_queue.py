@@ -0,0 +1,214 @@
+"""
+Uploads queued to be scanned for viruses by the scan_uploads command,
+so clients aren't kept waiting for the scan.
+
+A queued upload is given a "pending-" token in place of a Halo attachment ID.
+When a ticket's created with it, it's attached if it's already passed its scan,
+and otherwise attached by the worker once it does; uploads that fail aren't attached.
+
+Uploads are claimed by workers in the database, so any number of them can run;
+one that's claimed but not finished in AV_SCAN_CLAIM_TIMEOUT is claimed again.
+"""
+
+import logging
+import tempfile
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils import timezone
+from halo.clam_av import SCAN_CHUNK_SIZE
+
+from help_desk_api.metrics import Counter, Distribution, Gauge
+from help_desk_api.models import PendingUpload
+
+logger = logging.getLogger(__name__)
+
+PENDING_TOKEN_PREFIX = "pending-"
+
+queue_depth = Gauge("scan_queue.depth")
+queued = Counter("scan_queue.queued")
+clean = Counter("scan_queue.clean")
+infected = Counter("scan_queue.infected")
+failed = Counter("scan_queue.failed")
+retried = Counter("scan_queue.retried")
+# From being queued to being claimed, and from being claimed to being scanned
+wait_seconds = Distribution("scan_queue.wait_seconds")
+scan_seconds = Distribution("scan_queue.scan_seconds")
+
+WAITING = (PendingUpload.Status.PENDING, PendingUpload.Status.SCANNING)
+
+
+class UploadTooLargeException(Exception):
+    pass
+
+
+def is_pending_token(token):
+    return isinstance(token, str) and token.startswith(PENDING_TOKEN_PREFIX)
+
+
+def spool(stream):
+    """
+    :param stream: File-like object with the upload
+    :returns: A temporary file of the whole stream, read in chunks
+    :raises UploadTooLargeException: if it's more than AV_SCAN_QUEUE_MAX_UPLOAD bytes
+    """
+    spooled = tempfile.SpooledTemporaryFile(max_size=settings.UPLOAD_SPOOL_MAX_MEMORY)
+    size = 0
+    try:
+        while chunk := stream.read(SCAN_CHUNK_SIZE):
+            size += len(chunk)
+            if size > settings.AV_SCAN_QUEUE_MAX_UPLOAD:
+                raise UploadTooLargeException(
+                    f"Upload is over {settings.AV_SCAN_QUEUE_MAX_UPLOAD} bytes"
+                )
+            spooled.write(chunk)
+    except BaseException:
+        spooled.close()
+        raise
+    spooled.seek(0)
+    return spooled
+
+
+def enqueue(credentials, filename, stream, content_type):
+    with spool(stream) as spooled:
+        upload = PendingUpload.objects.create(
+            credentials=credentials,
+            filename=filename or "",
+            data=spooled.read(),
+            content_type=content_type,
+        )
+    queued.increment()
+    return upload
+
+
+def update_queue_depth():
+    depth = PendingUpload.objects.filter(status__in=WAITING).count()
+    queue_depth.set(depth)
+    return depth
+
+
+def claim(count):
+    """
+    Claim up to `count` uploads to scan, oldest first
+
+    :returns: The claimed uploads
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        uploads = list(
+            PendingUpload.objects.select_for_update(skip_locked=True)
+            .select_related("credentials")
+            .filter(status__in=WAITING, available_at__lte=now)
+            .order_by("available_at")[:count]
+        )
+        for upload in uploads:
+            if upload.status == PendingUpload.Status.PENDING:
+                wait_seconds.observe((now - upload.created_at).total_seconds())
+            upload.status = PendingUpload.Status.SCANNING
+            upload.available_at = now + timedelta(seconds=settings.AV_SCAN_CLAIM_TIMEOUT)
+        PendingUpload.objects.bulk_update(uploads, ["status", "available_at"])
+    return uploads
+
+
+def finish(upload, status, halo_attachment_id=None, attach=None):
+    """
+    Record an upload's scan, and if it passed and its ticket's been created, attach it
+
+    :param attach: Called with the Halo ticket ID and a list of attachment IDs
+    """
+    with transaction.atomic():
+        # Locked, so a ticket being created with it at the same time waits to see the outcome
+        upload = PendingUpload.objects.select_for_update().get(pk=upload.pk)
+        upload.status = status
+        upload.halo_attachment_id = halo_attachment_id
+        upload.scanned_at = timezone.now()
+        upload.data = None
+        if status == PendingUpload.Status.CLEAN:
+            clean.increment()
+            if upload.halo_ticket_id is not None and attach is not None:
+                # If attaching fails, so does the scan, and it's claimed again later
+                attach(upload.halo_ticket_id, [halo_attachment_id])
+        elif status == PendingUpload.Status.INFECTED:
+            logger.warning(f"Upload {upload.token} ({upload.filename}) failed the virus scan")
+            infected.increment()
+        upload.save()
+
+
+def retry(upload, error):
+    """
+    Put an upload back on the queue after its scan went wrong, or give up on it
+    """
+    upload.attempts += 1
+    if upload.attempts >= settings.AV_SCAN_MAX_ATTEMPTS:
+        logger.error(f"Giving up scanning upload {upload.token}: {error}")
+        failed.increment()
+        upload.status = PendingUpload.Status.FAILED
+        upload.data = None
+    else:
+        logger.warning(f"Scanning upload {upload.token} failed, will retry: {error}")
+        retried.increment()
+        upload.status = PendingUpload.Status.PENDING
+        delay = settings.AV_SCAN_RETRY_DELAY * 2 ** (upload.attempts - 1)
+        upload.available_at = timezone.now() + timedelta(seconds=delay)
+    upload.save(update_fields=["attempts", "status", "data", "available_at"])
+
+
+def resolve_upload_tokens(tokens):
+    """
+    Swap the tokens of uploads that have passed their scan for their Halo attachment IDs,
+    and take out those that haven't
+
+    :returns: The tokens to give Halo, and those of uploads still to be scanned
+    """
+    # If dual-running, the client has Zendesk's tokens, which map to ours
+    upload_cache = caches[settings.UPLOAD_DATA_CACHE]
+    tokens = [upload_cache.get(token, token) for token in tokens]
+    pending_tokens = [token for token in tokens if is_pending_token(token)]
+    if not pending_tokens:
+        return tokens, []
+    uploads = {
+        upload.token: upload for upload in PendingUpload.objects.filter(token__in=pending_tokens)
+    }
+    resolved = []
+    waiting = []
+    for token in tokens:
+        if not is_pending_token(token):
+            resolved.append(token)
+        elif (upload := uploads.get(token, None)) is None:
+            logger.warning(f"Upload {token} not found")
+        elif upload.status == PendingUpload.Status.CLEAN:
+            resolved.append(upload.halo_attachment_id)
+        elif upload.status in WAITING:
+            waiting.append(token)
+        else:
+            logger.warning(f"Upload {token} not attached: {upload.get_status_display()}")
+    return resolved, waiting
+
+
+def attach_when_scanned(tokens, halo_ticket_id, attach):
+    """
+    Have uploads that were still being scanned when their ticket was created
+    attached to it once they pass. Any that passed since are attached now.
+
+    :param attach: Called with the Halo ticket ID and a list of attachment IDs
+    """
+    if not tokens:
+        return
+    with transaction.atomic():
+        uploads = list(
+            PendingUpload.objects.select_for_update().filter(
+                token__in=tokens, halo_ticket_id__isnull=True
+            )
+        )
+        for upload in uploads:
+            upload.halo_ticket_id = halo_ticket_id
+        PendingUpload.objects.bulk_update(uploads, ["halo_ticket_id"])
+        scanned = [
+            upload.halo_attachment_id
+            for upload in uploads
+            if upload.status == PendingUpload.Status.CLEAN
+        ]
+        if scanned:
+            attach(halo_ticket_id, scanned)
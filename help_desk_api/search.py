@@ -0,0 +1,169 @@
+"""
+Zendesk-style ticket search, served from the local `HaloTicket` read model.
+Tickets are held, and searched, per Halo client, as each client may see different tickets.
+"""
+
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db.models import Q
+from halo.halo_manager import parse_halo_datetime
+
+from help_desk_api.models import HaloTicket
+from help_desk_api.serializers import (
+    ZendeskStatusFromHaloField,
+    zendesk_ticket_id_from_halo_ticket,
+)
+
+SEARCH_VECTOR = (
+    SearchVector("summary", weight="A")
+    + SearchVector("requester_name", "requester_email", weight="B")
+    + SearchVector("tags", weight="C")
+)
+
+# Zendesk orders statuses like this for searches like status<solved
+ZENDESK_STATUSES = ["new", "open", "pending", "hold", "solved", "closed"]
+
+# A phrase in double quotes, maybe after a keyword and operator, or anything up to a space.
+# Quotes only count in pairs, so an apostrophe or a stray quote is just part of the text.
+TOKEN_PATTERN = re.compile(r'(?P<prefix>-?\w+(?::|<=|>=|<|>))?"(?P<quoted>[^"]*)"|(?P<bare>\S+)')
+TERM_PATTERN = re.compile(r"^(?P<negate>-?)(?P<keyword>\w+)(?P<operator>:|<=|>=|<|>)(?P<value>.+)$")
+
+
+class SearchQueryError(ValueError):
+    pass
+
+
+def read_model_from_halo_ticket(halo_client_id: str, halo_ticket: dict) -> HaloTicket:
+    requester = halo_ticket.get("user", {}) or {}
+    last_action = halo_ticket.get("lastactiondate", None)
+    return HaloTicket(
+        halo_client_id=halo_client_id,
+        halo_id=halo_ticket["id"],
+        zendesk_id=zendesk_ticket_id_from_halo_ticket(halo_ticket),
+        summary=halo_ticket.get("summary", "") or "",
+        requester_name=requester.get("name", halo_ticket.get("user_name", "")) or "",
+        requester_email=(
+            requester.get("emailaddress", halo_ticket.get("user_email", "")) or ""
+        ).lower(),
+        status=ZendeskStatusFromHaloField.halo_status_id_to_zendesk_status.get(
+            halo_ticket.get("status_id", None), ""
+        ),
+        tags=[tag["text"] for tag in halo_ticket.get("tags", []) if tag.get("text", None)],
+        custom_fields={
+            field["name"]: field.get("value", None)
+            for field in halo_ticket.get("customfields", [])
+            if "name" in field
+        },
+        last_action=parse_halo_datetime(last_action) if last_action else None,
+    )
+
+
+def save_halo_tickets(halo_client_id: str, halo_tickets: list[dict]) -> int:
+    """
+    Insert or update the read model for these Halo tickets, as read by this Halo client,
+    and reindex them for search
+    """
+    tickets = [
+        read_model_from_halo_ticket(halo_client_id, halo_ticket) for halo_ticket in halo_tickets
+    ]
+    if not tickets:
+        return 0
+    HaloTicket.objects.bulk_create(
+        tickets,
+        update_conflicts=True,
+        unique_fields=["halo_client_id", "halo_id"],
+        update_fields=[
+            "zendesk_id",
+            "summary",
+            "requester_name",
+            "requester_email",
+            "status",
+            "tags",
+            "custom_fields",
+            "last_action",
+        ],
+    )
+    HaloTicket.objects.filter(
+        halo_client_id=halo_client_id, halo_id__in=[ticket.halo_id for ticket in tickets]
+    ).update(search_vector=SEARCH_VECTOR)
+    return len(tickets)
+
+
+def search_tickets(halo_client_id: str, query: str):
+    """
+    Supports the common parts of Zendesk's search syntax:
+    type:ticket, status:open (and status<solved etc.), requester:<email or name>,
+    tags:<tag> (or -tags:<tag> to exclude), with anything else searched as text.
+    :param halo_client_id: Only tickets read by this Halo client are searched
+    :raises SearchQueryError: If the query is empty or can't be parsed
+    """
+    if not halo_client_id:
+        return HaloTicket.objects.none()
+    tickets = HaloTicket.objects.filter(halo_client_id=halo_client_id)
+    terms = list(split_terms(query))
+    if not terms:
+        raise SearchQueryError("A search query is required")
+    text_terms = []
+    for term in terms:
+        match = TERM_PATTERN.match(term)
+        keyword = match["keyword"].lower() if match else None
+        if keyword == "type":
+            if match["value"].lower() != "ticket":
+                # Only tickets are held locally
+                return HaloTicket.objects.none()
+            continue
+        condition = term_condition(keyword, match)
+        if condition is None:
+            # Keep quoted phrases together
+            text_terms.append(f'"{term}"' if " " in term else term)
+        elif match["negate"]:
+            tickets = tickets.exclude(condition)
+        else:
+            tickets = tickets.filter(condition)
+
+    if text_terms:
+        search_query = SearchQuery(" ".join(text_terms), search_type="websearch")
+        return (
+            tickets.filter(search_vector=search_query)
+            .annotate(rank=SearchRank("search_vector", search_query))
+            .order_by("-rank", "-last_action")
+        )
+    return tickets.order_by("-last_action")
+
+
+def split_terms(query: str):
+    for match in TOKEN_PATTERN.finditer(query):
+        if match["bare"] is not None:
+            # A stray quote would start a phrase in the text search
+            term = match["bare"].replace('"', "")
+        else:
+            term = (match["prefix"] or "") + match["quoted"]
+        if term:
+            yield term
+
+
+def term_condition(keyword, match):
+    if keyword == "status":
+        return status_condition(match["operator"], match["value"].lower())
+    if keyword == "requester":
+        value = match["value"]
+        return Q(requester_email__iexact=value) | Q(requester_name__icontains=value)
+    if keyword in ("tags", "tag"):
+        return Q(tags__contains=[match["value"]])
+    return None
+
+
+def status_condition(operator: str, status: str) -> Q:
+    if operator == ":":
+        return Q(status=status)
+    if status not in ZENDESK_STATUSES:
+        raise SearchQueryError(f"Unknown status: {status}")
+    position = ZENDESK_STATUSES.index(status)
+    statuses = {
+        "<": ZENDESK_STATUSES[:position],
+        "<=": ZENDESK_STATUSES[: position + 1],
+        ">": ZENDESK_STATUSES[position + 1 :],
+        ">=": ZENDESK_STATUSES[position:],
+    }[operator]
+    return Q(status__in=statuses)
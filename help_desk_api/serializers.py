@@ -8,7 +8,7 @@ from drf_spectacular.utils import extend_schema_field
 from rest_framework import serializers
 from rest_framework.fields import empty
 
-from help_desk_api.models import CustomField
+from help_desk_api.models import CustomField, HaloTicket
 from help_desk_api.utils.utils import apply_zendesk_automatic_html
 
 
@@ -343,6 +343,10 @@ class HaloTagsFromZendeskField(serializers.ListField):
         return [{"text": tag} for tag in instance.pop("tags", [])]
 
 
+def custom_field_mapping_cache_key(zendesk_field_id):
+    return f"custom_field_mapping:{zendesk_field_id}"
+
+
 class HaloCustomFieldFromZendeskField(serializers.DictField):
     specially_excluded_field_values = {"1900000265733": "-", "11013312910749": "-"}
 
@@ -356,6 +360,15 @@ class HaloCustomFieldFromZendeskField(serializers.DictField):
         # Some forms send Zendesk field IDs as strings
         if isinstance(field_id, str):
             field_id = int(field_id)
+        cache = caches[settings.REFERENCE_DATA_CACHE]
+        cache_key = custom_field_mapping_cache_key(field_id)
+        mapping = cache.get(cache_key)
+        if mapping is None:
+            mapping = self.halo_mapping_from_database(field_id)
+            cache.set(cache_key, mapping)
+        return mapping
+
+    def halo_mapping_from_database(self, field_id):
         try:
             field = CustomField.objects.get(zendesk_id=field_id)
         except CustomField.DoesNotExist:
@@ -449,11 +462,31 @@ class HaloNullIdField(serializers.IntegerField):
 
 
 class HaloCopyOfZendeskTicketIdField(serializers.CharField):
+    """
+    When dual-running, the Zendesk ticket ID is stored in a Halo custom field
+    so that Zendesk IDs sent by requesters can be mapped back to Halo tickets.
+    """
+
     def get_attribute(self, instance):
         zendesk_ticket_id = instance.get("zendesk_ticket_id", None)
+        if zendesk_ticket_id is None:
+            return None
         return str(zendesk_ticket_id)
 
 
+def zendesk_ticket_id_from_halo_ticket(halo_ticket):
+    """
+    Recover the Zendesk ticket ID stored by `HaloCopyOfZendeskTicketIdField`, if any
+    """
+    for custom_field in halo_ticket.get("customfields", []):
+        if custom_field.get("name", None) == settings.HALO_ZENDESK_TICKET_ID_FIELD:
+            try:
+                return int(custom_field.get("value", None))
+            except (TypeError, ValueError):
+                return None
+    return None
+
+
 class HaloAttachmentFromZendeskUploadField(serializers.IntegerField):
     def to_representation(self, instance):
         # If this was a Zendesk and Halo request,
@@ -554,6 +587,13 @@ class ZendeskToHaloCreateTicketSerializer(serializers.Serializer):
             serialized_halo_payload["customfields"].append(
                 {"name": "CFEmailToAddress", "value": recipient}
             )
+        zendesk_ticket_id = HaloCopyOfZendeskTicketIdField().get_attribute(zendesk_ticket_data)
+        if zendesk_ticket_id is not None:
+            if "customfields" not in serialized_halo_payload:
+                serialized_halo_payload["customfields"] = []
+            serialized_halo_payload["customfields"].append(
+                {"name": settings.HALO_ZENDESK_TICKET_ID_FIELD, "value": zendesk_ticket_id}
+            )
         return serialized_halo_payload
 
     def fix_user_fields(self, ticket_data):
@@ -627,7 +667,7 @@ class ZendeskToHaloUpdateTicketSerializer(serializers.Serializer):
             "summary": ticket.pop("subject", None),
             "tags": ticket.pop("tags", []),
         }
-        ticket.pop("comment")  # Used in comment serializer so ignore here
+        ticket.pop("comment", None)  # Used in comment serializer so ignore here
         ticket.pop("priority", None)  # Not used by HALO currently
         halo_payload.update(ticket_payload, **ticket)
 
@@ -778,6 +818,28 @@ class HaloToZendeskTicketsContainerSerializer(serializers.Serializer):
     tickets = HaloToZendeskTicketSerializer(many=True)
 
 
+class HaloTicketToZendeskSearchResultSerializer(serializers.ModelSerializer):
+    """
+    Zendesk search result from the local read model of a Halo ticket
+    """
+
+    id = serializers.IntegerField(source="halo_id")
+    subject = serializers.CharField(source="summary")
+    updated_at = serializers.DateTimeField(source="last_action")
+    requester = serializers.SerializerMethodField()
+    result_type = serializers.SerializerMethodField()
+
+    class Meta:
+        model = HaloTicket
+        fields = ["id", "subject", "status", "tags", "updated_at", "requester", "result_type"]
+
+    def get_requester(self, instance) -> dict:
+        return {"name": instance.requester_name, "email": instance.requester_email}
+
+    def get_result_type(self, instance) -> str:
+        return "ticket"
+
+
 class HaloToZendeskUploadSerializer(serializers.Serializer):
     token = serializers.SerializerMethodField()
 
@@ -0,0 +1,39 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from help_desk_api.models import CustomField, Value
+from help_desk_api.serializers import custom_field_mapping_cache_key
+
+
+def forget_custom_field_mappings(custom_fields):
+    cache = caches[settings.REFERENCE_DATA_CACHE]
+    for custom_field in custom_fields:
+        cache.delete(custom_field_mapping_cache_key(custom_field.zendesk_id))
+
+
+@receiver([post_save, post_delete], sender=CustomField)
+def custom_field_changed(sender, instance, **kwargs):
+    forget_custom_field_mappings([instance])
+
+
+@receiver(m2m_changed, sender=CustomField.values.through)
+def custom_field_values_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith("post_"):
+        return
+    if reverse:
+        # instance is a Value; pk_set holds CustomField PKs (None on clear)
+        custom_fields = instance.field.all()
+        if pk_set:
+            custom_fields = CustomField.objects.filter(pk__in=pk_set)
+        forget_custom_field_mappings(custom_fields)
+    else:
+        forget_custom_field_mappings([instance])
+
+
+@receiver([post_save, post_delete], sender=Value)
+def value_changed(sender, instance, **kwargs):
+    if instance.pk is None:
+        return
+    forget_custom_field_mappings(CustomField.objects.filter(values__pk=instance.pk))
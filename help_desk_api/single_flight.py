@@ -0,0 +1,136 @@
+"""
+Coalesces identical concurrent upstream reads, so that a burst of the same GET
+(e.g. several tabs polling one ticket) makes one call to Halo or Zendesk
+and everyone waiting gets its result.
+
+Calls are matched by key, e.g. (credential, method, path, query).
+Within a process, callers arriving while a call is in flight wait for it,
+though no longer than their own request's deadline.
+With SINGLE_FLIGHT_SHARED set, callers in other processes also wait for it,
+through the coordination cache, as long as its result can be pickled.
+"""
+
+import copy
+import hashlib
+import logging
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+
+from help_desk_api.deadlines import DeadlineExceeded, deadlines_exceeded, remaining
+from help_desk_api.metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+# How long a call may hold the shared lock, in case its process dies while making it
+SHARED_LOCK_TIMEOUT = 60  # seconds
+# How long a shared result is kept for callers in other processes to collect
+SHARED_RESULT_TIMEOUT = 5  # seconds
+SHARED_POLL_INTERVAL = 0.05  # seconds
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.exception = None
+        self.waiting = 0
+
+
+class SingleFlight:
+    def __init__(self, name, share=copy.deepcopy):
+        """
+        :param share: Makes a copy of a result for each caller waiting on it,
+            so none of them see changes the others make.
+        """
+        self.name = name
+        self.share = share
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.calls = Counter(f"single_flight.{name}.calls")
+        self.saved = Counter(f"single_flight.{name}.saved")
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key, None)
+            leading = call is None
+            if leading:
+                call = _Call()
+                self._calls[key] = call
+            else:
+                call.waiting += 1
+        if not leading:
+            if not call.done.wait(timeout=remaining()):
+                deadlines_exceeded.increment()
+                raise DeadlineExceeded(f"Deadline exceeded waiting for {self.name} call")
+            self.saved.increment()
+            if call.exception is not None:
+                raise call.exception
+            return self.share(call.result)
+
+        try:
+            if settings.SINGLE_FLIGHT_SHARED:
+                call.result = self.do_shared(key, fn)
+            else:
+                self.calls.increment()
+                call.result = fn()
+        except Exception as exp:
+            call.exception = exp
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+                waiting = call.waiting
+            call.done.set()
+        # If anyone's waiting, they copy the result, so it mustn't change under them
+        return self.share(call.result) if waiting else call.result
+
+    def do_shared(self, key, fn):
+        cache = caches[settings.COORDINATION_CACHE]
+        lock_key = self.shared_lock_key(key)
+        deadline = time.monotonic() + SHARED_LOCK_TIMEOUT
+        while time.monotonic() < deadline:
+            flight_id = uuid.uuid4().hex
+            if cache.add(lock_key, flight_id, timeout=SHARED_LOCK_TIMEOUT):
+                try:
+                    self.calls.increment()
+                    result = fn()
+                    cache.set(f"{lock_key}:{flight_id}", result, timeout=SHARED_RESULT_TIMEOUT)
+                    return result
+                finally:
+                    cache.delete(lock_key)
+            leader_flight_id = cache.get(lock_key, None)
+            if leader_flight_id is None:
+                # It finished just now, or the cache can't be reached
+                break
+            result = self.wait_for_shared_result(cache, lock_key, leader_flight_id, deadline)
+            if result is not _MISSING:
+                self.saved.increment()
+                return result
+            # It failed, so try to take its place
+        self.calls.increment()
+        return fn()
+
+    def shared_lock_key(self, key):
+        digest = hashlib.sha256(repr(key).encode("utf-8")).hexdigest()
+        return f"single_flight:{self.name}:{digest}"
+
+    def wait_for_shared_result(self, cache, lock_key, flight_id, deadline):
+        """
+        :returns: The result of the other process's call,
+            or _MISSING if it failed or we ran out of time
+        """
+        while time.monotonic() < deadline:
+            result = cache.get(f"{lock_key}:{flight_id}", _MISSING)
+            if result is not _MISSING:
+                return result
+            if cache.get(lock_key, None) != flight_id:
+                # Finished between our two reads, or failed without leaving a result
+                return cache.get(f"{lock_key}:{flight_id}", _MISSING)
+            time.sleep(SHARED_POLL_INTERVAL)
+        return _MISSING
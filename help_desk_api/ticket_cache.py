@@ -0,0 +1,152 @@
+"""
+Read-through cache of Halo tickets, as returned by `HaloManager.get_ticket`.
+
+A cached ticket is fresh for TICKET_CACHE_TIMEOUT seconds.
+After that it's stale, but for up to TICKET_CACHE_MAX_STALENESS more seconds
+it's still served while one refresh from Halo runs in the background,
+so a slow or failing Halo doesn't hold up ticket reads.
+
+Tickets are cached per Halo client ID, as what Halo returns depends on who's asking.
+Halo writes made through this service invalidate the ticket's entries for every client,
+as do Halo webhook notifications, for changes made in Halo itself, which don't say
+whose entries they are: invalidating a ticket records when it was invalidated,
+and entries read from Halo before then aren't served.
+"""
+
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+
+from help_desk_api.metrics import Counter, Distribution, Ratio
+
+logger = logging.getLogger(__name__)
+
+# Longest a background refresh may hold its lock, in case it dies without releasing it
+REFRESH_LOCK_TIMEOUT = 60  # seconds
+REFRESH_THREADS = 4
+
+hits = Counter("ticket_cache.hits")
+stale_hits = Counter("ticket_cache.stale_hits")
+misses = Counter("ticket_cache.misses")
+refresh_failures = Counter("ticket_cache.refresh_failures")
+invalidations = Counter("ticket_cache.invalidations")
+hit_ratio = Ratio(
+    "ticket_cache.hit_ratio",
+    numerators=[hits, stale_hits],
+    denominators=[hits, stale_hits, misses],
+)
+# Seconds past TICKET_CACHE_TIMEOUT of each stale ticket served
+staleness = Distribution("ticket_cache.staleness")
+
+refresh_executor = ThreadPoolExecutor(
+    max_workers=REFRESH_THREADS, thread_name_prefix="ticket-cache-refresh"
+)
+
+
+def ticket_cache_key(client_id, ticket_id):
+    return f"ticket:{client_id}:{ticket_id}"
+
+
+def ticket_invalidated_key(ticket_id):
+    return f"ticket_invalidated:{ticket_id}"
+
+
+def ticket_refresh_lock_key(client_id, ticket_id):
+    return f"ticket_cache_refresh:{client_id}:{ticket_id}"
+
+
+def ticket_cache():
+    return caches[settings.TICKET_RESPONSE_CACHE]
+
+
+def entry_timeout():
+    return settings.TICKET_CACHE_TIMEOUT + settings.TICKET_CACHE_MAX_STALENESS
+
+
+def cache_ticket(client_id, ticket_id, halo_ticket, cached_at):
+    """
+    :param cached_at: When the ticket started being read from Halo
+    """
+    ticket_cache().set(
+        ticket_cache_key(client_id, ticket_id),
+        {"ticket": halo_ticket, "cached_at": cached_at},
+        timeout=entry_timeout(),
+    )
+
+
+def cached_entry(client_id, ticket_id):
+    """
+    :returns: The ticket's entry, or None if there isn't one or it's been invalidated since
+    """
+    entry_key = ticket_cache_key(client_id, ticket_id)
+    invalidated_key = ticket_invalidated_key(ticket_id)
+    found = ticket_cache().get_many([entry_key, invalidated_key])
+    entry = found.get(entry_key, None)
+    if entry is None or entry["cached_at"] <= found.get(invalidated_key, 0):
+        return None
+    return entry
+
+
+def get_ticket(client_id, ticket_id, fetch):
+    """
+    :param client_id: The Halo client ID the ticket is read as
+    :param fetch: Called with the ticket ID to read the ticket from Halo on a miss,
+        or to refresh a stale entry.
+    """
+    entry = cached_entry(client_id, ticket_id)
+    if entry is not None:
+        age = time.time() - entry["cached_at"]
+        if age < settings.TICKET_CACHE_TIMEOUT:
+            hits.increment()
+            return entry["ticket"]
+        if age < settings.TICKET_CACHE_TIMEOUT + settings.TICKET_CACHE_MAX_STALENESS:
+            stale_hits.increment()
+            staleness.observe(age - settings.TICKET_CACHE_TIMEOUT)
+            refresh_in_background(client_id, ticket_id, fetch, entry["cached_at"])
+            return entry["ticket"]
+    misses.increment()
+    fetched_at = time.time()
+    halo_ticket = fetch(ticket_id)
+    cache_ticket(client_id, ticket_id, halo_ticket, fetched_at)
+    return halo_ticket
+
+
+def refresh_in_background(client_id, ticket_id, fetch, cached_at):
+    # Only one refresh per entry at a time, across all processes
+    lock_key = ticket_refresh_lock_key(client_id, ticket_id)
+    if caches[settings.COORDINATION_CACHE].add(lock_key, True, timeout=REFRESH_LOCK_TIMEOUT):
+        refresh_executor.submit(refresh_ticket, client_id, ticket_id, fetch, cached_at)
+
+
+def refresh_ticket(client_id, ticket_id, fetch, cached_at):
+    try:
+        fetched_at = time.time()
+        halo_ticket = fetch(ticket_id)
+        entry = cached_entry(client_id, ticket_id)
+        # If the entry has gone, the ticket changed while we were reading it, so what we have
+        # may be out of date; leave the next read to fetch it again
+        if entry is not None and entry["cached_at"] == cached_at:
+            cache_ticket(client_id, ticket_id, halo_ticket, fetched_at)
+    except Exception as exp:
+        refresh_failures.increment()
+        logger.warning(f"Couldn't refresh cached Halo ticket {ticket_id}: {exp}")
+    finally:
+        caches[settings.COORDINATION_CACHE].delete(ticket_refresh_lock_key(client_id, ticket_id))
+        # This thread's database connection, if fetching used one, isn't closed by a request
+        connections.close_all()
+
+
+def invalidate_tickets(ticket_ids):
+    ticket_ids = [ticket_id for ticket_id in ticket_ids if ticket_id is not None]
+    if ticket_ids:
+        # Outlives any entry read before now
+        invalidated_at = time.time()
+        ticket_cache().set_many(
+            {ticket_invalidated_key(ticket_id): invalidated_at for ticket_id in ticket_ids},
+            timeout=entry_timeout(),
+        )
+        invalidations.increment(len(ticket_ids))
@@ -2,9 +2,18 @@ from django.urls import include, path
 
 from help_desk_api.views import (
     CommentView,
+    CreateManyTicketsView,
+    CreateOrUpdateManyUsersView,
+    HaloWebhookView,
+    IncrementalTicketView,
+    JobStatusView,
     MeView,
+    SearchView,
+    ShowManyTicketsView,
+    ShowManyUsersView,
     SingleTicketView,
     TicketView,
+    UpdateManyTicketsView,
     UploadsView,
     UserView,
 )
@@ -16,10 +25,21 @@ zenpy.Zenpy.tickets.create - POST /api/v2/tickets
 zenpy.Zenpy.tickets - GET /api/v2/tickets/{id}
 zenpy.Zenpy.tickets.update - PUT /api/v2/tickets/{id}
 zenpy.Zenpy.tickets.comments - GET /api/v2/tickets/{id}/comments
+zenpy.Zenpy.tickets.create([...]) - POST /api/v2/tickets/create_many
+zenpy.Zenpy.tickets.update([...]) - PUT /api/v2/tickets/update_many
+zenpy.Zenpy.tickets(ids=[...]) - GET /api/v2/tickets/show_many?ids=
+zenpy.Zenpy.job_status - GET /api/v2/job_statuses/{id}
+zenpy.Zenpy.tickets.incremental(start_time=..., cursor=...)
+    - GET /api/v2/incremental/tickets/cursor
 zenpy.Zenpy.users - GET /api/v2/users/{id}
 zenpy.Zenpy.users.create_or_update - POST /api/v2/users/create_or_update
+zenpy.Zenpy.users.create_or_update([...]) - POST /api/v2/users/create_or_update_many
+zenpy.Zenpy.users(ids=[...]) - GET /api/v2/users/show_many?ids=
 zenpy.Zenpy.users.me - GET /api/v2/users/me
 zenpy.Zenpy.uploads - POST /api/v2/uploads
+zenpy.Zenpy.search - GET /api/v2/search?query=
+
+Halo webhooks - POST /api/halo/webhook
 """
 
 urlpatterns = [
@@ -29,11 +49,42 @@ urlpatterns = [
             [
                 path("v2/tickets.json", TicketView.as_view(), name="tickets"),
                 path("v2/tickets/<int:id>.json", SingleTicketView.as_view(), name="ticket"),
+                path(
+                    "v2/tickets/create_many.json",
+                    CreateManyTicketsView.as_view(),
+                    name="tickets_create_many",
+                ),
+                path(
+                    "v2/tickets/update_many.json",
+                    UpdateManyTicketsView.as_view(),
+                    name="tickets_update_many",
+                ),
+                path(
+                    "v2/tickets/show_many.json",
+                    ShowManyTicketsView.as_view(),
+                    name="tickets_show_many",
+                ),
                 path("v2/tickets/<int:id>/comments.json", CommentView.as_view(), name="comments"),
+                path(
+                    "v2/incremental/tickets/cursor.json",
+                    IncrementalTicketView.as_view(),
+                    name="incremental_tickets",
+                ),
                 path("v2/users/<int:id>.json", UserView.as_view(), name="user"),
                 path("v2/users/create_or_update.json", UserView.as_view(), name="create_user"),
+                path(
+                    "v2/users/create_or_update_many.json",
+                    CreateOrUpdateManyUsersView.as_view(),
+                    name="users_create_or_update_many",
+                ),
+                path(
+                    "v2/users/show_many.json", ShowManyUsersView.as_view(), name="users_show_many"
+                ),
                 path("v2/users/me.json", MeView.as_view(), name="me"),  # /PS-IGNORE
                 path("v2/uploads.json", UploadsView.as_view(), name="uploads"),  # /PS-IGNORE
+                path("v2/job_statuses/<str:id>.json", JobStatusView.as_view(), name="job_status"),
+                path("v2/search.json", SearchView.as_view(), name="search"),
+                path("halo/webhook", HaloWebhookView.as_view(), name="halo_webhook"),
             ]
         ),
     )
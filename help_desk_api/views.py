@@ -1,20 +1,41 @@
+import hashlib
+import hmac
+import io
 import logging
+from datetime import datetime, timezone
 from http import HTTPStatus
+from itertools import islice, takewhile
+from urllib.parse import urlencode
 
+import orjson
 import sentry_sdk
+from django.conf import settings
 from django.contrib.auth.mixins import UserPassesTestMixin
 from django.http import JsonResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from halo.clam_av import AntiVirusServiceErrorException
 from halo.data_class import ZendeskException
 from halo.halo_api_client import HaloClientNotFoundException
-from halo.halo_manager import HaloManager
+from halo.halo_manager import HaloManager, parse_halo_datetime
+from halo.upload_pipeline import InfectedFileException
 from rest_framework import authentication, permissions, status
 from rest_framework.parsers import FileUploadParser
-from rest_framework.renderers import BrowsableAPIRenderer, JSONRenderer
+from rest_framework.renderers import BrowsableAPIRenderer
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from help_desk_api.pagination import CustomPagination
+from help_desk_api import scan_queue
+from help_desk_api.job_statuses import (
+    MAX_BULK_RECORDS,
+    create_job_status,
+    get_job_status,
+)
+from help_desk_api.pagination import CustomPagination, SearchPagination, TicketCursor
+from help_desk_api.renderers import ORJSONRenderer
+from help_desk_api.search import SearchQueryError, search_tickets
 from help_desk_api.serializers import (
+    HaloTicketToZendeskSearchResultSerializer,
     HaloToZendeskCommentSerializer,
     HaloToZendeskTicketCommentSerializer,
     HaloToZendeskTicketContainerSerializer,
@@ -22,10 +43,49 @@ from help_desk_api.serializers import (
     HaloToZendeskUploadSerializer,
     HaloToZendeskUserSerializer,
 )
+from help_desk_api.ticket_cache import invalidate_tickets
 
 logger = logging.getLogger(__name__)
 
 
+def representation_etag(halo_data):
+    """
+    A strong ETag for a response, made from the Halo data that determines it,
+    so an unchanged response can be recognised without serializing it
+    """
+    content = orjson.dumps(halo_data, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS)
+    return f'"{hashlib.sha256(content).hexdigest()}"'
+
+
+def last_modified_timestamp(halo_datetimes):
+    timestamps = [
+        parse_halo_datetime(halo_datetime).timestamp()
+        for halo_datetime in halo_datetimes
+        if halo_datetime
+    ]
+    return int(max(timestamps)) if timestamps else None
+
+
+def conditional_response(request, halo_data, serialize, last_modified=None):
+    """
+    304 Not Modified if the caller's If-None-Match or If-Modified-Since
+    shows they already have this response, otherwise the response from `serialize()`.
+    Either way with ETag and, if known, Last-Modified headers.
+    """
+    headers = {"ETag": representation_etag(halo_data)}
+    if last_modified is not None:
+        headers["Last-Modified"] = http_date(last_modified)
+    # 304, or 412 Precondition Failed for an If-Match that doesn't match
+    precondition_response = get_conditional_response(
+        request, etag=headers["ETag"], last_modified=last_modified
+    )
+    if precondition_response is not None:
+        for header, value in headers.items():
+            precondition_response.headers[header] = value
+        return precondition_response
+    return Response(serialize(), headers=headers)
+
+
 class HaloBaseView(UserPassesTestMixin, APIView):
     """
     Base view for Halo interaction
@@ -71,7 +131,7 @@ class UserView(HaloBaseView):
 
     authentication_classes = [authentication.TokenAuthentication]
     permission_classes = [permissions.AllowAny]
-    renderer_classes = [JSONRenderer, BrowsableAPIRenderer]
+    renderer_classes = [ORJSONRenderer, BrowsableAPIRenderer]
 
     def get(self, request, *args, **kwargs):
         """
@@ -79,8 +139,9 @@ class UserView(HaloBaseView):
         """
         try:
             halo_user = self.halo_manager.get_user(user_id=self.kwargs.get("id"))
-            serializer = HaloToZendeskUserSerializer(halo_user)
-            return Response(serializer.data)
+            return conditional_response(
+                request, halo_user, lambda: HaloToZendeskUserSerializer(halo_user).data
+            )
         except HaloClientNotFoundException as error:
             sentry_sdk.capture_exception(error)
             return Response(
@@ -121,7 +182,7 @@ class MeView(HaloBaseView):
 
     authentication_classes = [authentication.TokenAuthentication]
     permission_classes = [permissions.AllowAny]
-    renderer_classes = [JSONRenderer, BrowsableAPIRenderer]
+    renderer_classes = [ORJSONRenderer, BrowsableAPIRenderer]
 
     def get(self, request, format=None):
         """
@@ -158,7 +219,7 @@ class CommentView(HaloBaseView):
 
     authentication_classes = [authentication.TokenAuthentication]
     permission_classes = [permissions.AllowAny]
-    renderer_classes = [JSONRenderer, BrowsableAPIRenderer]
+    renderer_classes = [ORJSONRenderer, BrowsableAPIRenderer]
 
     def get(self, request, id, format=None):
         """
@@ -166,8 +227,12 @@ class CommentView(HaloBaseView):
         """
         # Get ticket from Halo
         queryset = self.halo_manager.get_comments(ticket_id=id)
-        serializer = HaloToZendeskCommentSerializer(queryset, many=True)
-        return Response(serializer.data)
+        return conditional_response(
+            request,
+            queryset,
+            lambda: HaloToZendeskCommentSerializer(queryset, many=True).data,
+            last_modified=last_modified_timestamp(comment.get("datetime") for comment in queryset),
+        )
 
 
 class SingleTicketView(HaloBaseView):
@@ -178,7 +243,7 @@ class SingleTicketView(HaloBaseView):
 
     authentication_classes = [authentication.TokenAuthentication]
     permission_classes = [permissions.AllowAny]
-    renderer_classes = [JSONRenderer, BrowsableAPIRenderer]
+    renderer_classes = [ORJSONRenderer, BrowsableAPIRenderer]
 
     def get(self, request, *args, **kwargs):
         """
@@ -190,10 +255,15 @@ class SingleTicketView(HaloBaseView):
         try:
             if ticket_id:
                 halo_response = self.halo_manager.get_ticket(ticket_id=self.kwargs.get("id"))
-                # 4. View uses serializer class to transform Halo format to Zendesk
-                serializer = HaloToZendeskTicketContainerSerializer(halo_response)
+                # 4. View uses serializer class to transform Halo format to Zendesk,
+                # unless the caller already has it
                 # 5. Serialized data (in Zendesk format) sent to caller
-                return Response(serializer.data)
+                return conditional_response(
+                    request,
+                    halo_response,
+                    lambda: HaloToZendeskTicketContainerSerializer(halo_response).data,
+                    last_modified=last_modified_timestamp([halo_response.get("lastactiondate")]),
+                )
             else:
                 raise HaloClientNotFoundException(f"Ticket with id {ticket_id} could not be found")
         except HaloClientNotFoundException:
@@ -247,7 +317,7 @@ class TicketView(HaloBaseView, CustomPagination):
 
     authentication_classes = [authentication.TokenAuthentication]
     permission_classes = [permissions.AllowAny]
-    renderer_classes = [JSONRenderer, BrowsableAPIRenderer]
+    renderer_classes = [ORJSONRenderer, BrowsableAPIRenderer]
 
     def get(self, request, *args, **kwargs):
         """
@@ -336,6 +406,264 @@ class TicketView(HaloBaseView, CustomPagination):
             )
 
 
+class IncrementalTicketView(HaloBaseView):
+    """
+    Tickets changed since a point in time, as Zendesk's incremental/tickets/cursor.json does,
+    so that consumers only read what has changed since they last asked.
+    Start with `start_time` (a Unix epoch time), then follow `after_cursor`.
+    Possible methods: GET
+    """
+
+    authentication_classes = [authentication.TokenAuthentication]
+    permission_classes = [permissions.AllowAny]
+    renderer_classes = [ORJSONRenderer, BrowsableAPIRenderer]
+
+    # Zendesk's default and maximum
+    max_page_size = 1000
+
+    def get(self, request, *args, **kwargs):
+        try:
+            cursor = self.get_cursor(request.query_params)
+            page_size = self.get_page_size(request.query_params)
+        except ValueError as error:
+            return Response(str(error), status=status.HTTP_400_BAD_REQUEST)
+
+        changed_tickets = (
+            ticket
+            for ticket in self.halo_manager.iter_tickets(
+                changed_since=cursor.last_action, page_size=page_size + 1
+            )
+            if ticket_position(ticket) > cursor.position
+        )
+        # One more than a page, to tell if there are any more to come
+        tickets = list(islice(changed_tickets, page_size + 1))
+        if tickets:
+            # Halo doesn't say how it orders tickets with the same last action, so the rest
+            # of the last one's ties are read too and sorted by ID, and the next page asks
+            # again from that last action, so a page boundary between ties skips none of them
+            last_action = ticket_position(tickets[-1])[0]
+            tickets.extend(
+                takewhile(lambda ticket: ticket_position(ticket)[0] == last_action, changed_tickets)
+            )
+            tickets.sort(key=ticket_position)
+        end_of_stream = len(tickets) <= page_size
+        tickets = tickets[:page_size]
+        if tickets:
+            cursor = TicketCursor(*ticket_position(tickets[-1]))
+
+        after_cursor = cursor.encode()
+        serializer = HaloToZendeskTicketsContainerSerializer({"tickets": tickets})
+        return Response(
+            {
+                "tickets": serializer.data["tickets"],
+                "after_cursor": after_cursor,
+                "after_url": request.build_absolute_uri(
+                    f"{request.path}?{urlencode({'cursor': after_cursor, 'per_page': page_size})}"
+                ),
+                "before_cursor": None,
+                "before_url": None,
+                "end_of_stream": end_of_stream,
+            }
+        )
+
+    def get_cursor(self, query_params):
+        if cursor := query_params.get("cursor", None):
+            return TicketCursor.decode(cursor)
+        if start_time := query_params.get("start_time", None):
+            return TicketCursor(datetime.fromtimestamp(int(start_time), tz=timezone.utc))
+        raise ValueError("Either start_time or cursor is required")
+
+    def get_page_size(self, query_params):
+        page_size = int(query_params.get("per_page", self.max_page_size))
+        if page_size < 1:
+            raise ValueError("per_page must be at least 1")
+        return min(page_size, self.max_page_size)
+
+
+class SearchView(HaloBaseView, SearchPagination):
+    """
+    Ticket search, as Zendesk's search.json does for the common filters.
+    Served from the local read model of Halo tickets, without calling Halo.
+    Possible methods: GET
+    """
+
+    authentication_classes = [authentication.TokenAuthentication]
+    permission_classes = [permissions.AllowAny]
+    renderer_classes = [ORJSONRenderer, BrowsableAPIRenderer]
+
+    def initial(self, request, *args, **kwargs):
+        # Nothing to ask Halo, so no need for a HaloManager
+        pass
+
+    def get(self, request, *args, **kwargs):
+        try:
+            tickets = search_tickets(
+                request.help_desk_creds.halo_client_id, request.query_params.get("query", "")
+            )
+            page = self.paginate_queryset(tickets, request)
+        except SearchQueryError as error:
+            return Response(str(error), status=status.HTTP_400_BAD_REQUEST)
+        serializer = HaloTicketToZendeskSearchResultSerializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+
+def ticket_position(halo_ticket):
+    return parse_halo_datetime(halo_ticket["lastactiondate"]), halo_ticket["id"]
+
+
+def split_ids(ids):
+    return [int(id) for id in ids.split(",") if id.strip()]
+
+
+def invalid_ids_response():
+    return Response("ids must be a comma-separated list of IDs", status=status.HTTP_400_BAD_REQUEST)
+
+
+def too_many_records_response(records):
+    if len(records) > MAX_BULK_RECORDS:
+        return Response(
+            f"No more than {MAX_BULK_RECORDS} records may be sent in one request",
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    return None
+
+
+class CreateManyTicketsView(HaloBaseView):
+    """
+    Create several tickets, as Zendesk's tickets/create_many does.
+    Possible methods: POST
+    """
+
+    authentication_classes = [authentication.TokenAuthentication]
+    permission_classes = [permissions.AllowAny]
+    renderer_classes = [ORJSONRenderer, BrowsableAPIRenderer]
+
+    def post(self, request, *args, **kwargs):
+        zendesk_tickets = request.data.get("tickets", [])
+        if error_response := too_many_records_response(zendesk_tickets):
+            return error_response
+        outcomes = self.halo_manager.create_tickets(zendesk_tickets)
+        job_status = create_job_status(request, "create", outcomes)
+        return Response({"job_status": job_status}, status=status.HTTP_200_OK)
+
+
+class UpdateManyTicketsView(HaloBaseView):
+    """
+    Update several tickets, as Zendesk's tickets/update_many does:
+    either each ticket in "tickets" with its own changes,
+    or each ticket in the "ids" query parameter with the same "ticket" changes.
+    Possible methods: PUT
+    """
+
+    authentication_classes = [authentication.TokenAuthentication]
+    permission_classes = [permissions.AllowAny]
+    renderer_classes = [ORJSONRenderer, BrowsableAPIRenderer]
+
+    def put(self, request, *args, **kwargs):
+        if "tickets" in request.data:
+            zendesk_tickets = request.data["tickets"]
+        else:
+            try:
+                ticket_ids = split_ids(request.query_params.get("ids", ""))
+            except ValueError:
+                return invalid_ids_response()
+            changes = request.data.get("ticket", {})
+            zendesk_tickets = [dict(changes, id=ticket_id) for ticket_id in ticket_ids]
+        if error_response := too_many_records_response(zendesk_tickets):
+            return error_response
+        if any("id" not in ticket for ticket in zendesk_tickets):
+            return Response(
+                "Every ticket to update must have an id", status=status.HTTP_400_BAD_REQUEST
+            )
+        outcomes = self.halo_manager.update_tickets(zendesk_tickets)
+        job_status = create_job_status(request, "update", outcomes)
+        return Response({"job_status": job_status}, status=status.HTTP_200_OK)
+
+
+class ShowManyTicketsView(HaloBaseView):
+    """
+    Read several tickets, as Zendesk's tickets/show_many does.
+    Possible methods: GET
+    """
+
+    authentication_classes = [authentication.TokenAuthentication]
+    permission_classes = [permissions.AllowAny]
+    renderer_classes = [ORJSONRenderer, BrowsableAPIRenderer]
+
+    def get(self, request, *args, **kwargs):
+        try:
+            ticket_ids = split_ids(request.query_params.get("ids", ""))
+        except ValueError:
+            return invalid_ids_response()
+        if error_response := too_many_records_response(ticket_ids):
+            return error_response
+        halo_tickets = self.halo_manager.get_tickets_by_id(ticket_ids)
+        serializer = HaloToZendeskTicketsContainerSerializer({"tickets": halo_tickets})
+        return Response(serializer.data)
+
+
+class CreateOrUpdateManyUsersView(HaloBaseView):
+    """
+    Create or update several users, as Zendesk's users/create_or_update_many does.
+    Possible methods: POST
+    """
+
+    authentication_classes = [authentication.TokenAuthentication]
+    permission_classes = [permissions.AllowAny]
+    renderer_classes = [ORJSONRenderer, BrowsableAPIRenderer]
+
+    def post(self, request, *args, **kwargs):
+        zendesk_users = request.data.get("users", [])
+        if error_response := too_many_records_response(zendesk_users):
+            return error_response
+        actions, outcomes = self.halo_manager.create_or_update_users(zendesk_users)
+        job_status = create_job_status(request, actions, outcomes)
+        return Response({"job_status": job_status}, status=status.HTTP_200_OK)
+
+
+class ShowManyUsersView(HaloBaseView):
+    """
+    Read several users, as Zendesk's users/show_many does.
+    Possible methods: GET
+    """
+
+    authentication_classes = [authentication.TokenAuthentication]
+    permission_classes = [permissions.AllowAny]
+    renderer_classes = [ORJSONRenderer, BrowsableAPIRenderer]
+
+    def get(self, request, *args, **kwargs):
+        try:
+            user_ids = split_ids(request.query_params.get("ids", ""))
+        except ValueError:
+            return invalid_ids_response()
+        if error_response := too_many_records_response(user_ids):
+            return error_response
+        halo_users = self.halo_manager.get_users_by_id(user_ids)
+        serializer = HaloToZendeskUserSerializer(halo_users, many=True)
+        return Response({"users": serializer.data})
+
+
+class JobStatusView(HaloBaseView):
+    """
+    Job status for one of the bulk requests
+    Possible methods: GET
+    """
+
+    authentication_classes = [authentication.TokenAuthentication]
+    permission_classes = [permissions.AllowAny]
+    renderer_classes = [ORJSONRenderer, BrowsableAPIRenderer]
+
+    def get(self, request, *args, **kwargs):
+        job_id = kwargs.get("id", None)
+        job_status = get_job_status(request, job_id)
+        if job_status is None:
+            return Response(
+                f"Job status with id {job_id} could not be found",
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        return Response({"job_status": job_status})
+
+
 class UploadsView(HaloBaseView):
     """
     View for uploading attachments
@@ -348,17 +676,93 @@ class UploadsView(HaloBaseView):
     def post(self, request, *args, **kwargs):
         try:
             filename = request.query_params.get("filename", None)
-            data = request.body
-            halo_response = self.halo_manager.upload_file(
+            content_type = request.headers.get("Content-Type", "text/plain")
+            if settings.AV_SCAN_QUEUE:
+                # Scanned, and sent to Halo, by the scan_uploads command
+                upload = scan_queue.enqueue(
+                    request.help_desk_creds,
+                    filename,
+                    request.stream or io.BytesIO(),
+                    content_type,
+                )
+                serializer = HaloToZendeskUploadSerializer({"id": upload.token})
+                return Response(serializer.data, status=status.HTTP_201_CREATED)
+            # Read in chunks, rather than all at once
+            halo_response = self.halo_manager.upload_stream(
                 filename=filename,
-                data=data,
-                content_type=request.headers.get("Content-Type", "text/plain"),
+                stream=request.stream or io.BytesIO(),
+                content_type=content_type,
             )
             serializer = HaloToZendeskUploadSerializer(halo_response)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
+        except scan_queue.UploadTooLargeException as error:
+            logger.warning(str(error))
+            return Response(
+                {"error": "FileTooLarge", "description": str(error)},
+                status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            )
+        except InfectedFileException as error:
+            logger.warning(str(error))
+            return Response(
+                {"error": "InfectedFile", "description": "File failed virus scan"},
+                status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            )
+        except AntiVirusServiceErrorException as error:
+            sentry_sdk.capture_exception(error)
+            return Response(
+                {
+                    "error": "ServiceUnavailable",
+                    "description": "File could not be scanned for viruses",
+                },
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+            )
         except ZendeskException as error:
             sentry_sdk.capture_exception(error)
             return Response(
                 "File upload failed",
                 status=status.HTTP_400_BAD_REQUEST,
             )
+
+
+def webhook_ticket_ids(payload):
+    """
+    Halo webhooks send the ticket, or a list of them, either bare or as {"ticket": ...};
+    actions send their "ticket_id"
+    """
+    records = payload if isinstance(payload, list) else [payload]
+    ticket_ids = []
+    for record in records:
+        if not isinstance(record, dict):
+            continue
+        record = record.get("ticket", record)
+        ticket_id = record.get("ticket_id", record.get("id", None))
+        try:
+            ticket_ids.append(int(ticket_id))
+        except (TypeError, ValueError):
+            pass
+    return ticket_ids
+
+
+class HaloWebhookView(APIView):
+    """
+    Receives Halo webhook notifications of ticket changes made in Halo,
+    so that they aren't hidden by the ticket cache.
+    Halo sends the shared secret in the X-Halo-Webhook-Secret header.
+    Possible methods: POST
+    """
+
+    authentication_classes = []
+    permission_classes = [permissions.AllowAny]
+    renderer_classes = [ORJSONRenderer]
+
+    def post(self, request, *args, **kwargs):
+        secret = request.headers.get("X-Halo-Webhook-Secret", "")
+        if not settings.HALO_WEBHOOK_SECRET or not hmac.compare_digest(
+            secret.encode("utf-8"), settings.HALO_WEBHOOK_SECRET.encode("utf-8")
+        ):
+            return Response("Webhook secret not recognised", status=status.HTTP_403_FORBIDDEN)
+        ticket_ids = webhook_ticket_ids(request.data)
+        if not ticket_ids:
+            return Response("No ticket ID in webhook payload", status=status.HTTP_400_BAD_REQUEST)
+        invalidate_tickets(ticket_ids)
+        return Response({"invalidated": ticket_ids})
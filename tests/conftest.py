@@ -3,12 +3,16 @@ import json
 from http import HTTPStatus
 
 import pytest
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
 from django.core.serializers.json import DjangoJSONEncoder
 from django.http import HttpResponse
 from django.test import RequestFactory
 from django.urls import reverse
 from requests import Response
 
+from help_desk_api import metrics
+from help_desk_api.cache import TwoTierCache
 from help_desk_api.models import HelpDeskCreds
 
 
@@ -17,6 +21,21 @@ def enable_db_access_for_all_tests(db):
     pass
 
 
+@pytest.fixture(autouse=True)
+def clear_in_process_caches():
+    """
+    The database tiers are rolled back after each test,
+    but the in-process tiers, the in-memory test caches and metric counts aren't
+    """
+    yield
+    metrics.pending_counts.clear()
+    for cache in caches.all():
+        if isinstance(cache, TwoTierCache):
+            cache.local.clear()
+        elif isinstance(cache, LocMemCache):
+            cache.clear()
+
+
 @pytest.fixture()
 def zendesk_required_settings(settings):
     settings.REQUIRE_ZENDESK = True
@@ -1,8 +1,10 @@
 import base64
+import hashlib
 import json
 from unittest import mock
 from unittest.mock import MagicMock
 
+from halo.attachment_cache import cached_halo_attachment
 from halo.halo_manager import HaloManager
 
 
@@ -30,3 +32,17 @@ class TestHaloAttachmentAPI:
         assert actual_payload["filename"] == attachment_filename
         assert "data_base64" in actual_payload
         assert actual_payload["data_base64"] == expected_payload
+
+    @mock.patch("halo.halo_api_client.requests.post")
+    def test_unscanned_attachment_not_cached(
+        self, mock_post: MagicMock, access_token, attachment_filename: str, attachment_data: bytes
+    ):
+        mock_post.return_value.json.return_value = access_token
+        mock_post.return_value.status_code = 200
+        halo_manager = HaloManager(client_id="fake-client-id", client_secret="fake-client-secret")
+        mock_post.return_value.json.return_value = {"id": 218}
+        mock_post.return_value.status_code = 201
+
+        halo_manager.upload_file(attachment_filename, attachment_data)
+
+        assert cached_halo_attachment(hashlib.sha256(attachment_data).hexdigest()) is None
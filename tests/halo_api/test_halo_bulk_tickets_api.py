@@ -0,0 +1,224 @@
+from unittest import mock
+from unittest.mock import MagicMock
+
+import requests
+from django.conf import settings
+from django.core.cache import caches
+from django.test import Client, override_settings
+from django.urls import reverse
+from halo.halo_api_client import HaloClientBadRequestException
+from halo.halo_manager import HaloManager
+
+from help_desk_api.circuit_breaker import CircuitOpenException
+from help_desk_api.deadlines import DeadlineExceeded
+
+
+def zendesk_ticket(subject):
+    return {
+        "subject": subject,
+        "comment": {"body": f"{subject} description"},
+        "requester": {"name": "Some Body", "email": "somebody@example.com"},  # /PS-IGNORE
+    }
+
+
+@mock.patch("halo.halo_manager.HaloAPIClient._HaloAPIClient__authenticate", return_value="abc123")
+class TestHaloManagerBulkTickets:
+    @override_settings(HALO_BULK_BATCH_SIZE=2)
+    @mock.patch("halo.halo_manager.HaloAPIClient.post")
+    def test_tickets_created_in_batches(self, mock_post: MagicMock, _mock_authenticate):
+        mock_post.side_effect = [[{"id": 1}, {"id": 2}], {"id": 3}]
+        halo_manager = HaloManager(client_id="id", client_secret="secret")
+
+        outcomes = halo_manager.create_tickets(
+            [zendesk_ticket("One"), zendesk_ticket("Two"), zendesk_ticket("Three")]
+        )
+
+        assert outcomes == [{"id": 1}, {"id": 2}, {"id": 3}]
+        assert [len(call.kwargs["payload"]) for call in mock_post.call_args_list] == [2, 1]
+
+    @override_settings(HALO_BULK_BATCH_SIZE=1)
+    @mock.patch("halo.halo_manager.HaloAPIClient.post")
+    def test_failed_batch_does_not_stop_the_rest(self, mock_post: MagicMock, _mock_authenticate):
+        mock_post.side_effect = [HaloClientBadRequestException("Bad"), {"id": 2}]
+        halo_manager = HaloManager(client_id="id", client_secret="secret")
+
+        outcomes = halo_manager.create_tickets([zendesk_ticket("One"), zendesk_ticket("Two")])
+
+        assert isinstance(outcomes[0], HaloClientBadRequestException)
+        assert outcomes[1] == {"id": 2}
+
+    @override_settings(HALO_BULK_BATCH_SIZE=1)
+    @mock.patch("halo.halo_manager.HaloAPIClient.post")
+    def test_upstream_failure_does_not_stop_the_rest(
+        self, mock_post: MagicMock, _mock_authenticate
+    ):
+        mock_post.side_effect = [
+            {"id": 1},
+            CircuitOpenException("Halo circuit open"),
+            requests.Timeout("Read timed out"),
+            {"id": 4},
+        ]
+        halo_manager = HaloManager(client_id="id", client_secret="secret")
+
+        outcomes = halo_manager.create_tickets(
+            [zendesk_ticket(subject) for subject in ("One", "Two", "Three", "Four")]
+        )
+
+        assert outcomes[0] == {"id": 1}
+        assert isinstance(outcomes[1], CircuitOpenException)
+        assert isinstance(outcomes[2], requests.Timeout)
+        assert outcomes[3] == {"id": 4}
+
+    @override_settings(HALO_BULK_BATCH_SIZE=1)
+    @mock.patch("halo.halo_manager.HaloAPIClient.post")
+    def test_nothing_more_sent_after_deadline(self, mock_post: MagicMock, _mock_authenticate):
+        mock_post.side_effect = [{"id": 1}, DeadlineExceeded("Deadline passed")]
+        halo_manager = HaloManager(client_id="id", client_secret="secret")
+
+        outcomes = halo_manager.create_tickets(
+            [zendesk_ticket(subject) for subject in ("One", "Two", "Three")]
+        )
+
+        assert outcomes[0] == {"id": 1}
+        assert all(isinstance(outcome, DeadlineExceeded) for outcome in outcomes[1:])
+        assert mock_post.call_count == 2
+
+    @mock.patch("halo.halo_manager.HaloAPIClient.post")
+    def test_updates_use_halo_ticket_ids(self, mock_post: MagicMock, _mock_authenticate):
+        caches[settings.TICKET_DATA_CACHE].set(35062, 1)
+        mock_post.side_effect = [
+            [{"id": 1}, {"id": 2}],
+            [{"id": 101}],
+        ]
+        halo_manager = HaloManager(client_id="id", client_secret="secret")
+
+        outcomes = halo_manager.update_tickets(
+            [
+                {"id": 35062, "subject": "New subject", "comment": {"body": "Comment"}},
+                {"id": 2, "subject": "Other subject"},
+            ]
+        )
+
+        assert outcomes == [{"id": 1}, {"id": 2}]
+        ticket_payloads = mock_post.call_args_list[0].kwargs["payload"]
+        assert [payload["id"] for payload in ticket_payloads] == [1, 2]
+        comment_payloads = mock_post.call_args_list[1].kwargs["payload"]
+        assert comment_payloads[0]["ticket_id"] == 1
+
+    @override_settings(HALO_BULK_BATCH_SIZE=2)
+    @mock.patch("halo.halo_manager.HaloAPIClient.get")
+    def test_tickets_read_in_batches(self, mock_get: MagicMock, _mock_authenticate):
+        mock_get.side_effect = [
+            {"tickets": [{"id": 1}, {"id": 2}]},
+            {"tickets": [{"id": 3}]},
+        ]
+        halo_manager = HaloManager(client_id="id", client_secret="secret")
+
+        tickets = halo_manager.get_tickets_by_id([1, 2, 3])
+
+        assert [ticket["id"] for ticket in tickets] == [1, 2, 3]
+        assert mock_get.call_args_list[0].kwargs["params"] == {"ticketids": "1,2"}
+
+
+@mock.patch("halo.halo_manager.HaloAPIClient._HaloAPIClient__authenticate", return_value="abc123")
+class TestBulkTicketViews:
+    @mock.patch("halo.halo_manager.HaloManager.create_tickets")
+    def test_create_many_returns_completed_job_status(
+        self,
+        mock_create_tickets: MagicMock,
+        _mock_authenticate,
+        halo_creds_only,
+        zendesk_authorization_header,
+        client: Client,
+    ):
+        mock_create_tickets.return_value = [{"id": 1}, HaloClientBadRequestException("Bad")]
+
+        response = client.post(
+            reverse("api:tickets_create_many"),
+            data={"tickets": [zendesk_ticket("One"), zendesk_ticket("Two")]},
+            content_type="application/json",
+            headers={"Authorization": zendesk_authorization_header},
+        )
+
+        job_status = response.json()["job_status"]
+        assert job_status["status"] == "completed"
+        assert job_status["results"][0] == {
+            "index": 0,
+            "id": 1,
+            "success": True,
+            "action": "create",
+            "status": "Created",
+        }
+        assert job_status["results"][1]["success"] is False
+
+        job_status_response = client.get(
+            reverse("api:job_status", kwargs={"id": job_status["id"]}),
+            headers={"Authorization": zendesk_authorization_header},
+        )
+
+        assert job_status_response.json()["job_status"] == job_status
+
+    def test_create_many_limited_to_one_hundred(
+        self, _mock_authenticate, halo_creds_only, zendesk_authorization_header, client: Client
+    ):
+        response = client.post(
+            reverse("api:tickets_create_many"),
+            data={"tickets": [zendesk_ticket("Ticket")] * 101},
+            content_type="application/json",
+            headers={"Authorization": zendesk_authorization_header},
+        )
+
+        assert response.status_code == 400
+
+    @mock.patch("halo.halo_manager.HaloManager.update_tickets")
+    def test_update_many_applies_changes_to_each_id(
+        self,
+        mock_update_tickets: MagicMock,
+        _mock_authenticate,
+        halo_creds_only,
+        zendesk_authorization_header,
+        client: Client,
+    ):
+        mock_update_tickets.return_value = [{"id": 1}, {"id": 2}]
+
+        response = client.put(
+            f"{reverse('api:tickets_update_many')}?ids=1,2",
+            data={"ticket": {"tags": ["bulk"]}},
+            content_type="application/json",
+            headers={"Authorization": zendesk_authorization_header},
+        )
+
+        assert response.status_code == 200
+        mock_update_tickets.assert_called_once_with(
+            [{"tags": ["bulk"], "id": 1}, {"tags": ["bulk"], "id": 2}]
+        )
+        assert response.json()["job_status"]["results"][1]["status"] == "Updated"
+
+    @mock.patch("halo.halo_manager.HaloManager.get_tickets_by_id")
+    def test_show_many(
+        self,
+        mock_get_tickets_by_id: MagicMock,
+        _mock_authenticate,
+        halo_creds_only,
+        zendesk_authorization_header,
+        client: Client,
+    ):
+        mock_get_tickets_by_id.return_value = [{"id": 1}, {"id": 2}]
+
+        response = client.get(
+            f"{reverse('api:tickets_show_many')}?ids=1,2",
+            headers={"Authorization": zendesk_authorization_header},
+        )
+
+        mock_get_tickets_by_id.assert_called_once_with([1, 2])
+        assert response.json() == {"tickets": [{"id": 1}, {"id": 2}]}
+
+    def test_unknown_job_status(
+        self, _mock_authenticate, halo_creds_only, zendesk_authorization_header, client: Client
+    ):
+        response = client.get(
+            reverse("api:job_status", kwargs={"id": "abc123"}),
+            headers={"Authorization": zendesk_authorization_header},
+        )
+
+        assert response.status_code == 404
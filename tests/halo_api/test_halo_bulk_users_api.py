@@ -0,0 +1,157 @@
+from unittest import mock
+from unittest.mock import MagicMock
+
+from django.conf import settings
+from django.core.cache import caches
+from django.test import Client
+from django.urls import reverse
+from halo.halo_api_client import HaloClientNotFoundException
+from halo.halo_manager import HaloManager, halo_user_cache_key
+
+
+def zendesk_user(name):
+    return {"name": name, "email": f"{name.lower()}@example.com"}  # /PS-IGNORE
+
+
+@mock.patch("halo.halo_manager.HaloAPIClient._HaloAPIClient__authenticate", return_value="abc123")
+class TestHaloManagerBulkUsers:
+    @mock.patch("halo.halo_manager.HaloAPIClient.post")
+    @mock.patch("halo.halo_manager.HaloManager.search_for_existing_user")
+    def test_known_users_found_without_searching_halo(
+        self, mock_search: MagicMock, mock_post: MagicMock, _mock_authenticate
+    ):
+        caches[settings.USER_DATA_CACHE].set(
+            halo_user_cache_key("Known@example.com"),  # /PS-IGNORE
+            {"id": 1, "name": "Known", "emailaddress": "known@example.com"},  # /PS-IGNORE
+        )
+        mock_search.return_value = None
+        mock_post.return_value = [
+            {"id": 1, "name": "Known", "emailaddress": "known@example.com"},  # /PS-IGNORE
+            {"id": 2, "name": "New", "emailaddress": "new@example.com"},  # /PS-IGNORE
+        ]
+        halo_manager = HaloManager(client_id="id", client_secret="secret")
+
+        actions, outcomes = halo_manager.create_or_update_users(
+            [zendesk_user("Known"), zendesk_user("New")]
+        )
+
+        assert actions == ["update", "create"]
+        assert [outcome["id"] for outcome in outcomes] == [1, 2]
+        mock_search.assert_called_once_with(search_term="new@example.com")  # /PS-IGNORE
+        mock_post.assert_called_once()
+        update, create = mock_post.call_args.kwargs["payload"]
+        # Existing users' changes are sent too
+        assert update["id"] == 1
+        assert update["name"] == "Known"
+        assert "site_id" not in update
+        assert "id" not in create
+
+    @mock.patch("halo.halo_manager.HaloAPIClient.post")
+    @mock.patch("halo.halo_manager.HaloManager.search_for_existing_user", return_value=None)
+    def test_same_email_created_once(
+        self, mock_search: MagicMock, mock_post: MagicMock, _mock_authenticate
+    ):
+        mock_post.return_value = {"id": 1, "name": "Renamed", "emailaddress": "one@example.com"}
+        halo_manager = HaloManager(client_id="id", client_secret="secret")
+
+        actions, outcomes = halo_manager.create_or_update_users(
+            [zendesk_user("One"), {"name": "Renamed", "email": "ONE@example.com"}]  # /PS-IGNORE
+        )
+
+        assert actions == ["create", "update"]
+        assert [outcome["id"] for outcome in outcomes] == [1, 1]
+        mock_search.assert_called_once()
+        [payload] = mock_post.call_args.kwargs["payload"]
+        assert payload["name"] == "Renamed"
+
+    @mock.patch("halo.halo_manager.HaloAPIClient.post")
+    @mock.patch("halo.halo_manager.HaloManager.search_for_existing_user")
+    def test_failed_search_fails_only_that_user(
+        self, mock_search: MagicMock, mock_post: MagicMock, _mock_authenticate
+    ):
+        def search(search_term):
+            if search_term.startswith("one"):
+                raise ConnectionError("Halo is down")
+
+        mock_search.side_effect = search
+        mock_post.return_value = {"id": 2, "name": "Two", "emailaddress": "two@example.com"}
+        halo_manager = HaloManager(client_id="id", client_secret="secret")
+
+        actions, outcomes = halo_manager.create_or_update_users(
+            [zendesk_user("One"), zendesk_user("Two")]
+        )
+
+        assert isinstance(outcomes[0], ConnectionError)
+        assert outcomes[1]["id"] == 2
+        assert actions[1] == "create"
+
+    @mock.patch("halo.halo_manager.HaloAPIClient.post")
+    @mock.patch("halo.halo_manager.HaloManager.search_for_existing_user", return_value=None)
+    def test_mappings_saved(self, _mock_search, mock_post: MagicMock, _mock_authenticate):
+        mock_post.return_value = [
+            {"id": 1, "name": "One", "emailaddress": "one@example.com"},  # /PS-IGNORE
+            {"id": 2, "name": "Two", "emailaddress": "two@example.com"},  # /PS-IGNORE
+        ]
+        halo_manager = HaloManager(client_id="id", client_secret="secret")
+
+        halo_manager.create_or_update_users([zendesk_user("One"), zendesk_user("Two")])
+
+        user_cache = caches[settings.USER_DATA_CACHE]
+        assert user_cache.get(halo_user_cache_key("two@example.com"))["id"] == 2  # /PS-IGNORE
+        assert user_cache.get(1) == {"user": zendesk_user("One")}
+
+    @mock.patch("halo.halo_manager.HaloAPIClient.get")
+    def test_users_read_once_each(self, mock_get: MagicMock, _mock_authenticate):
+        mock_get.side_effect = [{"id": 1}, HaloClientNotFoundException()]
+        halo_manager = HaloManager(client_id="id", client_secret="secret")
+
+        users = halo_manager.get_users_by_id([1, 1, 2])
+
+        assert users == [{"id": 1}]
+        assert mock_get.call_count == 2
+
+
+@mock.patch("halo.halo_manager.HaloAPIClient._HaloAPIClient__authenticate", return_value="abc123")
+class TestBulkUserViews:
+    @mock.patch("halo.halo_manager.HaloManager.create_or_update_users")
+    def test_create_or_update_many_returns_job_status(
+        self,
+        mock_create_or_update_users: MagicMock,
+        _mock_authenticate,
+        halo_creds_only,
+        zendesk_authorization_header,
+        client: Client,
+    ):
+        mock_create_or_update_users.return_value = (["update", "create"], [{"id": 1}, {"id": 2}])
+
+        response = client.post(
+            reverse("api:users_create_or_update_many"),
+            data={"users": [zendesk_user("One"), zendesk_user("Two")]},
+            content_type="application/json",
+            headers={"Authorization": zendesk_authorization_header},
+        )
+
+        results = response.json()["job_status"]["results"]
+        assert [result["status"] for result in results] == ["Updated", "Created"]
+
+    @mock.patch("halo.halo_manager.HaloManager.get_users_by_id")
+    def test_show_many(
+        self,
+        mock_get_users_by_id: MagicMock,
+        _mock_authenticate,
+        halo_creds_only,
+        zendesk_authorization_header,
+        client: Client,
+    ):
+        mock_get_users_by_id.return_value = [
+            {"id": 1, "name": "One", "emailaddress": "one@example.com"}  # /PS-IGNORE
+        ]
+
+        response = client.get(
+            f"{reverse('api:users_show_many')}?ids=1",
+            headers={"Authorization": zendesk_authorization_header},
+        )
+
+        assert response.json() == {
+            "users": [{"id": 1, "name": "One", "email": "one@example.com"}]  # /PS-IGNORE
+        }
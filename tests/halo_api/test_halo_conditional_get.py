@@ -0,0 +1,156 @@
+from unittest import mock
+from unittest.mock import MagicMock
+
+from django.test import Client
+from django.urls import reverse
+from django.utils.http import http_date
+
+from help_desk_api.views import last_modified_timestamp, representation_etag
+
+
+def test_etag_ignores_key_order():
+    assert representation_etag({"id": 1, "summary": "A"}) == representation_etag(
+        {"summary": "A", "id": 1}
+    )
+    assert representation_etag({"id": 1}) != representation_etag({"id": 2})
+
+
+def test_last_modified_is_latest_halo_datetime():
+    assert (
+        last_modified_timestamp(["2023-11-09T15:48:39.5816272Z", None, "2023-11-10T00:00:00"])
+        == 1699574400
+    )
+    assert last_modified_timestamp([]) is None
+
+
+@mock.patch("halo.halo_manager.HaloAPIClient._HaloAPIClient__authenticate", return_value="abc123")
+class TestConditionalGet:
+    @mock.patch("halo.halo_manager.HaloManager.get_ticket")
+    def test_ticket_etag_match_is_not_modified(
+        self,
+        mock_get_ticket: MagicMock,
+        _mock_authenticate,
+        new_halo_ticket,
+        halo_creds_only,
+        zendesk_authorization_header,
+        client: Client,
+    ):
+        mock_get_ticket.return_value = new_halo_ticket
+        url = reverse("api:ticket", kwargs={"id": 1234})
+
+        response = client.get(url, headers={"Authorization": zendesk_authorization_header})
+        etag = response.headers["ETag"]
+        with mock.patch(
+            "help_desk_api.views.HaloToZendeskTicketContainerSerializer"
+        ) as mock_serializer:
+            not_modified = client.get(
+                url,
+                headers={"Authorization": zendesk_authorization_header, "If-None-Match": etag},
+            )
+
+        assert response.status_code == 200
+        assert response.headers["Last-Modified"] == "Thu, 09 Nov 2023 15:48:39 GMT"
+        assert not_modified.status_code == 304
+        assert not_modified.headers["ETag"] == etag
+        assert not_modified.content == b""
+        mock_serializer.assert_not_called()
+
+    @mock.patch("halo.halo_manager.HaloManager.get_ticket")
+    def test_ticket_changed_since_etag(
+        self,
+        mock_get_ticket: MagicMock,
+        _mock_authenticate,
+        new_halo_ticket,
+        halo_creds_only,
+        zendesk_authorization_header,
+        client: Client,
+    ):
+        mock_get_ticket.return_value = dict(new_halo_ticket, summary="Changed")
+
+        response = client.get(
+            reverse("api:ticket", kwargs={"id": 1234}),
+            headers={
+                "Authorization": zendesk_authorization_header,
+                "If-None-Match": representation_etag(new_halo_ticket),
+            },
+        )
+
+        assert response.status_code == 200
+        assert response.headers["ETag"] != representation_etag(new_halo_ticket)
+        assert response.json()["ticket"]["id"] == new_halo_ticket["id"]
+
+    @mock.patch("halo.halo_manager.HaloManager.get_ticket")
+    def test_ticket_not_modified_since(
+        self,
+        mock_get_ticket: MagicMock,
+        _mock_authenticate,
+        new_halo_ticket,
+        halo_creds_only,
+        zendesk_authorization_header,
+        client: Client,
+    ):
+        mock_get_ticket.return_value = new_halo_ticket
+        url = reverse("api:ticket", kwargs={"id": 1234})
+        headers = {"Authorization": zendesk_authorization_header}
+
+        not_modified = client.get(
+            url, headers=dict(headers, **{"If-Modified-Since": http_date(1699574400)})
+        )
+        modified = client.get(
+            url, headers=dict(headers, **{"If-Modified-Since": http_date(1699400000)})
+        )
+
+        assert not_modified.status_code == 304
+        assert modified.status_code == 200
+
+    @mock.patch("halo.halo_manager.HaloManager.get_comments")
+    def test_comments_etag_match_is_not_modified(
+        self,
+        mock_get_comments: MagicMock,
+        _mock_authenticate,
+        halo_creds_only,
+        zendesk_authorization_header,
+        client: Client,
+    ):
+        mock_get_comments.return_value = [
+            {"id": 1, "note": "Hello", "outcome": "comment", "datetime": "2023-11-09T15:48:39Z"}
+        ]
+        url = reverse("api:comments", kwargs={"id": 1234})
+
+        response = client.get(url, headers={"Authorization": zendesk_authorization_header})
+        not_modified = client.get(
+            url,
+            headers={
+                "Authorization": zendesk_authorization_header,
+                "If-None-Match": response.headers["ETag"],
+            },
+        )
+
+        assert response.status_code == 200
+        assert response.headers["Last-Modified"] == "Thu, 09 Nov 2023 15:48:39 GMT"
+        assert not_modified.status_code == 304
+
+    @mock.patch("halo.halo_manager.HaloManager.get_user")
+    def test_user_etag_match_is_not_modified(
+        self,
+        mock_get_user: MagicMock,
+        _mock_authenticate,
+        halo_creds_only,
+        zendesk_authorization_header,
+        client: Client,
+    ):
+        mock_get_user.return_value = {"id": 1, "name": "Some Body", "emailaddress": "a@b.com"}
+        url = reverse("api:user", kwargs={"id": 1})
+
+        response = client.get(url, headers={"Authorization": zendesk_authorization_header})
+        not_modified = client.get(
+            url,
+            headers={
+                "Authorization": zendesk_authorization_header,
+                "If-None-Match": response.headers["ETag"],
+            },
+        )
+
+        assert response.status_code == 200
+        assert "Last-Modified" not in response.headers
+        assert not_modified.status_code == 304
@@ -0,0 +1,187 @@
+from datetime import datetime, timezone
+from unittest import mock
+from unittest.mock import MagicMock
+
+import pytest
+from django.test import Client
+from django.urls import reverse
+from halo.halo_manager import parse_halo_datetime
+
+from help_desk_api.pagination import TicketCursor
+
+
+def halo_ticket(halo_id, lastactiondate):
+    return {"id": halo_id, "lastactiondate": lastactiondate}
+
+
+def halo_tickets_response(tickets):
+    """
+    Answers GET Tickets as Halo does, from `tickets` in the (unspecified)
+    order it gives ties, by page and inclusive of the start date
+    """
+
+    def get(path, params):
+        matching = sorted(tickets, key=lambda ticket: parse_halo_datetime(ticket["lastactiondate"]))
+        if startdate := params.get("startdate", None):
+            since = parse_halo_datetime(startdate)
+            matching = [
+                ticket
+                for ticket in matching
+                if parse_halo_datetime(ticket["lastactiondate"]) >= since
+            ]
+        start = (params["page_no"] - 1) * params["page_size"]
+        return {"tickets": matching[start : start + params["page_size"]]}
+
+    return get
+
+
+class TestTicketCursor:
+    def test_round_trip(self):
+        cursor = TicketCursor(parse_halo_datetime("2024-01-01T10:00:00.1234567Z"), 123)
+
+        decoded = TicketCursor.decode(cursor.encode())
+
+        assert decoded.position == cursor.position
+
+    def test_invalid_cursor(self):
+        with pytest.raises(ValueError):
+            TicketCursor.decode("not-a-cursor")
+
+
+@mock.patch("halo.halo_manager.HaloAPIClient._HaloAPIClient__authenticate", return_value="abc123")
+@mock.patch("halo.halo_manager.HaloAPIClient.get")
+class TestIncrementalTicketView:
+    def get(self, client, authorization_header, **params):
+        return client.get(
+            reverse("api:incremental_tickets"),
+            data=params,
+            headers={"Authorization": authorization_header},
+        )
+
+    def test_start_time_searches_by_last_action(
+        self,
+        mock_get: MagicMock,
+        _mock_authenticate,
+        halo_creds_only,
+        zendesk_authorization_header,
+        client: Client,
+    ):
+        mock_get.return_value = {
+            "tickets": [
+                halo_ticket(1, "2024-01-01T10:00:00Z"),
+                halo_ticket(2, "2024-01-01T11:00:00Z"),
+            ]
+        }
+        start_time = datetime(2024, 1, 1, 9, 0, tzinfo=timezone.utc)
+
+        response = self.get(
+            client, zendesk_authorization_header, start_time=int(start_time.timestamp())
+        )
+
+        params = mock_get.call_args.kwargs["params"]
+        assert params["startdate"] == start_time.isoformat()
+        assert params["order"] == "lastactiondate"
+        response_json = response.json()
+        assert [ticket["id"] for ticket in response_json["tickets"]] == [1, 2]
+        assert response_json["end_of_stream"] is True
+        assert TicketCursor.decode(response_json["after_cursor"]).ticket_id == 2
+
+    def test_cursor_skips_tickets_already_seen(
+        self,
+        mock_get: MagicMock,
+        _mock_authenticate,
+        halo_creds_only,
+        zendesk_authorization_header,
+        client: Client,
+    ):
+        # Halo's start date is inclusive, so the last ticket seen comes back again
+        mock_get.return_value = {
+            "tickets": [
+                halo_ticket(1, "2024-01-01T10:00:00Z"),
+                halo_ticket(2, "2024-01-01T10:00:00Z"),
+                halo_ticket(3, "2024-01-01T11:00:00Z"),
+            ]
+        }
+        cursor = TicketCursor(parse_halo_datetime("2024-01-01T10:00:00Z"), 1)
+
+        response = self.get(client, zendesk_authorization_header, cursor=cursor.encode())
+
+        assert [ticket["id"] for ticket in response.json()["tickets"]] == [2, 3]
+
+    def test_full_page_is_not_end_of_stream(
+        self,
+        mock_get: MagicMock,
+        _mock_authenticate,
+        halo_creds_only,
+        zendesk_authorization_header,
+        client: Client,
+    ):
+        mock_get.return_value = {
+            "tickets": [
+                halo_ticket(1, "2024-01-01T10:00:00Z"),
+                halo_ticket(2, "2024-01-01T11:00:00Z"),
+                halo_ticket(3, "2024-01-01T12:00:00Z"),
+            ]
+        }
+
+        response = self.get(client, zendesk_authorization_header, start_time=0, per_page=2)
+
+        response_json = response.json()
+        assert [ticket["id"] for ticket in response_json["tickets"]] == [1, 2]
+        assert response_json["end_of_stream"] is False
+        assert mock_get.call_args.kwargs["params"]["page_size"] == 3
+
+    def test_ties_across_a_page_boundary_are_not_skipped(
+        self,
+        mock_get: MagicMock,
+        _mock_authenticate,
+        halo_creds_only,
+        zendesk_authorization_header,
+        client: Client,
+    ):
+        # Halo doesn't order tickets with the same last action by ID
+        tickets = [
+            halo_ticket(3, "2024-01-01T10:00:00Z"),
+            halo_ticket(1, "2024-01-01T10:00:00Z"),
+            halo_ticket(2, "2024-01-01T10:00:00Z"),
+            halo_ticket(4, "2024-01-01T11:00:00Z"),
+        ]
+        mock_get.side_effect = halo_tickets_response(tickets)
+
+        seen = []
+        params = {"start_time": 0, "per_page": 2}
+        for _ in range(3):
+            response_json = self.get(client, zendesk_authorization_header, **params).json()
+            seen.extend(ticket["id"] for ticket in response_json["tickets"])
+            params = {"cursor": response_json["after_cursor"], "per_page": 2}
+
+        assert seen == [1, 2, 3, 4]
+        assert response_json["end_of_stream"] is True
+
+    def test_no_changes_keeps_cursor(
+        self,
+        mock_get: MagicMock,
+        _mock_authenticate,
+        halo_creds_only,
+        zendesk_authorization_header,
+        client: Client,
+    ):
+        mock_get.return_value = {"tickets": []}
+        cursor = TicketCursor(parse_halo_datetime("2024-01-01T10:00:00Z"), 1).encode()
+
+        response = self.get(client, zendesk_authorization_header, cursor=cursor)
+
+        assert response.json()["after_cursor"] == cursor
+        assert response.json()["end_of_stream"] is True
+
+    def test_start_time_or_cursor_required(
+        self,
+        _mock_get: MagicMock,
+        _mock_authenticate,
+        halo_creds_only,
+        zendesk_authorization_header,
+        client: Client,
+    ):
+        response = self.get(client, zendesk_authorization_header)
+
+        assert response.status_code == 400
@@ -0,0 +1,279 @@
+import io
+import threading
+from datetime import timedelta
+from http import HTTPStatus
+from unittest import mock
+from unittest.mock import MagicMock
+
+import pytest
+from django.core.management import call_command
+from django.urls import reverse
+from django.utils import timezone
+from halo.halo_api_client import HaloClientBadRequestException
+from halo.halo_manager import HaloManager
+from halo.upload_pipeline import InfectedFileException
+
+from help_desk_api import scan_queue
+from help_desk_api.management.commands.scan_uploads import Command
+from help_desk_api.metrics import snapshot
+from help_desk_api.models import PendingUpload
+
+
+@pytest.fixture()
+def pending_upload(halo_creds_only):
+    return scan_queue.enqueue(halo_creds_only, "file.txt", io.BytesIO(b"hello"), "text/plain")
+
+
+def zendesk_ticket(*upload_tokens):
+    return {
+        "subject": "Attachments",
+        "comment": {"body": "See attached", "uploads": list(upload_tokens)},
+        "requester": {"name": "Some Body", "email": "somebody@example.com"},  # /PS-IGNORE
+    }
+
+
+def scan(upload):
+    Command().scan(upload)
+    upload.refresh_from_db()
+    return upload
+
+
+@mock.patch("halo.halo_manager.HaloAPIClient._HaloAPIClient__authenticate", return_value="abc123")
+class TestUploadsView:
+    @mock.patch("halo.halo_api_client.HaloAPIClient.post_body")
+    def test_upload_accepted_before_scan(
+        self,
+        mock_post_body: MagicMock,
+        _mock_authenticate,
+        settings,
+        halo_creds_only,
+        zendesk_authorization_header,
+        client,
+    ):
+        settings.AV_SCAN_QUEUE = True
+
+        response = client.post(
+            reverse("api:uploads") + "?filename=file.txt",
+            data=b"hello",
+            content_type="text/plain",
+            headers={"Authorization": zendesk_authorization_header},
+        )
+
+        assert response.status_code == HTTPStatus.CREATED
+        upload = PendingUpload.objects.get()
+        assert response.json() == {"upload": {"token": upload.token}}
+        assert upload.token.startswith("pending-")
+        assert bytes(upload.data) == b"hello"
+        assert upload.status == PendingUpload.Status.PENDING
+        mock_post_body.assert_not_called()
+
+    def test_upload_too_large_refused(
+        self,
+        _mock_authenticate,
+        settings,
+        halo_creds_only,
+        zendesk_authorization_header,
+        client,
+    ):
+        settings.AV_SCAN_QUEUE = True
+        settings.AV_SCAN_QUEUE_MAX_UPLOAD = 4
+
+        response = client.post(
+            reverse("api:uploads") + "?filename=file.txt",
+            data=b"hello",
+            content_type="text/plain",
+            headers={"Authorization": zendesk_authorization_header},
+        )
+
+        assert response.status_code == HTTPStatus.REQUEST_ENTITY_TOO_LARGE
+        assert response.json()["error"] == "FileTooLarge"
+        assert not PendingUpload.objects.exists()
+
+
+@mock.patch("halo.halo_manager.HaloAPIClient._HaloAPIClient__authenticate", return_value="abc123")
+@mock.patch("halo.halo_manager.HaloManager.upload_stream")
+class TestWorker:
+    def test_clean_upload_sent_to_halo(
+        self, mock_upload_stream: MagicMock, _mock_authenticate, pending_upload
+    ):
+        mock_upload_stream.return_value = {"id": 218}
+
+        upload = scan(scan_queue.claim(1)[0])
+
+        assert upload.status == PendingUpload.Status.CLEAN
+        assert upload.halo_attachment_id == 218
+        assert upload.data is None
+        assert mock_upload_stream.call_args.kwargs["stream"].read() == b"hello"
+
+    def test_infected_upload_not_sent(
+        self, mock_upload_stream: MagicMock, _mock_authenticate, pending_upload
+    ):
+        mock_upload_stream.side_effect = InfectedFileException("file.txt failed the virus scan")
+
+        upload = scan(scan_queue.claim(1)[0])
+
+        assert upload.status == PendingUpload.Status.INFECTED
+        assert upload.halo_attachment_id is None
+
+    def test_failed_scan_retried_later(
+        self, mock_upload_stream: MagicMock, _mock_authenticate, pending_upload
+    ):
+        mock_upload_stream.side_effect = HaloClientBadRequestException("Bad")
+
+        upload = scan(scan_queue.claim(1)[0])
+
+        assert upload.status == PendingUpload.Status.PENDING
+        assert upload.attempts == 1
+        assert upload.available_at > timezone.now()
+        assert scan_queue.claim(1) == []
+
+    def test_gives_up_after_max_attempts(
+        self, mock_upload_stream: MagicMock, _mock_authenticate, pending_upload, settings
+    ):
+        settings.AV_SCAN_MAX_ATTEMPTS = 1
+        mock_upload_stream.side_effect = HaloClientBadRequestException("Bad")
+
+        upload = scan(scan_queue.claim(1)[0])
+
+        assert upload.status == PendingUpload.Status.FAILED
+        assert upload.data is None
+
+    def test_scan_latency_recorded(
+        self, mock_upload_stream: MagicMock, _mock_authenticate, pending_upload
+    ):
+        mock_upload_stream.return_value = {"id": 218}
+        before = snapshot()["scan_queue.scan_seconds.count"]
+
+        scan(scan_queue.claim(1)[0])
+
+        assert snapshot()["scan_queue.scan_seconds.count"] == before + 1
+
+
+class TestClaim:
+    def test_claimed_upload_not_claimed_again(self, pending_upload):
+        assert scan_queue.claim(2) == [pending_upload]
+        assert scan_queue.claim(2) == []
+
+    def test_abandoned_upload_claimed_again(self, pending_upload, settings):
+        scan_queue.claim(1)
+        PendingUpload.objects.update(available_at=timezone.now() - timedelta(seconds=1))
+
+        assert scan_queue.claim(1) == [pending_upload]
+
+    def test_oldest_first(self, halo_creds_only):
+        uploads = [
+            scan_queue.enqueue(halo_creds_only, f"{index}.txt", io.BytesIO(b"hello"), "text/plain")
+            for index in range(3)
+        ]
+
+        assert scan_queue.claim(2) == uploads[:2]
+
+    def test_queue_depth(self, pending_upload):
+        scan_queue.update_queue_depth()
+        assert snapshot()["scan_queue.depth"] == 1
+
+        scan_queue.finish(scan_queue.claim(1)[0], PendingUpload.Status.INFECTED)
+        scan_queue.update_queue_depth()
+        assert snapshot()["scan_queue.depth"] == 0
+
+
+@mock.patch("halo.halo_manager.HaloAPIClient._HaloAPIClient__authenticate", return_value="abc123")
+@mock.patch("halo.halo_manager.HaloAPIClient.post")
+class TestAttachingToTickets:
+    def test_scanned_upload_attached_with_ticket(
+        self, mock_post: MagicMock, _mock_authenticate, pending_upload
+    ):
+        scan_queue.finish(pending_upload, PendingUpload.Status.CLEAN, halo_attachment_id=218)
+        mock_post.return_value = {"id": 1}
+
+        HaloManager(client_id="id", client_secret="secret").create_ticket(
+            {"ticket": zendesk_ticket(pending_upload.token, 219)}
+        )
+
+        ticket_payload = mock_post.call_args.kwargs["payload"][0]
+        assert ticket_payload["attachments"] == [{"id": 218}, {"id": 219}]
+
+    def test_upload_attached_once_scanned(
+        self, mock_post: MagicMock, _mock_authenticate, pending_upload
+    ):
+        mock_post.return_value = {"id": 1}
+        halo_manager = HaloManager(client_id="id", client_secret="secret")
+
+        halo_manager.create_ticket({"ticket": zendesk_ticket(pending_upload.token)})
+
+        assert "attachments" not in mock_post.call_args.kwargs["payload"][0]
+        pending_upload.refresh_from_db()
+        assert pending_upload.halo_ticket_id == 1
+
+        with mock.patch("halo.halo_manager.HaloManager.upload_stream", return_value={"id": 218}):
+            scan(scan_queue.claim(1)[0])
+
+        mock_post.assert_called_with(
+            path="Tickets", payload=[{"id": 1, "attachments": [{"id": 218}]}]
+        )
+
+    def test_upload_scanned_since_payload_attached(
+        self, mock_post: MagicMock, _mock_authenticate, pending_upload
+    ):
+        mock_post.return_value = {"id": 1}
+        halo_manager = HaloManager(client_id="id", client_secret="secret")
+        ticket_data, waiting = halo_manager.without_pending_uploads(
+            zendesk_ticket(pending_upload.token)
+        )
+        scan_queue.finish(pending_upload, PendingUpload.Status.CLEAN, halo_attachment_id=218)
+
+        halo_manager.attach_when_scanned(waiting, {"id": 1})
+
+        assert ticket_data["comment"]["uploads"] == []
+        mock_post.assert_called_once_with(
+            path="Tickets", payload=[{"id": 1, "attachments": [{"id": 218}]}]
+        )
+
+    def test_infected_upload_not_attached(
+        self, mock_post: MagicMock, _mock_authenticate, pending_upload
+    ):
+        scan_queue.finish(pending_upload, PendingUpload.Status.INFECTED)
+        mock_post.return_value = {"id": 1}
+
+        HaloManager(client_id="id", client_secret="secret").create_ticket(
+            {"ticket": zendesk_ticket(pending_upload.token)}
+        )
+
+        assert "attachments" not in mock_post.call_args.kwargs["payload"][0]
+        mock_post.assert_called_once()
+
+
+@pytest.mark.django_db(transaction=True)
+@mock.patch("halo.halo_manager.HaloAPIClient._HaloAPIClient__authenticate", return_value="abc123")
+@mock.patch("halo.halo_manager.HaloManager.upload_stream", return_value={"id": 218})
+def test_command_scans_queue(_mock_upload_stream, _mock_authenticate, halo_creds_only):
+    for index in range(5):
+        scan_queue.enqueue(halo_creds_only, f"{index}.txt", io.BytesIO(b"hello"), "text/plain")
+
+    call_command("scan_uploads", "--once", "--workers", "2")
+
+    assert set(PendingUpload.objects.values_list("status", flat=True)) == {
+        PendingUpload.Status.CLEAN
+    }
+
+
+@pytest.mark.django_db(transaction=True)
+def test_command_claims_more_while_scan_continues(halo_creds_only):
+    for index in range(4):
+        scan_queue.enqueue(halo_creds_only, f"{index}.txt", io.BytesIO(b"hello"), "text/plain")
+    others_scanned = threading.Event()
+    scanned = []
+
+    def scan(upload):
+        if upload.filename == "0.txt":
+            # The slow scan only finishes once the rest have been claimed and scanned
+            others_scanned.wait(timeout=5)
+        scanned.append(upload.filename)
+        if len(scanned) == 3:
+            others_scanned.set()
+
+    with mock.patch.object(Command, "scan", side_effect=scan):
+        call_command("scan_uploads", "--once", "--workers", "2")
+
+    assert scanned[-1] == "0.txt"
+    assert others_scanned.is_set()
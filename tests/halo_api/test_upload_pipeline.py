@@ -0,0 +1,436 @@
+import base64
+import json
+import socket
+import struct
+import threading
+from dataclasses import dataclass
+from hashlib import sha256
+from http import HTTPStatus
+from io import BytesIO
+from unittest import mock
+from unittest.mock import MagicMock
+
+import pytest
+import requests
+from django.urls import reverse
+from halo import clam_av
+from halo.attachment_cache import attachment_cache, halo_attachment_cache_key
+from halo.clam_av import (
+    AntiVirusServiceErrorException,
+    RestScanner,
+    av_scan_file,
+    scan_stream,
+)
+from halo.upload_pipeline import (
+    AttachmentPayloadEncoder,
+    InfectedFileException,
+    spooled_upload,
+)
+
+EICAR = b"X5O!P%@AP[4\\PZX54(P^)7CC)7}$EICAR-STANDARD-ANTIVIRUS-TEST-FILE!$H+H*"
+
+
+def receive_exactly(connection, size):
+    data = b""
+    while len(data) < size:
+        received = connection.recv(size - len(data))
+        if not received:
+            break
+        data += received
+    return data
+
+
+@dataclass
+class Clamd:
+    server: socket.socket
+    commands: list
+    scanned: list
+    definitions: list
+
+    def stop(self):
+        # Wakes the accept(), after which connections are refused
+        self.server.shutdown(socket.SHUT_RDWR)
+        self.server.close()
+
+
+@pytest.fixture()
+def clamd(settings):
+    """
+    Enough of clamd to answer VERSION and INSTREAM scans; finds EICAR
+    """
+    server = socket.create_server(("127.0.0.1", 0))
+    commands = []
+    scanned = []
+    definitions = [27431]
+
+    def serve():
+        while True:
+            try:
+                connection, _ = server.accept()
+            except OSError:
+                return
+            with connection:
+                command = b""
+                while not command.endswith(b"\0"):
+                    command += connection.recv(1)
+                commands.append(command)
+                if command == b"zVERSION\0":
+                    connection.sendall(f"ClamAV 1.0.5/{definitions[0]}/Tue Oct 15\0".encode())
+                    continue
+                data = b""
+                while len(header := receive_exactly(connection, 4)) == 4:
+                    if not (length := struct.unpack("!L", header)[0]):
+                        break
+                    data += receive_exactly(connection, length)
+                else:
+                    # Abandoned
+                    continue
+                scanned.append(data)
+                reply = b"stream: Eicar-Signature FOUND\0" if EICAR in data else b"stream: OK\0"
+                connection.sendall(reply)
+
+    threading.Thread(target=serve, daemon=True).start()
+    settings.AV_SCAN_UPLOADS = True
+    settings.CLAMD_HOST, settings.CLAMD_PORT = server.getsockname()
+    with mock.patch("halo.clam_av._definitions_version", (0.0, None)):
+        yield Clamd(server, commands, scanned, definitions)
+    server.close()
+
+
+class TestAttachmentPayloadEncoder:
+    @pytest.mark.parametrize("chunk_size", [1, 2, 3, 4, 1000])
+    def test_payload_matches_upload_file(self, chunk_size, attachment_data):
+        encoder = AttachmentPayloadEncoder("file.txt", "text/plain")
+        for start in range(0, len(attachment_data), chunk_size):
+            encoder.feed(attachment_data[start : start + chunk_size])
+
+        payload = json.loads(encoder.finish().read())
+
+        data_base64 = base64.b64encode(attachment_data).decode("ascii")  # /PS-IGNORE
+        assert payload == [
+            {
+                "filename": "file.txt",
+                "isimage": False,
+                "data_base64": f"data:text/plain;base64,{data_base64}",
+            }
+        ]
+
+    def test_spools_to_disk(self, settings):
+        settings.UPLOAD_SPOOL_MAX_MEMORY = 10
+        encoder = AttachmentPayloadEncoder("file.txt", "text/plain")
+
+        encoder.feed(b"a" * 100)
+
+        assert encoder.payload._rolled
+
+
+class TestClamdScanning:
+    def test_clean_file(self, clamd):
+        data = b"hello" * 100_000
+
+        assert scan_stream(BytesIO(data), "clean.txt") is True
+        assert clamd.scanned == [data]
+
+    def test_infected_file(self, clamd):
+        assert scan_stream(BytesIO(EICAR), "eicar.txt") is False
+
+    def test_infected_file_not_encoded(self, clamd):
+        with pytest.raises(InfectedFileException):
+            with spooled_upload(BytesIO(EICAR), "eicar.txt", "text/plain") as upload:
+                upload.scan()
+
+
+class TestRestScanning:
+    @mock.patch("halo.clam_av.CLAM_AV_URL", "https://clamav.example.com/v2/scan")
+    @mock.patch("halo.clam_av.session.post")
+    def test_body_is_streamed_as_multipart(self, mock_post: MagicMock):
+        sent = []
+
+        def post(url, data, **kwargs):
+            sent.append((b"".join(data), kwargs["headers"]["Content-Type"]))
+            return MagicMock(json=MagicMock(return_value={"malware": False}))
+
+        mock_post.side_effect = post
+        scanner = RestScanner("clean.txt")
+        scanner.feed(b"hel")
+        scanner.feed(b"lo")
+
+        assert scanner.verdict() is True
+        body, content_type = sent[0]
+        boundary = content_type.split("boundary=")[1]
+        assert body.startswith(f"--{boundary}\r\n".encode())
+        assert b'name="file"; filename="clean.txt"' in body
+        assert b"\r\n\r\nhello\r\n" in body
+        assert body.endswith(f"--{boundary}--\r\n".encode())
+
+    @mock.patch("halo.clam_av.CLAM_AV_URL", "https://clamav.example.com/v2/scan")
+    @mock.patch("halo.clam_av.session.post")
+    def test_request_error_is_service_error(self, mock_post: MagicMock):
+        mock_post.side_effect = requests.ConnectionError("Connection refused")
+        scanner = RestScanner("clean.txt")
+
+        with pytest.raises(AntiVirusServiceErrorException):
+            scanner.verdict()
+
+    @mock.patch("halo.clam_av.REST_SCAN_QUEUE_POLL", 0.01)
+    @mock.patch("halo.clam_av.CLAM_AV_URL", "https://clamav.example.com/v2/scan")
+    @mock.patch("halo.clam_av.session.post")
+    def test_close_abandons_request(self, mock_post: MagicMock):
+        mock_post.side_effect = lambda url, data, **kwargs: b"".join(data)
+        scanner = RestScanner("clean.txt")
+        for _ in range(clam_av.REST_SCAN_QUEUE_CHUNKS):
+            scanner.feed(b"hello")
+
+        scanner.close()
+        scanner.thread.join(timeout=5)
+
+        assert not scanner.thread.is_alive()
+        assert isinstance(scanner.error, AntiVirusServiceErrorException)
+
+
+@mock.patch("halo.halo_manager.HaloAPIClient._HaloAPIClient__authenticate", return_value="abc123")
+@mock.patch("halo.halo_api_client.HaloAPIClient.post_body")
+class TestUploadsView:
+    def test_clean_upload_sent_to_halo(
+        self,
+        mock_post_body: MagicMock,
+        _mock_authenticate,
+        clamd,
+        halo_creds_only,
+        zendesk_authorization_header,
+        halo_upload_response_body,
+        client,
+    ):
+        payloads = []
+        mock_post_body.side_effect = lambda path, body: payloads.append(body.read()) or (
+            halo_upload_response_body
+        )
+
+        response = client.post(
+            reverse("api:uploads") + "?filename=clean.txt",
+            data=b"hello",
+            content_type="text/plain",
+            headers={"Authorization": zendesk_authorization_header},
+        )
+
+        assert response.status_code == HTTPStatus.CREATED
+        assert response.json() == {"upload": {"token": 218}}
+        assert clamd.scanned == [b"hello"]
+        assert json.loads(payloads[0])[0]["data_base64"] == "data:text/plain;base64,aGVsbG8="
+
+    def test_infected_upload_refused(
+        self,
+        mock_post_body: MagicMock,
+        _mock_authenticate,
+        clamd,
+        halo_creds_only,
+        zendesk_authorization_header,
+        client,
+    ):
+        response = client.post(
+            reverse("api:uploads") + "?filename=eicar.txt",
+            data=EICAR,
+            content_type="text/plain",
+            headers={"Authorization": zendesk_authorization_header},
+        )
+
+        assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+        mock_post_body.assert_not_called()
+
+    def test_unreachable_clamd_is_service_unavailable(
+        self,
+        mock_post_body: MagicMock,
+        _mock_authenticate,
+        settings,
+        halo_creds_only,
+        zendesk_authorization_header,
+        client,
+    ):
+        # Nothing's listening on the port once the server's closed
+        with socket.create_server(("127.0.0.1", 0)) as server:
+            settings.CLAMD_HOST, settings.CLAMD_PORT = server.getsockname()
+        settings.AV_SCAN_UPLOADS = True
+
+        response = upload(client, zendesk_authorization_header, b"hello")
+
+        assert response.status_code == HTTPStatus.SERVICE_UNAVAILABLE
+        mock_post_body.assert_not_called()
+
+
+def forget_halo_attachment(data):
+    attachment_cache().delete(halo_attachment_cache_key(sha256(data).hexdigest()))
+
+
+def upload(client, zendesk_authorization_header, data):
+    return client.post(
+        reverse("api:uploads") + "?filename=file.txt",
+        data=data,
+        content_type="text/plain",
+        headers={"Authorization": zendesk_authorization_header},
+    )
+
+
+@mock.patch("halo.halo_manager.HaloAPIClient._HaloAPIClient__authenticate", return_value="abc123")
+@mock.patch("halo.halo_api_client.HaloAPIClient.post_body")
+class TestAttachmentCache:
+    def test_repeat_upload_not_scanned_or_uploaded(
+        self,
+        mock_post_body: MagicMock,
+        _mock_authenticate,
+        clamd,
+        halo_creds_only,
+        zendesk_authorization_header,
+        halo_upload_response_body,
+        client,
+    ):
+        mock_post_body.return_value = halo_upload_response_body
+
+        first = upload(client, zendesk_authorization_header, b"logo")
+        second = upload(client, zendesk_authorization_header, b"logo")
+
+        assert first.json() == second.json() == {"upload": {"token": 218}}
+        assert clamd.scanned == [b"logo"]
+        assert clamd.commands.count(b"zINSTREAM\0") == 1
+        mock_post_body.assert_called_once()
+
+    def test_repeat_upload_while_clamd_down(
+        self,
+        mock_post_body: MagicMock,
+        _mock_authenticate,
+        clamd,
+        halo_creds_only,
+        zendesk_authorization_header,
+        halo_upload_response_body,
+        client,
+    ):
+        mock_post_body.return_value = halo_upload_response_body
+        upload(client, zendesk_authorization_header, b"logo")
+
+        clamd.stop()
+        response = upload(client, zendesk_authorization_header, b"logo")
+
+        assert response.status_code == HTTPStatus.CREATED
+        assert response.json() == {"upload": {"token": 218}}
+
+    def test_clean_verdict_used_while_clamd_down(
+        self,
+        mock_post_body: MagicMock,
+        _mock_authenticate,
+        clamd,
+        halo_creds_only,
+        zendesk_authorization_header,
+        halo_upload_response_body,
+        client,
+    ):
+        mock_post_body.return_value = halo_upload_response_body
+        upload(client, zendesk_authorization_header, b"logo")
+        # e.g. the Halo attachment's expired, but the verdict hasn't
+        forget_halo_attachment(b"logo")
+
+        clamd.stop()
+        response = upload(client, zendesk_authorization_header, b"logo")
+
+        assert response.status_code == HTTPStatus.CREATED
+        assert mock_post_body.call_count == 2
+
+    def test_different_content_uploaded(
+        self,
+        mock_post_body: MagicMock,
+        _mock_authenticate,
+        clamd,
+        halo_creds_only,
+        zendesk_authorization_header,
+        halo_upload_response_body,
+        client,
+    ):
+        mock_post_body.return_value = halo_upload_response_body
+
+        upload(client, zendesk_authorization_header, b"logo")
+        upload(client, zendesk_authorization_header, b"other logo")
+
+        assert clamd.scanned == [b"logo", b"other logo"]
+        assert mock_post_body.call_count == 2
+
+    def test_rescanned_after_signature_update(
+        self,
+        mock_post_body: MagicMock,
+        _mock_authenticate,
+        clamd,
+        halo_creds_only,
+        zendesk_authorization_header,
+        halo_upload_response_body,
+        client,
+    ):
+        mock_post_body.return_value = halo_upload_response_body
+        upload(client, zendesk_authorization_header, b"logo")
+
+        clamd.definitions[0] += 1
+        clam_av._definitions_version = (0.0, None)
+        upload(client, zendesk_authorization_header, b"logo")
+
+        assert clamd.scanned == [b"logo", b"logo"]
+        # Still clean, so the attachment's reused
+        mock_post_body.assert_called_once()
+
+    def test_attachment_not_reused_once_infected(
+        self,
+        mock_post_body: MagicMock,
+        _mock_authenticate,
+        clamd,
+        halo_creds_only,
+        zendesk_authorization_header,
+        halo_upload_response_body,
+        client,
+        settings,
+    ):
+        mock_post_body.return_value = halo_upload_response_body
+        settings.AV_SCAN_UPLOADS = False
+        upload(client, zendesk_authorization_header, EICAR)
+
+        settings.AV_SCAN_UPLOADS = True
+        response = upload(client, zendesk_authorization_header, EICAR)
+
+        assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+        assert clamd.scanned == [EICAR]
+
+    def test_infected_verdict_cached(
+        self,
+        mock_post_body: MagicMock,
+        _mock_authenticate,
+        clamd,
+        halo_creds_only,
+        zendesk_authorization_header,
+        client,
+    ):
+        upload(client, zendesk_authorization_header, EICAR)
+        response = upload(client, zendesk_authorization_header, EICAR)
+
+        assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+        assert clamd.scanned == [EICAR]
+        mock_post_body.assert_not_called()
+
+    def test_no_verdicts_cached_without_signature_version(
+        self,
+        mock_post_body: MagicMock,
+        _mock_authenticate,
+        clamd,
+        halo_creds_only,
+        zendesk_authorization_header,
+        halo_upload_response_body,
+        client,
+    ):
+        mock_post_body.return_value = halo_upload_response_body
+        with mock.patch("halo.clam_av.clamd_version", side_effect=OSError("No VERSION")):
+            upload(client, zendesk_authorization_header, b"logo")
+            upload(client, zendesk_authorization_header, b"logo")
+
+        assert clamd.scanned == [b"logo", b"logo"]
+
+
+def test_av_scan_file_verdict_cached(clamd, tmp_path):
+    path = tmp_path / "clean.txt"
+    path.write_bytes(b"clean")
+
+    assert av_scan_file(path) is True
+    assert av_scan_file(path) is True
+    assert clamd.scanned == [b"clean"]
@@ -0,0 +1,142 @@
+from unittest import mock
+
+import pytest
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+from help_desk_api.cache import LocalLRU, TwoTierCache
+from help_desk_api.models import CustomField
+from help_desk_api.serializers import (
+    HaloCustomFieldFromZendeskField,
+    custom_field_mapping_cache_key,
+)
+
+
+@pytest.fixture()
+def two_tier_cache():
+    cache = TwoTierCache(
+        "redis://redis.invalid:6379",
+        {
+            "KEY_PREFIX": "test",
+            "OPTIONS": {
+                "LOCAL_MAX_ENTRIES": 2,
+                "LOCAL_TIMEOUT": 10,
+                "FALLBACK_CACHE": "ticketdata_db",
+            },
+        },
+    )
+    # Stand in for Redis
+    cache.remote = LocMemCache("two-tier-test", {"KEY_PREFIX": "test"})
+    yield cache
+    cache.remote.clear()
+
+
+class TestLocalLRU:
+    def test_evicts_least_recently_used(self):
+        lru = LocalLRU(max_entries=2, timeout=10)
+        lru.set("a", 1)
+        lru.set("b", 2)
+        lru.get("a")
+        lru.set("c", 3)
+
+        assert lru.get("a") == 1
+        assert lru.get("b") is None
+        assert lru.get("c") == 3
+
+    @mock.patch("help_desk_api.cache.time.monotonic")
+    def test_entries_expire(self, mock_monotonic):
+        mock_monotonic.return_value = 100
+        lru = LocalLRU(max_entries=2, timeout=10)
+        lru.set("a", 1)
+
+        mock_monotonic.return_value = 111
+
+        assert lru.get("a") is None
+
+    def test_disabled_when_no_entries_allowed(self):
+        lru = LocalLRU(max_entries=0, timeout=10)
+        lru.set("a", 1)
+
+        assert lru.get("a") is None
+
+
+class TestTwoTierCache:
+    def test_get_served_from_local_tier(self, two_tier_cache):
+        two_tier_cache.set("key", "value")
+        two_tier_cache.remote.clear()
+
+        assert two_tier_cache.get("key") == "value"
+
+    def test_get_populates_local_tier_from_redis(self, two_tier_cache):
+        two_tier_cache.remote.set("key", "value")
+
+        assert two_tier_cache.get("key") == "value"
+        two_tier_cache.remote.clear()
+        assert two_tier_cache.get("key") == "value"
+
+    def test_redis_miss_falls_through_to_database(self, two_tier_cache):
+        caches["ticketdata_db"].set("key", "value")
+
+        assert two_tier_cache.get("key") == "value"
+        # Promoted to Redis
+        assert two_tier_cache.remote.get("key") == "value"
+
+    def test_redis_error_falls_back_to_database(self, two_tier_cache):
+        with mock.patch.object(
+            two_tier_cache.remote, "set", side_effect=RedisConnectionError("down")
+        ):
+            two_tier_cache.set("key", "value")
+
+        assert caches["ticketdata_db"].get("key") == "value"
+        assert not two_tier_cache.remote_available
+
+    def test_redis_skipped_while_unavailable(self, two_tier_cache):
+        with mock.patch.object(
+            two_tier_cache.remote, "get", side_effect=RedisConnectionError("down")
+        ) as mock_get:
+            two_tier_cache.get("key")
+            two_tier_cache.get("other_key")
+
+        assert mock_get.call_count == 1
+
+    def test_delete_removes_from_all_tiers(self, two_tier_cache):
+        two_tier_cache.set("key", "value")
+        caches["ticketdata_db"].set("key", "value")
+
+        two_tier_cache.delete("key")
+
+        assert two_tier_cache.get("key") is None
+        assert caches["ticketdata_db"].get("key") is None
+
+    def test_incr_is_not_served_locally(self, two_tier_cache):
+        two_tier_cache.set("counter", 1)
+
+        assert two_tier_cache.incr("counter") == 2
+        assert two_tier_cache.get("counter") == 2
+
+    def test_add_only_sets_once(self, two_tier_cache):
+        assert two_tier_cache.add("lock", 1) is True
+        assert two_tier_cache.add("lock", 1) is False
+
+
+class TestReferenceDataCache:
+    def test_custom_field_mapping_is_cached(self):
+        custom_field = CustomField.objects.create(
+            zendesk_name="test", halo_name="CFTest", zendesk_id=123456, halo_id=654
+        )
+        field = HaloCustomFieldFromZendeskField()
+
+        mapping = field.halo_mapping_by_zendesk_id(123456)
+
+        cached = caches["referencedata"].get(custom_field_mapping_cache_key(123456))
+        assert cached == mapping
+        with mock.patch.object(field, "halo_mapping_from_database") as mock_from_database:
+            field.halo_mapping_by_zendesk_id("123456")
+        mock_from_database.assert_not_called()
+
+        custom_field.halo_id = 655
+        custom_field.save()
+
+        assert caches["referencedata"].get(custom_field_mapping_cache_key(123456)) is None
+        assert field.halo_mapping_by_zendesk_id(123456)["halo_id"] == 655
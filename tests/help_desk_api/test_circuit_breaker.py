@@ -0,0 +1,125 @@
+import time
+from http import HTTPStatus
+from unittest import mock
+from unittest.mock import MagicMock
+
+import pytest
+from halo.halo_api_client import HaloAPIClient
+
+from help_desk_api.circuit_breaker import (
+    CircuitBreaker,
+    CircuitOpenException,
+    halo_breaker,
+)
+
+test_breaker = CircuitBreaker("test")
+
+
+@pytest.fixture()
+def breaker(settings):
+    settings.CIRCUIT_BREAKER_WINDOW = 60
+    settings.CIRCUIT_BREAKER_MIN_CALLS = 4
+    settings.CIRCUIT_BREAKER_FAILURE_RATE = 0.5
+    settings.CIRCUIT_BREAKER_OPEN_SECONDS = 30
+    return test_breaker
+
+
+@pytest.fixture()
+def clock():
+    with mock.patch("help_desk_api.circuit_breaker.time.time", return_value=1_000_020.0) as clock:
+        yield clock
+
+
+@pytest.fixture()
+def open_halo_breaker():
+    halo_breaker.cache.set(halo_breaker.cache_key("opened_at"), time.time())
+
+
+def response(status_code):
+    return MagicMock(status_code=status_code)
+
+
+def fail(breaker, times=1):
+    for _ in range(times):
+        breaker.call(lambda: response(HTTPStatus.BAD_GATEWAY))
+
+
+class TestCircuitBreaker:
+    def test_stays_closed_until_enough_calls(self, breaker, clock):
+        fail(breaker, 3)
+
+        assert not breaker.is_open()
+        assert breaker.call(lambda: "called") == "called"
+
+    def test_opens_at_failure_rate(self, breaker, clock):
+        breaker.call(lambda: response(HTTPStatus.OK))
+        fail(breaker, 3)
+        fn = MagicMock()
+
+        assert breaker.is_open()
+        with pytest.raises(CircuitOpenException):
+            breaker.call(fn)
+        fn.assert_not_called()
+
+    def test_exceptions_are_failures(self, breaker, clock):
+        def connection_error():
+            raise ConnectionError()
+
+        for _ in range(4):
+            with pytest.raises(ConnectionError):
+                breaker.call(connection_error)
+
+        assert breaker.is_open()
+
+    def test_client_errors_are_not_failures(self, breaker, clock):
+        for _ in range(10):
+            breaker.call(lambda: response(HTTPStatus.NOT_FOUND))
+
+        assert not breaker.is_open()
+
+    def test_failures_are_counted_per_window(self, breaker, clock):
+        fail(breaker, 3)
+        clock.return_value += 60
+        fail(breaker, 1)
+
+        assert not breaker.is_open()
+
+    def test_successful_probe_closes(self, breaker, clock):
+        fail(breaker, 4)
+        clock.return_value += 30
+
+        assert not breaker.is_open()
+        assert breaker.call(lambda: response(HTTPStatus.OK)).status_code == HTTPStatus.OK
+        assert breaker.call(lambda: "called") == "called"
+
+    def test_one_probe_at_a_time(self, breaker, clock):
+        fail(breaker, 4)
+        clock.return_value += 30
+
+        def probe():
+            with pytest.raises(CircuitOpenException):
+                breaker.call(lambda: "called")
+            return response(HTTPStatus.OK)
+
+        breaker.call(probe)
+
+    def test_failed_probe_opens_again(self, breaker, clock):
+        fail(breaker, 4)
+        clock.return_value += 30
+
+        fail(breaker, 1)
+
+        assert breaker.is_open()
+        clock.return_value += 29
+        with pytest.raises(CircuitOpenException):
+            breaker.call(lambda: "called")
+
+
+@mock.patch("requests.get")
+def test_halo_client_refused_when_open(mock_get, open_halo_breaker):
+    with mock.patch.object(HaloAPIClient, "_HaloAPIClient__authenticate", return_value="abc123"):
+        client = HaloAPIClient("client_id", "client_secret")
+
+    with pytest.raises(CircuitOpenException):
+        client.get("Tickets/1")
+    mock_get.assert_not_called()
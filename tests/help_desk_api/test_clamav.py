@@ -18,6 +18,13 @@ CLAM_AV_PATH = "/"
 CLAM_AV_PATH_NOT_OK = "/v3"
 
 
+@pytest.fixture()
+def clam_av_url():
+    with mock.patch("halo.clam_av.CLAM_AV_URL", "https://clamav.example.com/v2/scan"):
+        yield
+
+
+@pytest.mark.usefixtures("clam_av_url")
 class TestClamAVScan:
 
     # †est different file paths with the @pytest.mark.parametrize decorator
@@ -27,7 +34,7 @@ class TestClamAVScan:
             (CLEAN),
         ],
     )
-    @patch("requests.post")
+    @patch("halo.clam_av.session.post")
     def test_av_scan_malware_not_found(self, mock_post, path):
         mock_post.return_value.status_code = 200
         mock_post.return_value.json.return_value = {
@@ -44,7 +51,7 @@ class TestClamAVScan:
             (EICAR),
         ],
     )
-    @patch("requests.post")
+    @patch("halo.clam_av.session.post")
     def test_av_scan_malware_found(self, mock_post, path):
         mock_post.return_value.status_code = 200
         mock_post.return_value.json.return_value = {
@@ -0,0 +1,127 @@
+from http import HTTPStatus
+from unittest import mock
+from unittest.mock import MagicMock
+
+import pytest
+from django.http import JsonResponse
+from django.urls import reverse
+from halo.halo_api_client import HaloAPIClient
+
+from help_desk_api.deadlines import (
+    DeadlineExceeded,
+    deadline,
+    deadline_share,
+    remaining,
+    request_deadline,
+    upstream_timeout,
+)
+
+
+@pytest.fixture()
+def clock():
+    with mock.patch("help_desk_api.deadlines.time.monotonic", return_value=1000.0) as clock:
+        yield clock
+
+
+@pytest.fixture()
+def upstream_timeout_settings(settings):
+    settings.UPSTREAM_TIMEOUT = 30
+    settings.REQUEST_DEADLINE = 25
+
+
+class TestDeadlines:
+    def test_no_deadline(self, upstream_timeout_settings):
+        assert remaining() is None
+        assert upstream_timeout() == 30
+        assert upstream_timeout(limit=5) == 5
+
+    def test_timeout_is_time_remaining(self, upstream_timeout_settings, clock):
+        with deadline(10):
+            clock.return_value += 4
+
+            assert upstream_timeout() == 6
+            assert upstream_timeout(limit=5) == 5
+
+        assert request_deadline.get() is None
+
+    def test_deadline_exceeded(self, upstream_timeout_settings, clock):
+        with deadline(10):
+            clock.return_value += 10
+
+            with pytest.raises(DeadlineExceeded):
+                upstream_timeout()
+
+    def test_inner_deadline_cannot_extend(self, upstream_timeout_settings, clock):
+        with deadline(10):
+            with deadline(60):
+                assert remaining() == 10
+
+    def test_share(self, upstream_timeout_settings, clock):
+        with deadline(10):
+            with deadline_share(0.5):
+                assert remaining() == 5
+            assert remaining() == 10
+
+    def test_share_without_deadline(self, upstream_timeout_settings):
+        with deadline_share(0.5):
+            assert remaining() is None
+
+
+@mock.patch("requests.get")
+def test_halo_client_passes_timeout(mock_get, upstream_timeout_settings, clock):
+    mock_get.return_value = MagicMock(status_code=HTTPStatus.OK, headers={})
+    with mock.patch.object(HaloAPIClient, "_HaloAPIClient__authenticate", return_value="abc123"):
+        client = HaloAPIClient("client_id", "client_secret")
+
+    with deadline(8):
+        client.get("Tickets/1")
+
+    assert mock_get.call_args.kwargs["timeout"] == 8
+
+
+@mock.patch("halo.halo_manager.HaloAPIClient._HaloAPIClient__authenticate", return_value="abc123")
+@mock.patch("zendesk_api_proxy.middleware.ZendeskAPIProxyMiddleware.make_halo_request")
+class TestMiddlewareDeadlines:
+    def test_deadline_set_for_endpoint(
+        self,
+        mock_make_halo_request: MagicMock,
+        _mock_authenticate,
+        halo_creds_only,
+        zendesk_authorization_header,
+        settings,
+        client,
+    ):
+        settings.REQUEST_DEADLINES = {"ticket": 7}
+        seen = []
+
+        def make_halo_request(*args, **kwargs):
+            seen.append(remaining())
+            return JsonResponse({"ticket": {"id": 1}})
+
+        mock_make_halo_request.side_effect = make_halo_request
+
+        client.get(
+            reverse("api:ticket", kwargs={"id": 1}),
+            headers={"Authorization": zendesk_authorization_header},
+        )
+
+        assert 0 < seen[0] <= 7
+        assert request_deadline.get() is None
+
+    def test_deadline_exceeded_response(
+        self,
+        mock_make_halo_request: MagicMock,
+        _mock_authenticate,
+        halo_creds_only,
+        zendesk_authorization_header,
+        client,
+    ):
+        mock_make_halo_request.side_effect = DeadlineExceeded("Deadline exceeded")
+
+        response = client.get(
+            reverse("api:ticket", kwargs={"id": 1}),
+            headers={"Authorization": zendesk_authorization_header},
+        )
+
+        assert response.status_code == HTTPStatus.GATEWAY_TIMEOUT
+        assert response.json()["error"] == "RequestTimeout"
@@ -0,0 +1,123 @@
+import threading
+
+import pytest
+
+from help_desk_api.hedging import MIN_LATENCY_SAMPLES, Hedged
+from help_desk_api.metrics import snapshot
+from help_desk_api.outbound_budget import (
+    INTERACTIVE,
+    outbound_priority,
+    request_priority,
+)
+
+test_hedged = Hedged("test", "TEST_HEDGE_REQUESTS", "TEST_HEDGE_DELAY", "TEST_HEDGE_BUDGET")
+
+
+@pytest.fixture()
+def hedged(settings):
+    settings.TEST_HEDGE_REQUESTS = True
+    settings.TEST_HEDGE_DELAY = 0.01
+    settings.TEST_HEDGE_BUDGET = 0.5
+    test_hedged._latencies.clear()
+    return test_hedged
+
+
+@pytest.fixture()
+def release():
+    """
+    Calls that wait for this are slow until the test finishes
+    """
+    event = threading.Event()
+    yield event
+    event.set()
+
+
+def slow_then_fast(release, slow_result="slow"):
+    calls = []
+
+    def fn():
+        calls.append(threading.current_thread().name)
+        if len(calls) == 1:
+            release.wait(5)
+            if isinstance(slow_result, Exception):
+                raise slow_result
+            return slow_result
+        return "fast"
+
+    return fn, calls
+
+
+class TestHedged:
+    def test_disabled(self, hedged, settings):
+        settings.TEST_HEDGE_REQUESTS = False
+        calls = []
+
+        assert hedged.do(lambda: calls.append(1) or "result") == "result"
+        assert calls == [1]
+
+    def test_fast_call_not_hedged(self, hedged):
+        calls = []
+
+        assert hedged.do(lambda: calls.append(1) or "result") == "result"
+        assert calls == [1]
+
+    def test_slow_call_hedged(self, hedged, release):
+        fn, calls = slow_then_fast(release)
+
+        assert hedged.do(fn) == "fast"
+        assert len(calls) == 2
+        metrics = snapshot()
+        assert metrics["hedging.test.hedges"] == 1
+        assert metrics["hedging.test.hedge_wins"] == 1
+        assert metrics["hedging.test.hedge_rate"] == 1
+
+    def test_failed_call_falls_back_to_hedge(self, hedged):
+        calls = []
+        failed = threading.Event()
+
+        def fn():
+            calls.append(1)
+            if len(calls) == 1:
+                failed.wait(5)
+                raise Exception("Halo is slow then fails")
+            failed.set()
+            return "hedge"
+
+        assert hedged.do(fn) == "hedge"
+
+    def test_hedges_limited_by_budget(self, hedged, release, settings):
+        settings.TEST_HEDGE_BUDGET = 0
+        first, first_calls = slow_then_fast(release)
+        hedged.do(first)
+        release.set()
+        second_release = threading.Event()
+        second, second_calls = slow_then_fast(second_release)
+        threading.Timer(0.1, second_release.set).start()
+
+        assert hedged.do(second) == "slow"
+        assert len(first_calls) == 2
+        assert len(second_calls) == 1
+        assert snapshot()["hedging.test.over_budget"] == 1
+
+    def test_calls_keep_context(self, hedged):
+        with outbound_priority(INTERACTIVE):
+            assert hedged.do(request_priority.get) == INTERACTIVE
+
+
+class TestHedgeDelay:
+    def test_configured(self, hedged):
+        assert hedged.delay() == 0.01
+
+    def test_none_without_enough_samples(self, hedged, settings):
+        settings.TEST_HEDGE_DELAY = 0
+        for _ in range(MIN_LATENCY_SAMPLES - 1):
+            hedged.observe(1)
+
+        assert hedged.delay() is None
+
+    def test_percentile(self, hedged, settings):
+        settings.TEST_HEDGE_DELAY = 0
+        for latency in range(1, MIN_LATENCY_SAMPLES + 1):
+            hedged.observe(latency / 10)
+
+        assert hedged.delay() == 1.9
@@ -0,0 +1,28 @@
+from unittest import mock
+
+from help_desk_api import metrics
+
+latency = metrics.Distribution("test_metrics.latency")
+
+
+class TestDistribution:
+    def test_observed_without_reading_the_cache(self, settings):
+        settings.METRICS_FLUSH_INTERVAL = 60
+        metrics.pending_counts.flush()
+        with mock.patch.object(metrics, "metrics_cache") as mock_metrics_cache:
+            latency.observe(0.5)
+
+        mock_metrics_cache.assert_not_called()
+
+    def test_max_kept_across_flushes(self):
+        latency.observe(0.5)
+        latency.observe(2)
+        latency.observe(1)
+        assert metrics.snapshot()["test_metrics.latency.max"] == 2
+
+        latency.observe(1.5)
+        report = metrics.snapshot()
+
+        assert report["test_metrics.latency.max"] == 2
+        assert report["test_metrics.latency.count"] == 4
+        assert report["test_metrics.latency.mean"] == 1.25
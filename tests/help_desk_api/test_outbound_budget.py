@@ -0,0 +1,127 @@
+from unittest import mock
+from unittest.mock import MagicMock
+
+import pytest
+from django.http import JsonResponse
+from django.urls import reverse
+
+from help_desk_api.outbound_budget import (
+    BACKGROUND,
+    INTERACTIVE,
+    WINDOW,
+    OutboundBudget,
+    outbound_priority,
+    request_priority,
+)
+
+test_budget = OutboundBudget("test", "TEST_REQUESTS_PER_MINUTE")
+
+
+@pytest.fixture()
+def budget(settings):
+    # 10 requests in each window; 5 of them for background requests
+    settings.TEST_REQUESTS_PER_MINUTE = 60
+    settings.OUTBOUND_BACKGROUND_SHARE = 0.5
+    settings.OUTBOUND_MAX_INTERACTIVE_WAIT = 2
+    return test_budget
+
+
+@pytest.fixture()
+def clock():
+    """
+    A clock that time.sleep moves on
+    """
+    now = [1_000_000.0]
+
+    def sleep(seconds):
+        now[0] += seconds
+
+    with mock.patch("help_desk_api.outbound_budget.time") as mock_time:
+        mock_time.time.side_effect = lambda: now[0]
+        mock_time.monotonic.side_effect = lambda: now[0]
+        mock_time.sleep.side_effect = sleep
+        yield mock_time
+
+
+def response(status_code=200, **headers):
+    return MagicMock(status_code=status_code, headers=headers)
+
+
+class TestOutboundBudget:
+    def test_background_requests_get_their_share(self, budget, clock):
+        for _ in range(5):
+            assert budget.time_to_wait(BACKGROUND) == 0
+        assert budget.time_to_wait(BACKGROUND) == WINDOW
+        for _ in range(5):
+            assert budget.time_to_wait(INTERACTIVE) == 0
+        assert budget.time_to_wait(INTERACTIVE) == WINDOW
+
+    def test_background_request_waits_for_next_window(self, budget, clock):
+        for _ in range(5):
+            budget.acquire()
+
+        budget.acquire()
+
+        clock.sleep.assert_called_once_with(WINDOW)
+
+    def test_interactive_request_waits_briefly(self, budget, clock):
+        with outbound_priority(INTERACTIVE):
+            for _ in range(10):
+                budget.acquire()
+            budget.acquire()
+
+        clock.sleep.assert_called_once_with(2)
+
+    def test_retry_after_pauses_requests(self, budget, clock):
+        budget.observe(response(429, **{"Retry-After": "30"}))
+
+        assert budget.time_to_wait(INTERACTIVE) == 30
+
+    def test_lower_advertised_limit_is_used(self, budget, clock):
+        budget.observe(response(**{"X-Rate-Limit": "6"}))
+
+        assert budget.requests_per_minute() == 6
+        assert budget.time_to_wait(INTERACTIVE) == 0
+        assert budget.time_to_wait(INTERACTIVE) == WINDOW
+
+    def test_low_remaining_holds_back_background_requests(self, budget, clock):
+        budget.observe(response(**{"X-Rate-Limit-Remaining": "20"}))
+
+        assert budget.time_to_wait(BACKGROUND) == WINDOW
+        assert budget.time_to_wait(INTERACTIVE) == 0
+
+    def test_no_limit(self, budget, clock, settings):
+        settings.TEST_REQUESTS_PER_MINUTE = 0
+
+        for _ in range(100):
+            assert budget.time_to_wait(BACKGROUND) == 0
+
+
+def test_priority_is_background_by_default():
+    assert request_priority.get() == BACKGROUND
+
+
+@mock.patch("halo.halo_manager.HaloAPIClient._HaloAPIClient__authenticate", return_value="abc123")
+@mock.patch("zendesk_api_proxy.middleware.ZendeskAPIProxyMiddleware.make_halo_request")
+def test_proxied_requests_are_interactive(
+    mock_make_halo_request: MagicMock,
+    _mock_authenticate,
+    halo_creds_only,
+    zendesk_authorization_header,
+    client,
+):
+    priorities = []
+
+    def make_halo_request(*args, **kwargs):
+        priorities.append(request_priority.get())
+        return JsonResponse({"ticket": {"id": 1}})
+
+    mock_make_halo_request.side_effect = make_halo_request
+
+    client.get(
+        reverse("api:ticket", kwargs={"id": 1}),
+        headers={"Authorization": zendesk_authorization_header},
+    )
+
+    assert priorities == [INTERACTIVE]
+    assert request_priority.get() == BACKGROUND
@@ -0,0 +1,168 @@
+from io import StringIO
+from unittest import mock
+from unittest.mock import MagicMock
+
+import pytest
+from django.core.management import call_command
+from django.test import Client
+from django.urls import reverse
+
+from help_desk_api.models import HaloTicket
+from help_desk_api.search import SearchQueryError, save_halo_tickets, search_tickets
+
+# As in the halo_creds_only fixture
+HALO_CLIENT_ID = "test_halo_client_id"
+
+
+def halo_ticket(halo_id, summary, email, status_id=1, tags=(), lastactiondate=None):
+    return {
+        "id": halo_id,
+        "summary": summary,
+        "status_id": status_id,
+        "user_name": email.split("@")[0].title(),
+        "user_email": email,
+        "tags": [{"text": tag} for tag in tags],
+        "customfields": [{"name": "CFZendeskTicketID", "value": str(halo_id + 1000)}],
+        "lastactiondate": lastactiondate or f"2024-01-0{halo_id}T10:00:00.1234567Z",
+    }
+
+
+@pytest.fixture()
+def halo_tickets(db):
+    save_halo_tickets(
+        HALO_CLIENT_ID,
+        [
+            halo_ticket(1, "Printer is on fire", "alice@example.com", tags=["hardware"]),
+            halo_ticket(2, "Dataset access request", "bob@example.com", status_id=2),
+            halo_ticket(3, "Printer out of paper", "bob@example.com", status_id=8),
+        ],
+    )
+
+
+def result_ids(tickets):
+    return [ticket.halo_id for ticket in tickets]
+
+
+class TestReadModel:
+    def test_halo_ticket_saved(self, halo_tickets):
+        ticket = HaloTicket.objects.get(halo_client_id=HALO_CLIENT_ID, halo_id=1)
+
+        assert ticket.zendesk_id == 1001
+        assert ticket.requester_email == "alice@example.com"  # /PS-IGNORE
+        assert ticket.status == "new"
+        assert ticket.tags == ["hardware"]
+
+    def test_halo_ticket_updated(self, halo_tickets):
+        save_halo_tickets(
+            HALO_CLIENT_ID, [halo_ticket(1, "Printer fixed", "alice@example.com", status_id=8)]
+        )
+
+        ticket = HaloTicket.objects.get(halo_client_id=HALO_CLIENT_ID, halo_id=1)
+        assert ticket.status == "solved"
+        assert result_ids(search_tickets(HALO_CLIENT_ID, "fixed")) == [1]
+
+
+class TestSearchTickets:
+    @pytest.mark.parametrize(
+        ["query", "expected_ids"],
+        [
+            ("printer", [3, 1]),
+            ('"on fire"', [1]),
+            ("type:ticket status:open", [2]),
+            ("status<solved", [2, 1]),
+            ("requester:bob@example.com", [3, 2]),  # /PS-IGNORE
+            ("tags:hardware", [1]),
+            ("printer -tags:hardware", [3]),
+            ("type:user", []),
+            ("customer's printer", []),
+            ('"printer', [3, 1]),
+        ],
+    )
+    def test_query(self, halo_tickets, query, expected_ids):
+        assert result_ids(search_tickets(HALO_CLIENT_ID, query)) == expected_ids
+
+    def test_invalid_query(self, db):
+        with pytest.raises(SearchQueryError):
+            search_tickets(HALO_CLIENT_ID, "status<unknown")
+
+    @pytest.mark.parametrize("query", ["", "  "])
+    def test_empty_query(self, halo_tickets, query):
+        with pytest.raises(SearchQueryError):
+            search_tickets(HALO_CLIENT_ID, query)
+
+    def test_other_clients_tickets_not_searched(self, halo_tickets):
+        save_halo_tickets(
+            "other_halo_client_id", [halo_ticket(4, "Printer jammed", "carol@example.com")]
+        )
+
+        assert result_ids(search_tickets(HALO_CLIENT_ID, "printer")) == [3, 1]
+        assert result_ids(search_tickets("other_halo_client_id", "printer")) == [4]
+        assert result_ids(search_tickets(None, "printer")) == []
+
+    def test_apostrophe_searched_as_text(self, halo_tickets):
+        save_halo_tickets(
+            HALO_CLIENT_ID, [halo_ticket(4, "Customer's complaint", "carol@example.com")]
+        )
+
+        assert result_ids(search_tickets(HALO_CLIENT_ID, "customer's complaint")) == [4]
+
+
+class TestSearchView:
+    @mock.patch("halo.halo_manager.HaloAPIClient.get")
+    def test_search_served_locally(
+        self,
+        mock_get: MagicMock,
+        halo_tickets,
+        halo_creds_only,
+        zendesk_authorization_header,
+        client: Client,
+    ):
+        response = client.get(
+            reverse("api:search"),
+            data={"query": "type:ticket printer"},
+            headers={"Authorization": zendesk_authorization_header},
+        )
+
+        response_json = response.json()
+        assert response_json["count"] == 2
+        assert [result["id"] for result in response_json["results"]] == [3, 1]
+        assert response_json["results"][0]["result_type"] == "ticket"
+        mock_get.assert_not_called()
+
+    def test_search_needs_a_query(
+        self, halo_tickets, halo_creds_only, zendesk_authorization_header, client: Client
+    ):
+        response = client.get(
+            reverse("api:search"), headers={"Authorization": zendesk_authorization_header}
+        )
+
+        assert response.status_code == 400
+
+
+@mock.patch("halo.halo_manager.HaloAPIClient._HaloAPIClient__authenticate", return_value="abc123")
+@mock.patch("halo.halo_manager.HaloAPIClient.get")
+class TestSyncHaloTickets:
+    def test_sync_is_incremental(
+        self, mock_get: MagicMock, _mock_authenticate, halo_tickets, halo_creds_only, zendesk_email
+    ):
+        mock_get.return_value = {
+            "tickets": [halo_ticket(4, "Laptop request", "carol@example.com")]  # /PS-IGNORE
+        }
+
+        call_command("sync_halo_tickets", "-c", zendesk_email, stdout=StringIO())
+
+        assert mock_get.call_args.kwargs["params"]["startdate"].startswith("2024-01-03T10:00:00")
+        assert result_ids(search_tickets(HALO_CLIENT_ID, "laptop")) == [4]
+
+    def test_sync_checkpoint_is_per_client(
+        self, mock_get: MagicMock, _mock_authenticate, halo_tickets, halo_creds_only, zendesk_email
+    ):
+        save_halo_tickets(
+            "other_halo_client_id",
+            [halo_ticket(4, "Laptop request", "carol@example.com", lastactiondate="2024-02-01")],
+        )
+        mock_get.return_value = {"tickets": []}
+
+        call_command("sync_halo_tickets", "-c", zendesk_email, stdout=StringIO())
+
+        assert mock_get.call_args.kwargs["params"]["startdate"].startswith("2024-01-03T10:00:00")
@@ -0,0 +1,146 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import pytest
+from django.conf import settings
+from django.core.cache import caches
+from halo.halo_api_client import HaloAPIClient, halo_reads
+
+from help_desk_api import metrics
+from help_desk_api.deadlines import DeadlineExceeded, deadline
+from help_desk_api.single_flight import SingleFlight
+
+FOLLOWERS = 3
+
+
+@pytest.fixture()
+def single_flight():
+    return test_single_flight
+
+
+test_single_flight = SingleFlight("test")
+
+
+def wait_for_followers(single_flight, key, count):
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        with single_flight._lock:
+            call = single_flight._calls.get(key, None)
+            if call is not None and call.waiting >= count:
+                return
+        time.sleep(0.01)
+    raise AssertionError("Followers didn't arrive")
+
+
+def run_concurrently(single_flight, key, fn):
+    """
+    Start a leader, then FOLLOWERS more callers while the leader's call is in flight
+    """
+    release = threading.Event()
+
+    def blocking_fn():
+        release.wait(5)
+        return fn()
+
+    with ThreadPoolExecutor(max_workers=FOLLOWERS + 1) as executor:
+        futures = [executor.submit(single_flight.do, key, blocking_fn)]
+        futures += [executor.submit(single_flight.do, key, blocking_fn) for _ in range(FOLLOWERS)]
+        wait_for_followers(single_flight, key, FOLLOWERS)
+        release.set()
+        return [future.exception() or future.result() for future in futures]
+
+
+class TestSingleFlight:
+    def test_concurrent_calls_share_one_result(self, single_flight):
+        fn = mock.MagicMock(return_value={"id": 1, "tags": []})
+
+        results = run_concurrently(single_flight, ("creds", "GET", "Tickets/1", ()), fn)
+
+        fn.assert_called_once()
+        assert results == [{"id": 1, "tags": []}] * (FOLLOWERS + 1)
+        # Everyone gets their own copy
+        assert len({id(result) for result in results}) == FOLLOWERS + 1
+        assert metrics.snapshot()["single_flight.test.saved"] == FOLLOWERS
+
+    def test_concurrent_calls_share_exception(self, single_flight):
+        fn = mock.MagicMock(side_effect=ConnectionError("Halo is down"))
+
+        results = run_concurrently(single_flight, ("creds", "GET", "Tickets/2", ()), fn)
+
+        fn.assert_called_once()
+        assert all(isinstance(result, ConnectionError) for result in results)
+
+    def test_waiting_caller_gives_up_at_its_deadline(self, single_flight):
+        release = threading.Event()
+
+        def follow():
+            wait_for_followers(single_flight, "slow", 0)
+            with deadline(0.05):
+                return single_flight.do("slow", mock.MagicMock())
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            leader = executor.submit(single_flight.do, "slow", lambda: release.wait(5))
+            follower = executor.submit(follow)
+            with pytest.raises(DeadlineExceeded):
+                follower.result(timeout=5)
+            release.set()
+            assert leader.result() is True
+
+    def test_sequential_calls_are_not_shared(self, single_flight):
+        fn = mock.MagicMock(side_effect=[{"id": 1}, {"id": 2}])
+
+        assert single_flight.do("key", fn) == {"id": 1}
+        assert single_flight.do("key", fn) == {"id": 2}
+
+
+class TestSharedSingleFlight:
+    @pytest.fixture(autouse=True)
+    def shared_single_flight(self, settings):
+        settings.SINGLE_FLIGHT_SHARED = True
+
+    def test_waits_for_call_in_another_process(self, single_flight):
+        cache = caches[settings.COORDINATION_CACHE]
+        lock_key = single_flight.shared_lock_key("other-process")
+        cache.set(lock_key, "flight-1")
+        cache.set(f"{lock_key}:flight-1", {"id": 1})
+        fn = mock.MagicMock()
+
+        assert single_flight.do("other-process", fn) == {"id": 1}
+        fn.assert_not_called()
+
+    def test_makes_call_if_other_process_failed(self, single_flight):
+        cache = caches[settings.COORDINATION_CACHE]
+        lock_key = single_flight.shared_lock_key("failed-process")
+        cache.set(lock_key, "flight-1")
+        fn = mock.MagicMock(return_value={"id": 2})
+
+        def leader_fails(_interval):
+            cache.delete(lock_key)
+
+        with mock.patch("help_desk_api.single_flight.time.sleep", side_effect=leader_fails):
+            assert single_flight.do("failed-process", fn) == {"id": 2}
+        fn.assert_called_once()
+        assert cache.get(lock_key, None) is None
+
+
+@mock.patch("halo.halo_manager.HaloAPIClient._HaloAPIClient__authenticate", return_value="abc123")
+def test_halo_client_coalesces_gets(_mock_authenticate):
+    client = HaloAPIClient(client_id="client-id", client_secret="secret")
+    key = ("client-id", "GET", "Tickets/1", (("includedetails", "True"),))
+    release = threading.Event()
+
+    def halo_get(*args, **kwargs):
+        release.wait(5)
+        return mock.MagicMock(status_code=200, json=mock.MagicMock(return_value={"id": 1}))
+
+    with mock.patch("halo.halo_api_client.requests.get", side_effect=halo_get) as mock_get:
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            first = executor.submit(client.get, "Tickets/1", {"includedetails": True})
+            second = executor.submit(client.get, "Tickets/1", {"includedetails": True})
+            wait_for_followers(halo_reads, key, 1)
+            release.set()
+
+    assert first.result() == second.result() == {"id": 1}
+    mock_get.assert_called_once()
@@ -0,0 +1,262 @@
+from unittest import mock
+from unittest.mock import MagicMock
+
+import pytest
+from django.test import Client
+from django.urls import reverse
+from halo.halo_manager import HaloManager
+
+from help_desk_api import metrics, ticket_cache
+
+CLIENT_ID = "fake-client-id"
+
+
+class SynchronousExecutor:
+    def submit(self, fn, *args, **kwargs):
+        fn(*args, **kwargs)
+
+
+@pytest.fixture()
+def ticket_cache_settings(settings):
+    settings.TICKET_CACHE_TIMEOUT = 60
+    settings.TICKET_CACHE_MAX_STALENESS = 300
+
+
+@pytest.fixture()
+def synchronous_refresh():
+    with mock.patch("help_desk_api.ticket_cache.refresh_executor", SynchronousExecutor()):
+        yield
+
+
+@pytest.fixture()
+def clock():
+    with mock.patch("help_desk_api.ticket_cache.time.time", return_value=1_000_000.0) as clock:
+        yield clock
+
+
+@pytest.mark.usefixtures("ticket_cache_settings", "synchronous_refresh")
+class TestTicketCache:
+    def test_miss_fetches_then_hit_is_served_from_cache(self, clock):
+        fetch = MagicMock(return_value={"id": 123, "summary": "First"})
+
+        assert ticket_cache.get_ticket(CLIENT_ID, 123, fetch) == {"id": 123, "summary": "First"}
+        clock.return_value += 59
+        assert ticket_cache.get_ticket(CLIENT_ID, 123, fetch) == {"id": 123, "summary": "First"}
+
+        fetch.assert_called_once_with(123)
+        report = metrics.snapshot()
+        assert report["ticket_cache.hits"] == 1
+        assert report["ticket_cache.misses"] == 1
+        assert report["ticket_cache.hit_ratio"] == 0.5
+
+    def test_stale_entry_is_served_and_refreshed(self, clock):
+        fetch = MagicMock(side_effect=[{"summary": "First"}, {"summary": "Second"}])
+        ticket_cache.get_ticket(CLIENT_ID, 123, fetch)
+
+        clock.return_value += 90
+        assert ticket_cache.get_ticket(CLIENT_ID, 123, fetch) == {"summary": "First"}
+        assert ticket_cache.get_ticket(CLIENT_ID, 123, fetch) == {"summary": "Second"}
+
+        assert fetch.call_count == 2
+        report = metrics.snapshot()
+        assert report["ticket_cache.stale_hits"] == 1
+        assert report["ticket_cache.staleness.count"] == 1
+        assert report["ticket_cache.staleness.max"] == 30
+
+    def test_stale_entry_is_served_when_halo_fails(self, clock):
+        fetch = MagicMock(side_effect=[{"summary": "First"}, ConnectionError("Halo is down")])
+        ticket_cache.get_ticket(CLIENT_ID, 123, fetch)
+
+        clock.return_value += 90
+        assert ticket_cache.get_ticket(CLIENT_ID, 123, fetch) == {"summary": "First"}
+
+        assert metrics.snapshot()["ticket_cache.refresh_failures"] == 1
+
+    def test_entry_older_than_max_staleness_is_not_served(self, clock):
+        fetch = MagicMock(side_effect=[{"summary": "First"}, {"summary": "Second"}])
+        ticket_cache.get_ticket(CLIENT_ID, 123, fetch)
+
+        clock.return_value += 60 + 300
+        assert ticket_cache.get_ticket(CLIENT_ID, 123, fetch) == {"summary": "Second"}
+
+    def test_one_refresh_at_a_time(self, clock):
+        fetch = MagicMock(return_value={"summary": "First"})
+        ticket_cache.get_ticket(CLIENT_ID, 123, fetch)
+        clock.return_value += 90
+
+        with mock.patch("help_desk_api.ticket_cache.refresh_executor") as mock_executor:
+            ticket_cache.get_ticket(CLIENT_ID, 123, fetch)
+            ticket_cache.get_ticket(CLIENT_ID, 123, fetch)
+
+        mock_executor.submit.assert_called_once()
+
+    def test_refresh_is_discarded_if_ticket_invalidated_meanwhile(self, clock):
+        def fetch_during_update(ticket_id):
+            ticket_cache.invalidate_tickets([ticket_id])
+            return {"summary": "Out of date"}
+
+        ticket_cache.get_ticket(CLIENT_ID, 123, MagicMock(return_value={"summary": "First"}))
+        clock.return_value += 90
+        ticket_cache.get_ticket(CLIENT_ID, 123, fetch_during_update)
+
+        fetch = MagicMock(return_value={"summary": "Updated"})
+        assert ticket_cache.get_ticket(CLIENT_ID, 123, fetch) == {"summary": "Updated"}
+
+    def test_invalidated_ticket_is_fetched_again(self, clock):
+        fetch = MagicMock(side_effect=[{"summary": "First"}, {"summary": "Second"}])
+        ticket_cache.get_ticket(CLIENT_ID, 123, fetch)
+
+        ticket_cache.invalidate_tickets([123, None])
+
+        assert ticket_cache.get_ticket(CLIENT_ID, 123, fetch) == {"summary": "Second"}
+        assert metrics.snapshot()["ticket_cache.invalidations"] == 1
+
+    def test_tickets_are_cached_per_client(self, clock):
+        ticket_cache.get_ticket(CLIENT_ID, 123, MagicMock(return_value={"summary": "Mine"}))
+        fetch = MagicMock(return_value={"summary": "Theirs"})
+
+        assert ticket_cache.get_ticket("other-client-id", 123, fetch) == {"summary": "Theirs"}
+        assert ticket_cache.get_ticket(CLIENT_ID, 123, fetch) == {"summary": "Mine"}
+        fetch.assert_called_once_with(123)
+
+    def test_invalidation_applies_to_every_client(self, clock):
+        for client_id in (CLIENT_ID, "other-client-id"):
+            ticket_cache.get_ticket(client_id, 123, MagicMock(return_value={"summary": "First"}))
+        clock.return_value += 1
+
+        ticket_cache.invalidate_tickets([123])
+        clock.return_value += 1
+
+        for client_id in (CLIENT_ID, "other-client-id"):
+            fetch = MagicMock(return_value={"summary": "Second"})
+            assert ticket_cache.get_ticket(client_id, 123, fetch) == {"summary": "Second"}
+
+
+@mock.patch("halo.halo_manager.HaloAPIClient._HaloAPIClient__authenticate", return_value="abc123")
+class TestHaloManagerTicketCache:
+    @mock.patch("halo.halo_manager.HaloAPIClient.get")
+    def test_get_ticket_reads_halo_once(self, mock_get: MagicMock, _mock_authenticate):
+        mock_get.side_effect = lambda path: (
+            {"attachments": []} if path.startswith("Attachment") else {"id": 123}
+        )
+        halo_manager = HaloManager(client_id="fake-client-id", client_secret="fake-client-secret")
+
+        halo_manager.get_ticket(123)
+        ticket = halo_manager.get_ticket(123)
+
+        assert ticket == {"id": 123, "attachments": []}
+        assert mock_get.call_count == 2
+
+    @mock.patch("halo.halo_manager.HaloAPIClient.post")
+    @mock.patch("help_desk_api.ticket_cache.invalidate_tickets")
+    def test_add_comment_invalidates_ticket(
+        self, mock_invalidate: MagicMock, mock_post: MagicMock, _mock_authenticate
+    ):
+        mock_post.return_value = {"id": 1, "ticket_id": 123}
+        halo_manager = HaloManager(client_id="fake-client-id", client_secret="fake-client-secret")
+
+        halo_manager.add_comment({"ticket": {"id": 123, "comment": {"body": "Hello"}}})
+
+        mock_invalidate.assert_called_once_with([123])
+
+    @mock.patch("halo.halo_manager.HaloAPIClient.post")
+    @mock.patch("help_desk_api.ticket_cache.invalidate_tickets")
+    def test_update_ticket_invalidates_ticket(
+        self, mock_invalidate: MagicMock, mock_post: MagicMock, _mock_authenticate
+    ):
+        mock_post.return_value = {"id": 123}
+        halo_manager = HaloManager(client_id="fake-client-id", client_secret="fake-client-secret")
+
+        halo_manager.update_ticket({"ticket_id": 123, "ticket": {"priority": "high"}})
+
+        mock_invalidate.assert_called_once_with([123])
+
+
+@pytest.fixture()
+def webhook_secret(settings):
+    settings.HALO_WEBHOOK_SECRET = "s3cret"  # /PS-IGNORE
+    return settings.HALO_WEBHOOK_SECRET
+
+
+class TestHaloWebhookView:
+    @mock.patch("help_desk_api.views.invalidate_tickets")
+    def test_webhook_invalidates_tickets(
+        self, mock_invalidate: MagicMock, client: Client, webhook_secret
+    ):
+        response = client.post(
+            reverse("api:halo_webhook"),
+            data=[{"id": 123}, {"ticket": {"id": "456"}}, {"ticket_id": 789}],
+            content_type="application/json",
+            headers={"X-Halo-Webhook-Secret": webhook_secret},
+        )
+
+        assert response.status_code == 200
+        mock_invalidate.assert_called_once_with([123, 456, 789])
+
+    @pytest.mark.parametrize("secret", [None, "wrong"])
+    @mock.patch("help_desk_api.views.invalidate_tickets")
+    def test_webhook_needs_secret(
+        self, mock_invalidate: MagicMock, client: Client, webhook_secret, secret
+    ):
+        headers = {"X-Halo-Webhook-Secret": secret} if secret else {}
+        response = client.post(
+            reverse("api:halo_webhook"),
+            data={"id": 123},
+            content_type="application/json",
+            headers=headers,
+        )
+
+        assert response.status_code == 403
+        mock_invalidate.assert_not_called()
+
+    def test_webhook_refused_if_not_configured(self, client: Client, settings):
+        settings.HALO_WEBHOOK_SECRET = None
+
+        response = client.post(
+            reverse("api:halo_webhook"),
+            data={"id": 123},
+            content_type="application/json",
+            headers={"X-Halo-Webhook-Secret": ""},
+        )
+
+        assert response.status_code == 403
+
+    def test_webhook_without_ticket_id(self, client: Client, webhook_secret):
+        response = client.post(
+            reverse("api:halo_webhook"),
+            data={"summary": "No ID here"},
+            content_type="application/json",
+            headers={"X-Halo-Webhook-Secret": webhook_secret},
+        )
+
+        assert response.status_code == 400
+
+
+def test_metrics_view(client: Client):
+    ticket_cache.hits.increment()
+
+    response = client.get(reverse("metrics"))
+
+    assert response.status_code == 200
+    assert response.json()["ticket_cache.hits"] == 1
+    assert response.json()["ticket_cache.hit_ratio"] == 1
+
+
+def test_counts_added_to_cache_once_per_interval(settings):
+    settings.METRICS_FLUSH_INTERVAL = 60
+    with mock.patch.object(metrics, "add_to_counter", wraps=metrics.add_to_counter) as mock_add:
+        for _ in range(3):
+            ticket_cache.hits.increment()
+
+        mock_add.assert_not_called()
+        assert metrics.snapshot()["ticket_cache.hits"] == 3
+        mock_add.assert_called_once_with(metrics.metric_cache_key("ticket_cache.hits"), 3)
+
+
+def test_counts_added_to_cache_once_interval_has_passed(settings):
+    settings.METRICS_FLUSH_INTERVAL = 0
+
+    ticket_cache.hits.increment()
+    ticket_cache.hits.increment()
+
+    assert metrics.metrics_cache().get(metrics.metric_cache_key("ticket_cache.hits")) == 2
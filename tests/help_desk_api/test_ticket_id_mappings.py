@@ -0,0 +1,187 @@
+from io import StringIO
+from unittest import mock
+from unittest.mock import MagicMock
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management import call_command
+from halo.halo_manager import HaloManager, parse_halo_datetime
+
+from help_desk_api.management.commands.rebuild_zendesk_ticket_id_mappings import (
+    CHECKPOINT_CACHE_KEY,
+)
+from help_desk_api.serializers import (
+    ZendeskToHaloCreateTicketSerializer,
+    zendesk_ticket_id_from_halo_ticket,
+)
+
+
+def halo_ticket(halo_id, zendesk_id=None, lastactiondate="2024-01-01T10:00:00.1234567Z"):
+    ticket = {"id": halo_id, "lastactiondate": lastactiondate, "customfields": []}
+    if zendesk_id is not None:
+        ticket["customfields"].append(
+            {"name": settings.HALO_ZENDESK_TICKET_ID_FIELD, "value": str(zendesk_id)}
+        )
+    return ticket
+
+
+class TestZendeskTicketIdInHalo:
+    def test_zendesk_ticket_id_written_to_halo_ticket(self):
+        serializer = ZendeskToHaloCreateTicketSerializer()
+
+        representation = serializer.to_representation(
+            {
+                "subject": "Test",
+                "comment": {"body": "Test"},
+                "requester": {"name": "Some Body", "email": "somebody@example.com"},  # /PS-IGNORE
+                "zendesk_ticket_id": 35062,
+            }
+        )
+
+        assert {
+            "name": settings.HALO_ZENDESK_TICKET_ID_FIELD,
+            "value": "35062",
+        } in representation["customfields"]
+
+    def test_no_zendesk_ticket_id_field_when_not_dual_running(self):
+        serializer = ZendeskToHaloCreateTicketSerializer()
+
+        representation = serializer.to_representation(
+            {
+                "subject": "Test",
+                "comment": {"body": "Test"},
+                "requester": {"name": "Some Body", "email": "somebody@example.com"},  # /PS-IGNORE
+            }
+        )
+
+        assert "customfields" not in representation
+
+    def test_zendesk_ticket_id_read_from_halo_ticket(self):
+        assert zendesk_ticket_id_from_halo_ticket(halo_ticket(1, zendesk_id=35062)) == 35062
+        assert zendesk_ticket_id_from_halo_ticket(halo_ticket(1)) is None
+
+
+@mock.patch("halo.halo_manager.HaloAPIClient._HaloAPIClient__authenticate", return_value="abc123")
+class TestIterTickets:
+    @mock.patch("halo.halo_manager.HaloAPIClient.get")
+    def test_pages_until_short_page(self, mock_get: MagicMock, _mock_authenticate):
+        mock_get.side_effect = [
+            {"tickets": [halo_ticket(1), halo_ticket(2)]},
+            {"tickets": [halo_ticket(3)]},
+        ]
+        halo_manager = HaloManager(client_id="id", client_secret="secret")
+
+        tickets = list(halo_manager.iter_tickets(page_size=2))
+
+        assert [ticket["id"] for ticket in tickets] == [1, 2, 3]
+        assert mock_get.call_count == 2
+
+    @mock.patch("halo.halo_manager.HaloAPIClient.get")
+    def test_ticket_changed_while_paging_skips_none(self, mock_get: MagicMock, _mock_authenticate):
+        tickets = [
+            halo_ticket(halo_id, lastactiondate=f"2024-01-0{halo_id}T10:00:00Z")
+            for halo_id in range(1, 5)
+        ]
+
+        def get(path, params):
+            since = parse_halo_datetime(params.get("startdate", "2000-01-01T00:00:00Z"))
+            matching = sorted(
+                (
+                    ticket
+                    for ticket in tickets
+                    if parse_halo_datetime(ticket["lastactiondate"]) >= since
+                ),
+                key=lambda ticket: ticket["lastactiondate"],
+            )
+            start = (params["page_no"] - 1) * params["page_size"]
+            return {"tickets": [dict(ticket) for ticket in matching[start : start + 2]]}
+
+        mock_get.side_effect = get
+        halo_manager = HaloManager(client_id="id", client_secret="secret")
+
+        read = []
+        for ticket in halo_manager.iter_tickets(page_size=2):
+            read.append(ticket["id"])
+            if ticket["id"] == 1:
+                # Moves ticket 1 after the others, which would move ticket 3 to page 1
+                tickets[0]["lastactiondate"] = "2024-01-09T10:00:00Z"
+
+        assert read == [1, 2, 3, 4, 1]
+
+    @mock.patch("halo.halo_manager.HaloAPIClient.get")
+    def test_page_of_ties_pages_on(self, mock_get: MagicMock, _mock_authenticate):
+        pages = [[halo_ticket(1), halo_ticket(2)], [halo_ticket(3)]]
+        page_nos = []
+
+        def get(path, params):
+            page_nos.append(params["page_no"])
+            return {"tickets": pages[params["page_no"] - 1]}
+
+        mock_get.side_effect = get
+        halo_manager = HaloManager(client_id="id", client_secret="secret")
+
+        tickets = list(halo_manager.iter_tickets(page_size=2))
+
+        assert [ticket["id"] for ticket in tickets] == [1, 2, 3]
+        # Page 1 again from their last action, then on to page 2 as it's all ties
+        assert page_nos == [1, 1, 2]
+
+    @mock.patch("halo.halo_manager.HaloAPIClient.get")
+    def test_changed_since_searches_by_last_action(self, mock_get: MagicMock, _mock_authenticate):
+        mock_get.return_value = {"tickets": []}
+        halo_manager = HaloManager(client_id="id", client_secret="secret")
+        changed_since = parse_halo_datetime("2024-01-01T10:00:00Z")
+
+        list(halo_manager.iter_tickets(changed_since=changed_since))
+
+        params = mock_get.call_args.kwargs["params"]
+        assert params["datesearch"] == "lastactiondate"
+        assert params["startdate"] == changed_since.isoformat()
+
+
+@mock.patch("halo.halo_manager.HaloAPIClient._HaloAPIClient__authenticate", return_value="abc123")
+@mock.patch("halo.halo_manager.HaloAPIClient.get")
+class TestRebuildZendeskTicketIdMappings:
+    def test_mappings_loaded_from_halo(
+        self, mock_get: MagicMock, _mock_authenticate, halo_creds_only, zendesk_email
+    ):
+        mock_get.side_effect = [
+            {
+                "tickets": [
+                    halo_ticket(1, zendesk_id=101),
+                    halo_ticket(2),
+                    halo_ticket(3, zendesk_id=103, lastactiondate="2024-02-01T10:00:00Z"),
+                ]
+            },
+        ]
+
+        call_command("rebuild_zendesk_ticket_id_mappings", "-c", zendesk_email, stdout=StringIO())
+
+        ticket_cache = caches[settings.TICKET_DATA_CACHE]
+        assert ticket_cache.get_many([101, 103]) == {101: 1, 103: 3}
+        assert (
+            caches[settings.TICKET_DATA_CACHE].get(CHECKPOINT_CACHE_KEY)
+            == "2024-02-01T10:00:00+00:00"
+        )
+
+    def test_rerun_is_incremental(
+        self, mock_get: MagicMock, _mock_authenticate, halo_creds_only, zendesk_email
+    ):
+        caches[settings.TICKET_DATA_CACHE].set(CHECKPOINT_CACHE_KEY, "2024-02-01T10:00:00+00:00")
+        mock_get.return_value = {"tickets": []}
+
+        call_command("rebuild_zendesk_ticket_id_mappings", "-c", zendesk_email, stdout=StringIO())
+
+        assert mock_get.call_args.kwargs["params"]["startdate"] == "2024-02-01T10:00:00+00:00"
+
+    def test_full_rebuild_ignores_checkpoint(
+        self, mock_get: MagicMock, _mock_authenticate, halo_creds_only, zendesk_email
+    ):
+        caches[settings.TICKET_DATA_CACHE].set(CHECKPOINT_CACHE_KEY, "2024-02-01T10:00:00+00:00")
+        mock_get.return_value = {"tickets": []}
+
+        call_command(
+            "rebuild_zendesk_ticket_id_mappings", "-c", zendesk_email, "--full", stdout=StringIO()
+        )
+
+        assert "startdate" not in mock_get.call_args.kwargs["params"]
@@ -2,6 +2,8 @@ from copy import deepcopy
 from unittest import mock
 from unittest.mock import MagicMock
 
+from django.conf import settings
+from django.core.cache import caches
 from halo.halo_manager import HaloManager
 
 from help_desk_api import serializers
@@ -22,7 +24,10 @@ class TestDFAPIHaloManagerCreateTicket:
         serializer = serializers.ZendeskToHaloCreateTicketSerializer()
         with mock.patch("help_desk_api.serializers.caches") as mock_caches:
             mock_cache = MagicMock()
-            mock_caches.__getitem__.return_value = mock_cache
+            # Only the user data cache is mocked; custom field mappings come from the DB
+            mock_caches.__getitem__.side_effect = lambda alias: (
+                mock_cache if alias == settings.USER_DATA_CACHE else caches[alias]
+            )
             mock_cache.get.return_value = {
                 "user": {"name": "Some Body", "email": "somebody@example.com"}  # /PS-IGNORE
             }
@@ -1,13 +1,21 @@
+import time
 from http import HTTPStatus
 from unittest import mock
 from unittest.mock import MagicMock
 
+import pytest
 from django.http import HttpResponse
 from django.urls import reverse
 
+from help_desk_api.circuit_breaker import CircuitOpenException, halo_breaker
 from help_desk_api.serializers import ZendeskFieldsNotSupportedException
 
 
+@pytest.fixture()
+def open_halo_breaker():
+    halo_breaker.cache.set(halo_breaker.cache_key("opened_at"), time.time())
+
+
 @mock.patch("halo.halo_manager.HaloAPIClient._HaloAPIClient__authenticate", return_value="abc123")
 @mock.patch("zendesk_api_proxy.middleware.ZendeskAPIProxyMiddleware.make_zendesk_request")
 @mock.patch("zendesk_api_proxy.middleware.ZendeskAPIProxyMiddleware.make_halo_request")
@@ -115,3 +123,52 @@ class TestDualRunningExceptionHandling:
         )
 
         assert response.status_code == HTTPStatus.BAD_REQUEST
+
+
+@mock.patch("halo.halo_manager.HaloAPIClient._HaloAPIClient__authenticate", return_value="abc123")
+@mock.patch("zendesk_api_proxy.middleware.ZendeskAPIProxyMiddleware.make_zendesk_request")
+@mock.patch("zendesk_api_proxy.middleware.ZendeskAPIProxyMiddleware.make_halo_request")
+class TestMiddlewareBreakers:
+    def test_dual_running_skips_halo_when_open(
+        self,
+        mock_make_halo_request: MagicMock,
+        mock_make_zendesk_request: MagicMock,
+        _mock_authenticate,
+        open_halo_breaker,
+        zendesk_create_ticket_request,
+        zendesk_create_ticket_response,
+        zendesk_authorization_header,
+        zendesk_and_halo_creds,
+        client,
+    ):
+        mock_make_zendesk_request.return_value = zendesk_create_ticket_response
+
+        response = client.post(
+            reverse("api:tickets"),
+            data=zendesk_create_ticket_request,
+            headers={"Authorization": zendesk_authorization_header},
+            content_type="application/json",
+        )
+
+        assert response.status_code == HTTPStatus.CREATED
+        mock_make_halo_request.assert_not_called()
+
+    def test_halo_only_unavailable_when_open(
+        self,
+        mock_make_halo_request: MagicMock,
+        _mock_make_zendesk_request: MagicMock,
+        _mock_authenticate,
+        zendesk_authorization_header,
+        halo_creds_only,
+        client,
+    ):
+        mock_make_halo_request.side_effect = CircuitOpenException("halo is unavailable")
+
+        response = client.get(
+            reverse("api:ticket", kwargs={"id": 1}),
+            headers={"Authorization": zendesk_authorization_header},
+        )
+
+        assert response.status_code == HTTPStatus.SERVICE_UNAVAILABLE
+        assert response.json()["error"] == "ServiceUnavailable"
+        assert response.headers["Retry-After"]
@@ -0,0 +1,194 @@
+from http import HTTPStatus
+from unittest import mock
+from unittest.mock import MagicMock
+
+import pytest
+from django.conf import settings
+from django.core.cache import caches
+from django.http import JsonResponse
+from django.urls import reverse
+from redis.exceptions import ConnectionError as RedisConnectionError
+from zendesk_api_proxy.idempotency import (
+    COMPLETE,
+    IN_PROGRESS,
+    idempotency_cache_key,
+    request_fingerprint,
+)
+
+from help_desk_api.cache import TwoTierCache
+
+
+@pytest.fixture()
+def post_ticket(client, zendesk_authorization_header):
+    def post(data, idempotency_key="abc-123"):
+        headers = {"Authorization": zendesk_authorization_header}
+        if idempotency_key:
+            headers["Idempotency-Key"] = idempotency_key
+        return client.post(
+            reverse("api:tickets"), data=data, headers=headers, content_type="application/json"
+        )
+
+    return post
+
+
+def seed_record(help_desk_creds, rf, data, **record):
+    request = rf.post(reverse("api:tickets"), data=data, content_type="application/json")
+    caches[settings.COORDINATION_CACHE].set(
+        idempotency_cache_key(help_desk_creds, "abc-123"),
+        dict(record, fingerprint=request_fingerprint(request)),
+    )
+
+
+@mock.patch("halo.halo_manager.HaloAPIClient._HaloAPIClient__authenticate", return_value="abc123")
+@mock.patch("zendesk_api_proxy.middleware.ZendeskAPIProxyMiddleware.make_halo_request")
+class TestIdempotencyKey:
+    def test_retry_replays_stored_response(
+        self, mock_make_halo_request: MagicMock, _mock_authenticate, halo_creds_only, post_ticket
+    ):
+        mock_make_halo_request.return_value = JsonResponse(
+            {"ticket": {"id": 1}}, status=HTTPStatus.CREATED
+        )
+
+        first = post_ticket({"ticket": {"subject": "Help"}})
+        retry = post_ticket({"ticket": {"subject": "Help"}})
+
+        mock_make_halo_request.assert_called_once()
+        assert retry.status_code == HTTPStatus.CREATED
+        assert retry.content == first.content
+        assert retry.headers["Idempotent-Replayed"] == "true"
+
+    def test_requests_without_key_are_not_stored(
+        self, mock_make_halo_request: MagicMock, _mock_authenticate, halo_creds_only, post_ticket
+    ):
+        mock_make_halo_request.return_value = JsonResponse({"ticket": {"id": 1}}, status=201)
+
+        post_ticket({"ticket": {"subject": "Help"}}, idempotency_key=None)
+        post_ticket({"ticket": {"subject": "Help"}}, idempotency_key=None)
+
+        assert mock_make_halo_request.call_count == 2
+
+    def test_key_reused_for_different_request(
+        self, mock_make_halo_request: MagicMock, _mock_authenticate, halo_creds_only, post_ticket
+    ):
+        mock_make_halo_request.return_value = JsonResponse({"ticket": {"id": 1}}, status=201)
+
+        post_ticket({"ticket": {"subject": "Help"}})
+        response = post_ticket({"ticket": {"subject": "Something else"}})
+
+        mock_make_halo_request.assert_called_once()
+        assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+
+    def test_server_error_is_not_stored(
+        self, mock_make_halo_request: MagicMock, _mock_authenticate, halo_creds_only, post_ticket
+    ):
+        mock_make_halo_request.side_effect = [
+            JsonResponse({"error": "Halo is down"}, status=500),
+            JsonResponse({"ticket": {"id": 1}}, status=201),
+        ]
+
+        post_ticket({"ticket": {"subject": "Help"}})
+        retry = post_ticket({"ticket": {"subject": "Help"}})
+
+        assert mock_make_halo_request.call_count == 2
+        assert retry.status_code == HTTPStatus.CREATED
+
+    def test_duplicate_waits_for_original(
+        self,
+        mock_make_halo_request: MagicMock,
+        _mock_authenticate,
+        halo_creds_only,
+        post_ticket,
+        rf,
+    ):
+        data = {"ticket": {"subject": "Help"}}
+        seed_record(halo_creds_only, rf, data, state=IN_PROGRESS)
+
+        def original_finishes(_interval):
+            seed_record(
+                halo_creds_only,
+                rf,
+                data,
+                state=COMPLETE,
+                status=201,
+                content_type="application/json",
+                content=b'{"ticket": {"id": 1}}',
+            )
+
+        with mock.patch("zendesk_api_proxy.idempotency.time.sleep", side_effect=original_finishes):
+            response = post_ticket(data)
+
+        mock_make_halo_request.assert_not_called()
+        assert response.status_code == HTTPStatus.CREATED
+        assert response.json() == {"ticket": {"id": 1}}
+
+    def test_duplicate_gives_up_waiting(
+        self,
+        mock_make_halo_request: MagicMock,
+        _mock_authenticate,
+        halo_creds_only,
+        post_ticket,
+        rf,
+        settings,
+    ):
+        settings.IDEMPOTENCY_WAIT_TIMEOUT = 0
+        data = {"ticket": {"subject": "Help"}}
+        seed_record(halo_creds_only, rf, data, state=IN_PROGRESS)
+
+        response = post_ticket(data)
+
+        mock_make_halo_request.assert_not_called()
+        assert response.status_code == HTTPStatus.CONFLICT
+
+
+@pytest.fixture()
+def unavailable_coordination_cache():
+    cache = TwoTierCache("redis://redis.invalid:6379", {"OPTIONS": {"LOCAL_MAX_ENTRIES": 0}})
+    cache.remote = MagicMock()
+    cache.remote.add.side_effect = RedisConnectionError("down")
+    cache.remote.get.side_effect = RedisConnectionError("down")
+    with mock.patch("zendesk_api_proxy.idempotency.caches", {settings.COORDINATION_CACHE: cache}):
+        yield cache
+
+
+@mock.patch("halo.halo_manager.HaloAPIClient._HaloAPIClient__authenticate", return_value="abc123")
+@mock.patch("zendesk_api_proxy.middleware.ZendeskAPIProxyMiddleware.make_halo_request")
+class TestCoordinationCacheUnavailable:
+    def test_request_handled_without_idempotency(
+        self,
+        mock_make_halo_request: MagicMock,
+        _mock_authenticate,
+        halo_creds_only,
+        post_ticket,
+        unavailable_coordination_cache,
+    ):
+        mock_make_halo_request.return_value = JsonResponse({"ticket": {"id": 1}}, status=201)
+
+        with mock.patch("zendesk_api_proxy.idempotency.time.sleep") as mock_sleep:
+            response = post_ticket({"ticket": {"subject": "Help"}})
+
+        assert response.status_code == HTTPStatus.CREATED
+        mock_make_halo_request.assert_called_once()
+        mock_sleep.assert_not_called()
+
+    def test_gives_up_if_neither_claimed_nor_recorded(
+        self,
+        mock_make_halo_request: MagicMock,
+        _mock_authenticate,
+        halo_creds_only,
+        post_ticket,
+        settings,
+    ):
+        settings.IDEMPOTENCY_WAIT_TIMEOUT = 0.3
+        cache = MagicMock()
+        cache.add.return_value = False
+        cache.get.return_value = None
+
+        with mock.patch(
+            "zendesk_api_proxy.idempotency.caches", {settings.COORDINATION_CACHE: cache}
+        ):
+            response = post_ticket({"ticket": {"subject": "Help"}})
+
+        mock_make_halo_request.assert_not_called()
+        assert response.status_code == HTTPStatus.SERVICE_UNAVAILABLE
+        # Waited between attempts rather than spinning
+        assert 2 <= cache.add.call_count <= 5
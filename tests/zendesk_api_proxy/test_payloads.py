@@ -0,0 +1,120 @@
+import datetime
+import decimal
+from http import HTTPStatus
+from unittest import mock
+
+import orjson
+from django.http import HttpRequest, HttpResponse
+from rest_framework.exceptions import ErrorDetail
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from zendesk_api_proxy.middleware import ZendeskAPIProxyMiddleware
+from zendesk_api_proxy.payloads import ParsedPayloads
+
+from help_desk_api.parsers import ORJSONParser
+from help_desk_api.renderers import ORJSONRenderer
+from help_desk_api.views import SingleTicketView
+
+
+class TestParsedPayloads:
+    def test_response_parsed_once(self, zendesk_create_ticket_response: HttpResponse, rf):
+        payloads = ParsedPayloads(rf.get("/"))
+
+        with mock.patch(
+            "zendesk_api_proxy.payloads.orjson.loads", wraps=orjson.loads
+        ) as mock_loads:
+            first = payloads.response_json(zendesk_create_ticket_response)
+            second = payloads.response_json(zendesk_create_ticket_response)
+
+        assert first is second
+        mock_loads.assert_called_once()
+
+    def test_missing_response_gives_default(self, rf):
+        payloads = ParsedPayloads(rf.get("/"))
+
+        assert payloads.response_json(None, {}) == {}
+        assert payloads.response_text(None) is None
+
+    def test_shared_across_request(self, rf):
+        request = rf.get("/")
+
+        assert ParsedPayloads.for_request(request) is ParsedPayloads.for_request(request)
+
+    @mock.patch("zendesk_api_proxy.middleware.ZendeskAPIProxyMiddleware.make_zendesk_request")
+    @mock.patch("zendesk_api_proxy.middleware.ZendeskAPIProxyMiddleware.make_halo_request")
+    def test_dual_running_parses_each_body_once(
+        self,
+        make_halo_request: mock.MagicMock,
+        make_zendesk_request: mock.MagicMock,
+        zendesk_and_halo_creds,
+        zendesk_create_ticket_request: HttpRequest,
+        zendesk_create_ticket_response: HttpResponse,
+        halo_create_ticket_response: HttpResponse,
+    ):
+        make_zendesk_request.return_value = zendesk_create_ticket_response
+        make_halo_request.return_value = halo_create_ticket_response
+        middleware = ZendeskAPIProxyMiddleware(mock.MagicMock())
+
+        with mock.patch(
+            "zendesk_api_proxy.payloads.orjson.loads", wraps=orjson.loads
+        ) as mock_loads:
+            middleware(zendesk_create_ticket_request)
+
+        parsed = [call.args[0] for call in mock_loads.call_args_list]
+        assert sorted(parsed) == sorted(
+            [zendesk_create_ticket_response.content, halo_create_ticket_response.content]
+        )
+
+
+class TestORJSONCodec:
+    def test_renderer_matches_json_renderer(self):
+        data = {
+            "id": 1,
+            "created_at": datetime.datetime(2024, 1, 1, 10, 0, 0, 123456, tzinfo=datetime.UTC),
+            "price": decimal.Decimal("1.50"),
+            "subject": "Line\u2028separator and caf\u00e9",
+        }
+
+        assert orjson.loads(ORJSONRenderer().render(data)) == orjson.loads(
+            JSONRenderer().render(data)
+        )
+        assert b"\\u2028" in ORJSONRenderer().render(data)
+
+    def test_renders_error_details(self):
+        data = {"detail": ErrorDetail('Method "DELETE" not allowed.', code="method_not_allowed")}
+
+        assert orjson.loads(ORJSONRenderer().render(data)) == {
+            "detail": 'Method "DELETE" not allowed.'
+        }
+
+    @mock.patch(
+        "halo.halo_manager.HaloAPIClient._HaloAPIClient__authenticate", return_value="abc123"
+    )
+    def test_error_response_rendered(
+        self, _mock_authenticate, halo_creds_only, zendesk_authorization_header
+    ):
+        request = APIRequestFactory().delete(
+            "/api/v2/tickets/1.json", HTTP_AUTHORIZATION=zendesk_authorization_header
+        )
+        request.help_desk_creds = halo_creds_only
+
+        response = SingleTicketView.as_view()(request, id=1).render()
+
+        assert response.status_code == HTTPStatus.METHOD_NOT_ALLOWED
+        assert orjson.loads(response.content) == {"detail": 'Method "DELETE" not allowed.'}
+
+    def test_parser_reuses_middleware_parse(self, rf):
+        django_request = rf.post("/", data={"ticket": {"id": 1}}, content_type="application/json")
+        payloads = ParsedPayloads.for_request(django_request)
+        request = Request(django_request, parsers=[ORJSONParser()])
+
+        with mock.patch(
+            "zendesk_api_proxy.payloads.orjson.loads", wraps=orjson.loads
+        ) as mock_loads:
+            assert request.data == {"ticket": {"id": 1}}
+            assert payloads.request_json == {"ticket": {"id": 1}}
+
+        mock_loads.assert_called_once()
+        request.data["zendesk_ticket_id"] = 123
+        assert "zendesk_ticket_id" not in payloads.request_json
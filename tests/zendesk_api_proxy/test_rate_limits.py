@@ -0,0 +1,131 @@
+from http import HTTPStatus
+from unittest import mock
+from unittest.mock import MagicMock
+
+import pytest
+from django.conf import settings
+from django.core.cache import caches
+from django.http import JsonResponse
+from django.urls import reverse
+from zendesk_api_proxy.rate_limits import (
+    IN_FLIGHT_TIMEOUT,
+    CredentialLimits,
+    in_flight_cache_key,
+)
+
+
+@pytest.fixture()
+def clock():
+    with mock.patch("zendesk_api_proxy.rate_limits.time.time", return_value=1_000_000.0) as clock:
+        yield clock
+
+
+class TestRateLimit:
+    def test_no_limit_by_default(self, halo_creds_only):
+        for _ in range(100):
+            assert CredentialLimits(halo_creds_only).acquire() is None
+
+    def test_burst_then_limited(self, halo_creds_only, clock):
+        halo_creds_only.rate_limit = 60
+        halo_creds_only.rate_limit_burst = 2
+
+        assert CredentialLimits(halo_creds_only).acquire() is None
+        assert CredentialLimits(halo_creds_only).acquire() is None
+        response = CredentialLimits(halo_creds_only).acquire()
+
+        assert response.status_code == HTTPStatus.TOO_MANY_REQUESTS
+        assert response.headers["Retry-After"] == "1"
+
+    def test_tokens_refill(self, halo_creds_only, clock):
+        halo_creds_only.rate_limit = 60
+
+        for _ in range(60):
+            assert CredentialLimits(halo_creds_only).acquire() is None
+        assert CredentialLimits(halo_creds_only).acquire() is not None
+
+        clock.return_value += 1
+        assert CredentialLimits(halo_creds_only).acquire() is None
+        assert CredentialLimits(halo_creds_only).acquire() is not None
+
+    def test_refused_requests_use_no_tokens(self, halo_creds_only, clock):
+        halo_creds_only.rate_limit = 60
+        halo_creds_only.rate_limit_burst = 1
+        CredentialLimits(halo_creds_only).acquire()
+
+        for _ in range(10):
+            assert CredentialLimits(halo_creds_only).acquire() is not None
+        clock.return_value += 1
+
+        assert CredentialLimits(halo_creds_only).acquire() is None
+
+
+class TestConcurrencyLimit:
+    def test_slots_are_released(self, halo_creds_only):
+        halo_creds_only.max_concurrent_requests = 1
+        first = CredentialLimits(halo_creds_only)
+
+        assert first.acquire() is None
+        response = CredentialLimits(halo_creds_only).acquire()
+        first.release()
+
+        assert response.status_code == HTTPStatus.TOO_MANY_REQUESTS
+        assert CredentialLimits(halo_creds_only).acquire() is None
+
+    def test_leaked_slot_expires_while_requests_continue(self, halo_creds_only):
+        halo_creds_only.max_concurrent_requests = 2
+        with mock.patch("time.time", return_value=1_000_000.0) as clock:
+            # Never released, as if its worker died
+            assert CredentialLimits(halo_creds_only).acquire() is None
+
+            for _ in range(IN_FLIGHT_TIMEOUT // 60 + 1):
+                clock.return_value += 60
+                limits = CredentialLimits(halo_creds_only)
+                assert limits.acquire() is None
+                limits.release()
+
+            assert CredentialLimits(halo_creds_only).acquire() is None
+            assert CredentialLimits(halo_creds_only).acquire() is None
+
+
+@mock.patch("halo.halo_manager.HaloAPIClient._HaloAPIClient__authenticate", return_value="abc123")
+@mock.patch("zendesk_api_proxy.middleware.ZendeskAPIProxyMiddleware.make_halo_request")
+class TestMiddlewareLimits:
+    def test_over_rate_limit(
+        self,
+        mock_make_halo_request: MagicMock,
+        _mock_authenticate,
+        halo_creds_only,
+        zendesk_authorization_header,
+        client,
+    ):
+        halo_creds_only.rate_limit = 1
+        halo_creds_only.save()
+        mock_make_halo_request.return_value = JsonResponse({"ticket": {"id": 1}})
+        url = reverse("api:ticket", kwargs={"id": 1})
+
+        allowed = client.get(url, headers={"Authorization": zendesk_authorization_header})
+        limited = client.get(url, headers={"Authorization": zendesk_authorization_header})
+
+        assert allowed.status_code == HTTPStatus.OK
+        assert limited.status_code == HTTPStatus.TOO_MANY_REQUESTS
+        assert int(limited.headers["Retry-After"]) > 0
+        assert limited.json()["error"] == "APIRateLimitExceeded"
+        mock_make_halo_request.assert_called_once()
+
+    def test_slot_released_after_error(
+        self,
+        mock_make_halo_request: MagicMock,
+        _mock_authenticate,
+        halo_creds_only,
+        zendesk_authorization_header,
+        client,
+    ):
+        halo_creds_only.max_concurrent_requests = 1
+        halo_creds_only.save()
+        mock_make_halo_request.side_effect = Exception("Halo is down")
+        url = reverse("api:ticket", kwargs={"id": 1})
+
+        client.get(url, headers={"Authorization": zendesk_authorization_header})
+
+        in_flight = caches[settings.COORDINATION_CACHE].get(in_flight_cache_key(halo_creds_only, 0))
+        assert in_flight is None
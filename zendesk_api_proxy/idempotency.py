@@ -0,0 +1,129 @@
+import hashlib
+import logging
+import time
+from http import HTTPStatus
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse, JsonResponse
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_KEY_HEADER = "Idempotency-Key"
+IDEMPOTENT_METHODS = ("POST", "PUT")
+
+IN_PROGRESS = "in_progress"
+COMPLETE = "complete"
+
+# How often a duplicate checks whether the original request has finished
+WAIT_INTERVAL = 0.1  # seconds
+# Longer than any request runs, so a claim only expires if its process died
+IN_PROGRESS_TIMEOUT = 5 * 60  # seconds
+
+
+def idempotency_cache_key(help_desk_creds, idempotency_key):
+    return f"idempotency:{help_desk_creds.pk}:{idempotency_key}"
+
+
+def request_fingerprint(request):
+    fingerprint = hashlib.sha256()
+    for part in (request.method, request.get_full_path()):
+        fingerprint.update(part.encode("utf-8"))
+        fingerprint.update(b"\0")
+    fingerprint.update(request.body)
+    return fingerprint.hexdigest()
+
+
+class IdempotentRequest:
+    """
+    A request sent with an Idempotency-Key header, e.g. a retried ticket creation.
+
+    The first request with a key is handled as usual and its response stored;
+    a retry with the same key gets the stored response without anything being sent
+    to Zendesk or Halo, and one arriving while the first is still being handled
+    waits for it to finish. Server errors aren't stored, so they can be retried.
+    """
+
+    def __init__(self, request, help_desk_creds, idempotency_key):
+        self.cache = caches[settings.COORDINATION_CACHE]
+        self.cache_key = idempotency_cache_key(help_desk_creds, idempotency_key)
+        self.fingerprint = request_fingerprint(request)
+
+    @classmethod
+    def from_request(cls, request, help_desk_creds):
+        idempotency_key = request.headers.get(IDEMPOTENCY_KEY_HEADER, None)
+        if not idempotency_key or request.method.upper() not in IDEMPOTENT_METHODS:
+            return None
+        return cls(request, help_desk_creds, idempotency_key)
+
+    def respond(self, get_response):
+        deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_TIMEOUT
+        while True:
+            if self.claim():
+                return self.handle(get_response)
+            if not getattr(self.cache, "available", True):
+                # Better a possible duplicate than refusing every POST while Redis is down
+                logger.warning(f"Coordination cache unavailable, not checking {self.cache_key}")
+                return get_response()
+            record = self.cache.get(self.cache_key, None)
+            if record is not None:
+                if record["fingerprint"] != self.fingerprint:
+                    return JsonResponse(
+                        {"error": "Idempotency-Key has already been used for a different request"},
+                        status=HTTPStatus.UNPROCESSABLE_ENTITY,
+                    )
+                if record["state"] == COMPLETE:
+                    return self.replay(record)
+            # Otherwise the original failed, so this one can go ahead in its place next time
+            if time.monotonic() >= deadline:
+                if record is None:
+                    # Neither claimed nor recorded, so the cache isn't working
+                    return JsonResponse(
+                        {"error": "Idempotency-Key could not be checked"},
+                        status=HTTPStatus.SERVICE_UNAVAILABLE,
+                    )
+                return JsonResponse(
+                    {"error": "A request with this Idempotency-Key is still being handled"},
+                    status=HTTPStatus.CONFLICT,
+                )
+            time.sleep(WAIT_INTERVAL)
+
+    def claim(self):
+        return self.cache.add(
+            self.cache_key,
+            {"state": IN_PROGRESS, "fingerprint": self.fingerprint},
+            timeout=IN_PROGRESS_TIMEOUT,
+        )
+
+    def handle(self, get_response):
+        try:
+            response = get_response()
+        except Exception:
+            self.cache.delete(self.cache_key)
+            raise
+        self.store(response)
+        return response
+
+    def store(self, response):
+        if response is None or response.status_code >= HTTPStatus.INTERNAL_SERVER_ERROR:
+            self.cache.delete(self.cache_key)
+            return
+        self.cache.set(
+            self.cache_key,
+            {
+                "state": COMPLETE,
+                "fingerprint": self.fingerprint,
+                "status": response.status_code,
+                "content_type": response.headers.get("Content-Type", "application/json"),
+                "content": response.content,
+            },
+            timeout=settings.IDEMPOTENCY_KEY_TIMEOUT,
+        )
+
+    def replay(self, record):
+        logger.info(f"Replaying stored response for {self.cache_key}")
+        return HttpResponse(
+            record["content"],
+            status=record["status"],
+            headers={"Content-Type": record["content_type"], "Idempotent-Replayed": "true"},
+        )
@@ -1,27 +1,44 @@
 import base64
 import inspect
-import json
 import logging
 import sys
 import traceback
 from http import HTTPStatus
 
+import orjson
 import requests
 import sentry_sdk
 from django.conf import settings
 from django.contrib.auth.hashers import check_password
 from django.core.cache import caches
-from django.core.serializers.json import DjangoJSONEncoder
 from django.http import HttpRequest, HttpResponse, JsonResponse
-from django.urls import ResolverMatch, resolve
+from django.urls import Resolver404, ResolverMatch, resolve
 from rest_framework.exceptions import AuthenticationFailed, NotAuthenticated
 from rest_framework.views import APIView
 from sentry_sdk import set_level
+from zendesk_api_proxy.idempotency import IdempotentRequest
+from zendesk_api_proxy.payloads import ParsedPayloads
+from zendesk_api_proxy.rate_limits import CredentialLimits
 
 # Needed for inspect
 from help_desk_api import views  # noqa F401
+from help_desk_api.circuit_breaker import (
+    CircuitOpenException,
+    halo_breaker,
+    zendesk_breaker,
+)
+from help_desk_api.deadlines import (
+    DeadlineExceeded,
+    deadline,
+    deadline_for,
+    deadline_share,
+    upstream_timeout,
+)
+from help_desk_api.metrics import Counter
 from help_desk_api.models import HelpDeskCreds
+from help_desk_api.outbound_budget import INTERACTIVE, outbound_priority, zendesk_budget
 from help_desk_api.serializers import ZendeskFieldsNotSupportedException
+from help_desk_api.single_flight import SingleFlight
 from help_desk_api.urls import urlpatterns as api_url_patterns
 from help_desk_api.utils import get_zenpy_request_vars
 
@@ -30,6 +47,41 @@ logger.setLevel("DEBUG")
 
 set_level("info")
 
+# Identical concurrent GETs share one Zendesk request;
+# nothing changes the response once it's read, so it needn't be copied
+zendesk_reads = SingleFlight("zendesk_get", share=lambda response: response)
+
+# Halo requests not made when dual-running because Halo's circuit breaker was open
+halo_legs_skipped = Counter("dual_running.halo_skipped")
+
+
+def service_unavailable_response(description):
+    """
+    As Zendesk responds when it's unavailable
+    """
+    return JsonResponse(
+        {"error": "ServiceUnavailable", "description": description},
+        status=HTTPStatus.SERVICE_UNAVAILABLE,
+        headers={"Retry-After": str(settings.CIRCUIT_BREAKER_OPEN_SECONDS)},
+    )
+
+
+def gateway_timeout_response(description):
+    """
+    As Zendesk responds when a request takes too long
+    """
+    return JsonResponse(
+        {"error": "RequestTimeout", "description": description},
+        status=HTTPStatus.GATEWAY_TIMEOUT,
+    )
+
+
+def url_name(path):
+    try:
+        return resolve(path).url_name
+    except Resolver404:
+        return None
+
 
 def get_view_class(path):
     view_class = None
@@ -60,6 +112,31 @@ def method_supported(path, method: str):
     return False
 
 
+def zendesk_request(method, url, **kwargs):
+    # Only once the breaker lets the request through does it take from the budget
+    zendesk_budget.acquire()
+    return method(url, timeout=upstream_timeout(), **kwargs)
+
+
+def zendesk_get(url, encoded_creds, content_type):
+    logger.error(f"Zendesk GET: {url}")
+    zendesk_response = zendesk_breaker.call(
+        lambda: zendesk_request(
+            requests.get,
+            url,
+            headers={
+                "Authorization": f"Basic {encoded_creds.decode('ascii')}",  # /PS-IGNORE
+                "Content-Type": content_type,
+            },
+        )
+    )
+    logger.error("Completed Zendesk GET")
+    zendesk_budget.observe(zendesk_response)
+    # Read the body now, as the response may be shared by several requests
+    zendesk_response.content
+    return zendesk_response
+
+
 def proxy_zendesk(request, subdomain, email, token, query_string):
     url = f"https://{subdomain}.zendesk.com{request.path}"
 
@@ -75,40 +152,43 @@ def proxy_zendesk(request, subdomain, email, token, query_string):
     # Make request to Zendesk API
     content_type = request.headers.get("Content-Type", default="application/json")
     if request.method == "GET":  # /PS-IGNORE
-        logger.error(f"Zendesk GET: {url}")
-        zendesk_response = requests.get(
-            url,
-            headers={
-                "Authorization": f"Basic {encoded_creds.decode('ascii')}",  # /PS-IGNORE
-                "Content-Type": content_type,
-            },
+        zendesk_response = zendesk_reads.do(
+            (email, "GET", request.path, query_string),
+            lambda: zendesk_get(url, encoded_creds, content_type),
         )
-        logger.error("Completed Zendesk GET")
     # data=request.body.decode("utf8"),
     elif request.method == "POST":
         logger.warning(f"POST: {request.body}")
         logger.warning(f"Auth: {encoded_creds.decode('ascii')}")
         logger.error(f"Zendesk POST: {url}")
-        zendesk_response = requests.post(
-            url,
-            data=request.body,
-            headers={
-                "Authorization": f"Basic {encoded_creds.decode('ascii')}",
-                "Content-Type": content_type,
-            },
+        zendesk_response = zendesk_breaker.call(
+            lambda: zendesk_request(
+                requests.post,
+                url,
+                data=request.body,
+                headers={
+                    "Authorization": f"Basic {encoded_creds.decode('ascii')}",
+                    "Content-Type": content_type,
+                },
+            )
         )
         logger.error("Completed Zendesk POST")
+        zendesk_budget.observe(zendesk_response)
     elif request.method == "PUT":
         logger.error(f"Zendesk PUT: {url}")
-        zendesk_response = requests.put(
-            url,
-            data=request.body.decode("utf8"),
-            headers={
-                "Authorization": f"Basic {encoded_creds.decode('ascii')}",
-                "Content-Type": content_type,
-            },
+        zendesk_response = zendesk_breaker.call(
+            lambda: zendesk_request(
+                requests.put,
+                url,
+                data=request.body.decode("utf8"),
+                headers={
+                    "Authorization": f"Basic {encoded_creds.decode('ascii')}",
+                    "Content-Type": content_type,
+                },
+            )
         )
         logger.error("Completed Zendesk PUT")
+        zendesk_budget.observe(zendesk_response)
 
     return zendesk_response
 
@@ -122,14 +202,10 @@ class ZendeskAPIProxyMiddleware:
     def __init__(self, get_response):
         self.get_response = get_response
 
-    def __call__(self, request):  # noqa: C901
-        try:
-            request_body = request.body.decode("utf-8")
-        except Exception as exp:
-            sentry_sdk.capture_exception(exp)
-            request_body = request.body
+    def __call__(self, request):
+        payloads = ParsedPayloads.for_request(request)
 
-        logger.info(f"Help Desk Service request received, body: {request_body}")
+        logger.info(f"Help Desk Service request received, body: {payloads.request_text}")
 
         try:
             help_desk_creds, token = self.get_authentication_values(request)
@@ -144,6 +220,24 @@ class ZendeskAPIProxyMiddleware:
             f"for zendesk_email: {help_desk_creds.zendesk_email}"
         )
 
+        limits = CredentialLimits(help_desk_creds)
+        if too_many_requests := limits.acquire():
+            logger.warning(f"HelpDeskCreds: {help_desk_creds.pk} over limit")
+            return too_many_requests
+        try:
+            # Upstream requests made for callers go ahead of background jobs
+            with outbound_priority(INTERACTIVE), deadline(deadline_for(url_name(request.path))):
+                idempotent_request = IdempotentRequest.from_request(request, help_desk_creds)
+                if idempotent_request is None:
+                    return self.proxy_request(request, help_desk_creds, token)
+                return idempotent_request.respond(
+                    lambda: self.proxy_request(request, help_desk_creds, token)
+                )
+        finally:
+            limits.release()
+
+    def proxy_request(self, request, help_desk_creds, token):  # noqa: C901
+        payloads = ParsedPayloads.for_request(request)
         zendesk_response = None
         django_response = None
 
@@ -153,47 +247,26 @@ class ZendeskAPIProxyMiddleware:
             f"Supported endpoint {request.path}: {'true' if supported_endpoint else 'false'}"
         )
 
+        dual_running = (
+            HelpDeskCreds.HelpDeskChoices.ZENDESK in help_desk_creds.help_desk
+            and HelpDeskCreds.HelpDeskChoices.HALO in help_desk_creds.help_desk
+        )
         if HelpDeskCreds.HelpDeskChoices.ZENDESK in help_desk_creds.help_desk:
             logger.info("Making Zendesk request")
-            zendesk_response = self.make_zendesk_request(
-                help_desk_creds, request, token, supported_endpoint
-            )
+            # Leave the Halo leg its share of the deadline
+            with deadline_share(settings.ZENDESK_DEADLINE_SHARE if dual_running else 1):
+                zendesk_response = self.make_zendesk_request(
+                    help_desk_creds, request, token, supported_endpoint
+                )
 
         if HelpDeskCreds.HelpDeskChoices.HALO in help_desk_creds.help_desk:
-            try:
-                """
-                We wrap this in try-catch so we can prevent any Halo errors
-                getting back to the requester when dual-running, as only
-                Zendesk errors should be returned to them.
-                The whole idea of dual-running is that if
-                Zendesk succeeds but Halo fails, Zendesk wins.
-                """
-                logger.info("Making Halo request")  # /PS-IGNORE
-                # Need to pass Zendesk ticket ID, if any
-                zendesk_response_json = self.get_json_response(zendesk_response, {})
-                zendesk_ticket = zendesk_response_json.get("ticket", {})
-                zendesk_ticket_id = zendesk_ticket.get("id", None)
-                setattr(request, "zendesk_ticket_id", zendesk_ticket_id)
-                try:
-                    django_response = self.make_halo_request(
-                        help_desk_creds, request, supported_endpoint
-                    )
-                except ZendeskFieldsNotSupportedException as exp:
-                    sentry_sdk.capture_exception(exp)
-                    django_response = JsonResponse(
-                        {"error": f"Incorrect payload: {exp}"}, status=HTTPStatus.BAD_REQUEST
-                    )
-            except Exception as exp:
-                """
-                We catch Exception as this needs to be as broad as possible,
-                to prevent Halo errors getting back when Zendesk is enabled.
-                """
-                sentry_sdk.capture_exception(exp)
-                django_response = JsonResponse(
-                    {
-                        "error": str(exp),
-                    },
-                    status=HTTPStatus.INTERNAL_SERVER_ERROR,
+            if dual_running and halo_breaker.is_open():
+                # Zendesk wins anyway, so don't keep the requester waiting on Halo
+                logger.warning(f"Halo is unavailable; not making Halo request for {request.path}")
+                halo_legs_skipped.increment()
+            else:
+                django_response = self.make_halo_leg(
+                    request, help_desk_creds, zendesk_response, supported_endpoint
                 )
         # If this is /api/v2/users/create_or_update,
         # we need to save the Zendesk request data under the user ID
@@ -224,14 +297,51 @@ class ZendeskAPIProxyMiddleware:
                 django_response,
                 {"cache_name": settings.UPLOAD_DATA_CACHE, "datum_keys": ("upload", "token")},
             )
-        logger.warning(
-            f"Zendesk response: {zendesk_response.content.decode('utf-8') if zendesk_response else None}"  # noqa:E501
-        )
-        logger.warning(
-            f"Halo response: {django_response.content.decode('utf-8') if django_response else None}"
-        )
+        logger.warning(f"Zendesk response: {payloads.response_text(zendesk_response)}")
+        logger.warning(f"Halo response: {payloads.response_text(django_response)}")
         return zendesk_response or django_response
 
+    def make_halo_leg(self, request, help_desk_creds, zendesk_response, supported_endpoint):
+        try:
+            """
+            We wrap this in try-catch so we can prevent any Halo errors
+            getting back to the requester when dual-running, as only
+            Zendesk errors should be returned to them.
+            The whole idea of dual-running is that if
+            Zendesk succeeds but Halo fails, Zendesk wins.
+            """
+            logger.info("Making Halo request")  # /PS-IGNORE
+            # Need to pass Zendesk ticket ID, if any
+            zendesk_response_json = self.get_json_response(request, zendesk_response, {})
+            zendesk_ticket = zendesk_response_json.get("ticket", {})
+            zendesk_ticket_id = zendesk_ticket.get("id", None)
+            setattr(request, "zendesk_ticket_id", zendesk_ticket_id)
+            try:
+                return self.make_halo_request(help_desk_creds, request, supported_endpoint)
+            except ZendeskFieldsNotSupportedException as exp:
+                sentry_sdk.capture_exception(exp)
+                return JsonResponse(
+                    {"error": f"Incorrect payload: {exp}"}, status=HTTPStatus.BAD_REQUEST
+                )
+        except CircuitOpenException as exp:
+            logger.warning(f"Halo request refused: {exp}")
+            return service_unavailable_response(str(exp))
+        except (DeadlineExceeded, requests.Timeout) as exp:
+            logger.warning(f"Halo request timed out: {exp}")
+            return gateway_timeout_response(str(exp))
+        except Exception as exp:
+            """
+            We catch Exception as this needs to be as broad as possible,
+            to prevent Halo errors getting back when Zendesk is enabled.
+            """
+            sentry_sdk.capture_exception(exp)
+            return JsonResponse(
+                {
+                    "error": str(exp),
+                },
+                status=HTTPStatus.INTERNAL_SERVER_ERROR,
+            )
+
     def get_authentication_values(self, request):
         # Get out of proxy logic if there's an issue with the token
         # get_zenpy_request_vars raises NotAuthenticated
@@ -275,7 +385,7 @@ class ZendeskAPIProxyMiddleware:
         and which the requester then sent back in the create_ticket request.
         """
         halo_response_json, zendesk_response_json = self.get_json_responses(
-            halo_response, zendesk_response
+            request, halo_response, zendesk_response
         )
         logger.info(
             f"Cacheing {cache_config['datum_keys']} with services: {help_desk_creds.help_desk}"
@@ -293,7 +403,7 @@ class ZendeskAPIProxyMiddleware:
         if cache is not None:
             # This conditional is a bit of a code smell :-/
             if cache_name == settings.USER_DATA_CACHE:
-                request_data = json.loads(request.body.decode("utf-8"))
+                request_data = ParsedPayloads.for_request(request).request_json
                 logger.info(
                     f"Cacheing {cache_config['datum_keys']} "
                     f"with key: {cache_key} data: {request_data}"
@@ -332,15 +442,21 @@ class ZendeskAPIProxyMiddleware:
         return cache_key
 
     def get_cache_key(self, response_json, datum_keys=("user", "id")):
+        if not isinstance(response_json, dict):
+            # e.g. an error message
+            return None
         datum = response_json.get(datum_keys[0], {})
         cache_key = datum.get(datum_keys[1], None)
         return cache_key
 
-    def get_json_responses(self, halo_response, zendesk_response):
-        return self.get_json_response(halo_response), self.get_json_response(zendesk_response)
+    def get_json_responses(self, request, halo_response, zendesk_response):
+        return (
+            self.get_json_response(request, halo_response),
+            self.get_json_response(request, zendesk_response),
+        )
 
-    def get_json_response(self, response, default=None):
-        return json.loads(response.content.decode("utf-8")) if response else default
+    def get_json_response(self, request, response, default=None):
+        return ParsedPayloads.for_request(request).response_json(response, default)
 
     def make_halo_request(self, help_desk_creds, request, supported_endpoint):
         django_response = None
@@ -359,30 +475,46 @@ class ZendeskAPIProxyMiddleware:
         # Don't need to call the below in Halo because error will be raised anyway
         if not supported_endpoint:
             logger.warning(f"{request.path} is not supported by this service")
-        proxy_response = proxy_zendesk(
-            request,
-            help_desk_creds.zendesk_subdomain,
-            help_desk_creds.zendesk_email,
-            token,
-            request.GET.urlencode(),
-        )
+        try:
+            proxy_response = proxy_zendesk(
+                request,
+                help_desk_creds.zendesk_subdomain,
+                help_desk_creds.zendesk_email,
+                token,
+                request.GET.urlencode(),
+            )
+        except CircuitOpenException as exp:
+            logger.warning(f"Zendesk request refused: {exp}")
+            return service_unavailable_response(str(exp))
+        except (DeadlineExceeded, requests.Timeout) as exp:
+            logger.warning(f"Zendesk request timed out: {exp}")
+            return gateway_timeout_response(str(exp))
         logger.info(
             f"""
         proxy_zendesk response status: {proxy_response.status_code}
          with body: {proxy_response.content}
         """
         )
+        # Parse to be sure Zendesk sent JSON, but pass its bytes on rather than re-encoding them
+        zendesk_response_json = orjson.loads(proxy_response.content)
         zendesk_response = HttpResponse(
-            json.dumps(proxy_response.json(), cls=DjangoJSONEncoder),
+            proxy_response.content,
             headers={
                 "Content-Type": "application/json",
             },
             status=proxy_response.status_code,
         )
+        ParsedPayloads.for_request(request).remember_response_json(
+            zendesk_response, zendesk_response_json
+        )
 
         return zendesk_response
 
     def process_exception(self, request: HttpRequest, exception):
+        if isinstance(exception, CircuitOpenException):
+            return service_unavailable_response(str(exception))
+        if isinstance(exception, (DeadlineExceeded, requests.Timeout)):
+            return gateway_timeout_response(str(exception))
         if request.content_type != "application/json":
             return None
         response_content = {
@@ -0,0 +1,65 @@
+import orjson
+import sentry_sdk
+
+
+class ParsedPayloads:
+    """
+    Request-scoped memo of the request and response bodies.
+    Dual-running looks at the same bodies several times
+    (the Halo leg, the cache writers and the loggers),
+    so each one is decoded and parsed at most once and the result shared.
+    """
+
+    def __init__(self, request):
+        self.request = request
+        self._request_text = None
+        self._request_json = None
+        # Keyed by id(), holding on to the response so the id can't be reused
+        self._responses = {}
+
+    @classmethod
+    def for_request(cls, request):
+        payloads = getattr(request, "payloads", None)
+        if payloads is None:
+            payloads = cls(request)
+            setattr(request, "payloads", payloads)
+        return payloads
+
+    @property
+    def request_text(self):
+        if self._request_text is None:
+            try:
+                self._request_text = self.request.body.decode("utf-8")
+            except Exception as exp:
+                sentry_sdk.capture_exception(exp)
+                self._request_text = self.request.body
+        return self._request_text
+
+    @property
+    def request_json(self):
+        if self._request_json is None:
+            self._request_json = orjson.loads(self.request.body)
+        return self._request_json
+
+    def remember_response_json(self, response, response_json):
+        self._response_memo(response)["json"] = response_json
+
+    def response_text(self, response):
+        if not response:
+            return None
+        memo = self._response_memo(response)
+        if "text" not in memo:
+            memo["text"] = response.content.decode("utf-8")
+        return memo["text"]
+
+    def response_json(self, response, default=None):
+        if not response:
+            return default
+        memo = self._response_memo(response)
+        if "json" not in memo:
+            memo["json"] = orjson.loads(response.content)
+        return memo["json"]
+
+    def _response_memo(self, response):
+        _, memo = self._responses.setdefault(id(response), (response, {}))
+        return memo
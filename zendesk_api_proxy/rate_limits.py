@@ -0,0 +1,132 @@
+"""
+Per-credential limits on inbound requests, so one misbehaving integration
+can't take all the workers or the shared Halo quota.
+
+The rate limit is a token bucket: `rate_limit` requests a minute,
+with up to `rate_limit_burst` at once after a quiet spell.
+It's kept as a theoretical arrival time (the generic cell rate algorithm)
+in one counter in the coordination cache, so that every worker shares it
+and taking a token is a single atomic increment.
+
+The concurrency limit is `max_concurrent_requests` slots, each a key in the
+coordination cache that a request adds while it's in progress and deletes when
+it's finished. Each slot expires on its own, so one left behind by a worker that died
+is freed after IN_FLIGHT_TIMEOUT however busy its credentials are.
+"""
+
+import logging
+import math
+import time
+from http import HTTPStatus
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import JsonResponse
+
+from help_desk_api.metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+# Concurrency slots are freed after this long, so one left behind by a worker
+# that died doesn't block its credentials for ever
+IN_FLIGHT_TIMEOUT = 5 * 60  # seconds
+
+rate_limited = Counter("rate_limits.rate_limited")
+concurrency_limited = Counter("rate_limits.concurrency_limited")
+
+
+def rate_limit_cache_key(help_desk_creds):
+    return f"rate_limit:{help_desk_creds.pk}"
+
+
+def in_flight_cache_key(help_desk_creds, slot):
+    return f"in_flight:{help_desk_creds.pk}:{slot}"
+
+
+def too_many_requests_response(retry_after, description):
+    """
+    As Zendesk responds when its rate limit is exceeded
+    """
+    return JsonResponse(
+        {"error": "APIRateLimitExceeded", "description": description},
+        status=HTTPStatus.TOO_MANY_REQUESTS,
+        headers={"Retry-After": str(retry_after)},
+    )
+
+
+class CredentialLimits:
+    def __init__(self, help_desk_creds):
+        self.help_desk_creds = help_desk_creds
+        self.cache = caches[settings.COORDINATION_CACHE]
+        self.slot_key = None
+
+    def acquire(self):
+        """
+        :returns: A 429 response if the request is over a limit, otherwise None,
+            in which case `release` must be called when the request is finished.
+        """
+        retry_after = self.take_token()
+        if retry_after:
+            rate_limited.increment()
+            return too_many_requests_response(
+                retry_after, "Number of allowed API requests per minute exceeded"
+            )
+        if not self.take_slot():
+            concurrency_limited.increment()
+            return too_many_requests_response(1, "Too many API requests in progress")
+        return None
+
+    def release(self):
+        if self.slot_key is not None:
+            self.cache.delete(self.slot_key)
+            self.slot_key = None
+
+    def take_token(self):
+        """
+        :returns: 0 if a token was taken, otherwise the seconds until one will be available
+        """
+        rate_limit = self.help_desk_creds.rate_limit
+        if not rate_limit:
+            return 0
+        burst = self.help_desk_creds.rate_limit_burst or rate_limit
+        interval = math.ceil(60_000 / rate_limit)  # milliseconds per token
+        tolerance = interval * (burst - 1)
+        now = int(time.time() * 1000)
+        key = rate_limit_cache_key(self.help_desk_creds)
+        try:
+            self.cache.add(key, now, timeout=None)
+            arrival = self.cache.incr(key, interval)
+        except ValueError as exp:
+            # Better to let requests through than to refuse them all
+            logger.warning(f"Couldn't check rate limit for {key}: {exp}")
+            return 0
+        if arrival - interval < now:
+            # The bucket has been full for a while, so start again from now
+            arrival = now + interval
+            self.cache.set(key, arrival, timeout=None)
+        allowed_at = arrival - interval - tolerance
+        if allowed_at <= now:
+            return 0
+        # Give back the token we couldn't have
+        self.cache.incr(key, -interval)
+        return math.ceil((allowed_at - now) / 1000)
+
+    def take_slot(self):
+        max_concurrent_requests = self.help_desk_creds.max_concurrent_requests
+        if not max_concurrent_requests:
+            return True
+        if not getattr(self.cache, "available", True):
+            # Better to let requests through than to refuse them all
+            logger.warning(f"Couldn't check concurrency limit for {self.help_desk_creds.pk}")
+            return True
+        keys = [
+            in_flight_cache_key(self.help_desk_creds, slot)
+            for slot in range(max_concurrent_requests)
+        ]
+        in_flight = self.cache.get_many(keys)
+        for key in keys:
+            # Another request may take a free slot first
+            if key not in in_flight and self.cache.add(key, True, timeout=IN_FLIGHT_TIMEOUT):
+                self.slot_key = key
+                return True
+        return False